@@ -1,56 +1,342 @@
+import time
+
+# Used to measure how long it takes from import until the app is ready to serve
+IMPORT_STARTED = time.perf_counter()
+
 import os
 import jwt as PyJWT
 import mysql.connector
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, current_app, g, has_app_context, has_request_context, request, jsonify
 from flask_cors import CORS
-import secrets
 import datetime
+import json
+import csv
+import io
+from collections import defaultdict
 from functools import wraps
 from werkzeug.security import generate_password_hash, check_password_hash
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, _SocketIOMiddleware, join_room, leave_room
 from dotenv import load_dotenv
+from lifecycle import PollLifecycle
+from snapshots import SnapshotCache
+from query_recorder import QueryRecorder
+from db_router import READ_PRIMARY_COOKIE, READ_PRIMARY_HEADER, ReplicaRouter, parse_replica_hosts
+from vote_shards import PollVotes, ShardRoutingUnavailable, VoteShardMap, parse_shard_dsns
+from vote_archive import COLUMNS as VOTE_COLUMNS, archive_path, iter_archive_rows, read_archive
+from results_analytics import VoteFrame, VoteFrameCache
+from models import OptionCounts, Poll, PollSummary, poll_results
+from idempotency import IdempotencyStore, idempotent
+from jobs import JobRunner
+from live_updates import UpdateBroker, sse_frame
+from counter_slots import COUNTER_SLOTS_JOIN, OPTION_VOTES_SQL, CounterSlots, set_counter_slots
+from db_access import DatabaseDriver
+from share_tokens import (ShareTokenMap, canonical_share_token, format_share_token, new_share_token,
+                          parse_share_token)
+from profiler import PROFILE_TOKEN_HEADER, RequestProfiler
+from trending import TrendingPolls
+from sketches import VIEWERS, VOTER_IPS, PollSketches, merge_stored_sketch
+from fraud import DOMAIN, IP, QUARANTINE, SUBNET, FraudDetector
+from tracing import CLIENT, PRODUCER, Tracer, load_exporter
+from ballot_import import BallotImport, ChunkWriter, PollFrozen, import_format, read_rows
+from tally import (APPROVAL, BALLOT_FIELDS, MAX_OPTIONS, SINGLE, VOTING_METHODS, BallotTallyCache,
+                   ballot_positions, encode_ballot)
 
-# Load environment variables from .env file
-load_dotenv()
-
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.getenv('JWT_SECRET_KEY')  # Get secret key from environment variable
-# Configure CORS to allow requests from frontend
-CORS(app, resources={
-    r"/*": {
-        "origins": ["http://localhost:3000"],
-        "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"]
-    }
-})
-socketio = SocketIO(app, cors_allowed_origins="*")
-
-# Configure MySQL connection using environment variables
-DB_CONFIG = {
-    'host': os.getenv('DB_HOST'),
-    'user': os.getenv('DB_USER'),
-    'password': os.getenv('DB_PASSWORD'),
-    'database': os.getenv('DB_NAME'),
-    'auth_plugin': 'mysql_native_password',
-    'use_pure': True,
-    'autocommit': True
+# Routes live on a blueprint; create_app() builds the Flask app around it.
+api = Blueprint('api', __name__)
+
+# Bound to the app in create_app()
+socketio = SocketIO()
+
+# Socket.IO namespace where clients subscribe to the polls they show instead of receiving every update
+POLLS_NAMESPACE = '/polls'
+
+# Poll events for Server-Sent Events streams, fed by the same broadcasts as Socket.IO
+live_updates = UpdateBroker(history=int(os.getenv('SSE_HISTORY', 50)))
+SSE_HEARTBEAT_SECONDS = float(os.getenv('SSE_HEARTBEAT_SECONDS', 15))
+SSE_RETRY_MS = int(os.getenv('SSE_RETRY_MS', 3000))
+
+# Most share tokens accepted by one batch read or subscription
+MAX_BATCH_TOKENS = int(os.getenv('MAX_BATCH_TOKENS', 50))
+
+# Ballots written per chunk by bulk imports (one batched insert and one counter update each)
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', 1000))
+MAX_IMPORT_CHUNK_SIZE = 10000
+
+# Trending leaderboard windows in minutes, the most polls it lists, and where its counts are saved across restarts
+TRENDING_WINDOWS = [int(minutes) for minutes in os.getenv('TRENDING_WINDOWS', '5,60').split(',')]
+MAX_TRENDING = int(os.getenv('MAX_TRENDING', 50))
+TRENDING_STATE_PATH = os.getenv('TRENDING_STATE_PATH')
+TRENDING_SAVE_INTERVAL = float(os.getenv('TRENDING_SAVE_INTERVAL', 30))
+
+# Seconds between merges of this worker's viewer and voter IP sketches into poll_sketches
+SKETCH_FLUSH_INTERVAL = float(os.getenv('SKETCH_FLUSH_INTERVAL', 10))
+
+# What happens to votes the fraud check finds suspicious: 'flag' (counted and reported) or 'quarantine' (held back)
+FRAUD_ACTION = os.getenv('FRAUD_ACTION', 'flag')
+
+# MySQL connection settings, filled from the environment by load_config()
+DB_CONFIG = {}
+
+# Driver implementation, connection pooling and prepared statements (DB_DRIVER, DB_POOL_SIZE)
+db_driver = DatabaseDriver()
+
+# Statements run on nearly every request, through db_driver.execute so pooled connections
+# keep them prepared. The driver matches a prepared statement by string identity, so these
+# must stay module-level constants.
+POLL_BY_SHARE_TOKEN_SQL = """
+    SELECT p.id, p.title, p.question, p.end_date, p.user_id, p.share_token, 
+           u.username as creator_name, p.created_at, p.show_results_to_voters, p.voting_method
+    FROM polls p 
+    JOIN users u ON p.user_id = u.id
+    WHERE p.share_token = %s
+"""
+# Ballots of approval and ranked polls refer to options by their position in id order
+POLL_OPTIONS_SQL = f"""
+    SELECT o.id, o.option_text, {OPTION_VOTES_SQL}
+    FROM options o
+    {COUNTER_SLOTS_JOIN}
+    WHERE o.poll_id = %s
+    ORDER BY o.id
+"""
+# Approval polls count voters (ballots), not the approvals summed over their options
+USER_POLLS_SQL = f"""
+    SELECT p.id, p.title, p.question, p.end_date, p.share_token, p.created_at,
+           COUNT(DISTINCT o.id) as option_count,
+           CAST(CASE WHEN p.voting_method = '{APPROVAL}'
+                     THEN (SELECT COUNT(*) FROM ballots b WHERE b.poll_id = p.id)
+                     ELSE COALESCE(SUM({OPTION_VOTES_SQL}), 0)
+                END AS SIGNED) as total_votes
+    FROM polls p
+    LEFT JOIN options o ON p.id = o.poll_id
+    {COUNTER_SLOTS_JOIN}
+    WHERE p.user_id = %s
+    GROUP BY p.id, p.title, p.question, p.end_date, p.share_token, p.created_at, p.voting_method
+    ORDER BY p.created_at DESC
+"""
+VOTE_POLL_SQL = """
+    SELECT p.id, p.title, p.question, p.end_date, p.voting_method 
+    FROM polls p 
+    WHERE p.share_token = %s
+"""
+VOTER_EXISTS_SQL = """
+    SELECT id FROM votes 
+    WHERE poll_id = %s AND voter_email = %s
+"""
+OPTION_IN_POLL_SQL = """
+    SELECT id FROM options 
+    WHERE poll_id = %s AND id = %s
+"""
+INSERT_VOTE_SQL = """
+    INSERT INTO votes (poll_id, option_id, voter_name, voter_email, ip_address)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+# Counters stop once a poll's results are frozen; the closing worker's poll_results row decides
+INCREMENT_OPTION_SQL = """
+    UPDATE options 
+    SET votes = votes + 1 
+    WHERE id = %s AND NOT EXISTS (SELECT 1 FROM poll_results WHERE poll_id = %s)
+"""
+INCREMENT_SLOT_SQL = """
+    UPDATE option_vote_slots 
+    SET votes = votes + 1 
+    WHERE option_id = %s AND slot = %s AND NOT EXISTS (SELECT 1 FROM poll_results WHERE poll_id = %s)
+"""
+POLL_OPTION_IDS_SQL = """
+    SELECT id FROM options 
+    WHERE poll_id = %s 
+    ORDER BY id
+"""
+INSERT_BALLOT_SQL = """
+    INSERT INTO ballots (poll_id, ranking)
+    VALUES (%s, %s)
+"""
+INSERT_QUARANTINED_VOTE_SQL = """
+    INSERT INTO quarantined_votes (poll_id, option_id, voter_name, voter_email, ip_address, ranking, reasons)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+COUNT_VOTE_FLAGS_SQL = """
+    INSERT INTO vote_flags (poll_id, flagged, quarantined, ip, subnet, domain)
+    VALUES (%s, 1, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        flagged = flagged + 1, quarantined = quarantined + %s, ip = ip + %s, subnet = subnet + %s, domain = domain + %s
+"""
+VOTE_FLAGS_SQL = """
+    SELECT flagged, quarantined, ip, subnet, domain
+    FROM vote_flags
+    WHERE poll_id = %s
+"""
+
+# Maximum statements per route; the recorder warns (or raises in tests) when one is exceeded.
+# Closed-poll reads include freezing the results on first access. Optional steps are allowed
+# on top where they run (query_recorder.allow): ballot tallies of approval and ranked polls,
+# counter slots, vote shards, fraud flags and replica fallbacks. Idempotency-Key bookkeeping
+# runs on an unbudgeted connection.
+QUERY_BUDGETS = {
+    'api.register': 2,
+    'api.login': 1,
+    'api.get_polls': 1,
+    'api.create_poll': 2,
+    # Ownership check and five deletes, one more than before for vote_archives
+    # (databases built without ON DELETE CASCADE on it)
+    'api.delete_poll': 6,
+    'api.submit_vote': 6,
+    # Poll, options, audience sketches and flagged votes while open. The first read of a
+    # closed poll reads the poll and its stored results, then freezes them (claim, poll,
+    # options, results) before the audience and flags: three more than the original five
+    'api.get_poll_details': 8,
+    # Freezing now claims the poll_results row before counting and fills it in after,
+    # one more than the original five
+    'api.get_poll_by_share_token': 6,
+    'api.get_polls_batch': 2,
+    # Same closed-poll path as get_poll_by_share_token
+    'api.poll_events': 6,
+    'api.export_votes': 2,
+    # A few statements per chunk of imported ballots
+    'api.import_ballots': None,
+    'api.get_poll_crosstab': 2,
+    'api.get_trending_polls': 1,
+    'api.readyz': 1
 }
 
-def get_db_connection():
+# Request spans (TRACE_EXPORTER); off until an exporter is configured
+tracer = Tracer()
+
+query_recorder = QueryRecorder(QUERY_BUDGETS, mode=os.getenv('QUERY_BUDGET_MODE', 'warn'), tracer=tracer)
+
+# Read-only routes that may be served from a replica (DB_REPLICA_HOSTS); everything else uses the primary
+READ_REPLICA_ROUTES = {
+    'api.get_polls',
+    'api.get_poll_details',
+    'api.get_poll_by_share_token',
+    'api.get_polls_batch',
+    'api.poll_events',
+    'api.export_votes',
+    'api.get_poll_crosstab',
+    'api.get_trending_polls'
+}
+
+db_router = ReplicaRouter(lambda **config: mysql.connector.connect(**config), READ_REPLICA_ROUTES)
+
+def load_vote_shard_routes():
+    """Load the vote_shards routing table: the shard of every poll created since sharding was enabled."""
+    # Like the replica lag probe this is a periodic cache refresh, so it bypasses the query recorder
+    connection = mysql.connector.connect(**DB_CONFIG)
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT poll_id, shard, moving_to FROM vote_shards")
+        return {poll_id: (shard, moving_to) for poll_id, shard, moving_to in cursor.fetchall()}
+    finally:
+        cursor.close()
+        connection.close()
+
+# Vote shards (VOTE_SHARDS); when unset every vote stays in the main database
+vote_shard_map = VoteShardMap(load=load_vote_shard_routes)
+
+def load_counter_slots():
+    """Load the poll_counter_slots table: polls whose option counters are spread over several rows."""
+    # A periodic cache refresh like load_vote_shard_routes, so it bypasses the query recorder
+    connection = mysql.connector.connect(**DB_CONFIG)
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT poll_id, slots FROM poll_counter_slots")
+        return dict(cursor.fetchall())
+    finally:
+        cursor.close()
+        connection.close()
+
+# Counter slots of hot polls, grown when vote counter updates start waiting on row locks
+counter_slots = CounterSlots(load=load_counter_slots)
+
+# Deferred work (broadcasts, poll closing, poll deletion) runs on these worker threads
+jobs = JobRunner(workers=int(os.getenv('JOB_WORKERS', 4)),
+                 queue_path=os.getenv('JOB_QUEUE_PATH'),
+                 process_workers=int(os.getenv('JOB_PROCESS_WORKERS', 0)),
+                 eager=os.getenv('JOBS_EAGER') == 'True',
+                 tracer=tracer,
+                 compact_after=int(os.getenv('JOB_JOURNAL_COMPACT_AFTER', 1000)))
+
+# Opt-in sampling profiler: requests sent with PROFILE_TOKEN in X-Profile-Token, or a PROFILE_SAMPLE_RATE share
+request_profiler = RequestProfiler()
+
+def load_config():
+    """Load environment variables (and the .env file) into DB_CONFIG."""
+    load_dotenv()
+    db_driver.configure(mode=os.getenv('DB_DRIVER', 'auto'),
+                        pool_size=int(os.getenv('DB_POOL_SIZE', 0)),
+                        prepared=os.getenv('DB_PREPARED_STATEMENTS', 'True') == 'True')
+    DB_CONFIG.update({
+        'host': os.getenv('DB_HOST'),
+        'user': os.getenv('DB_USER'),
+        'password': os.getenv('DB_PASSWORD'),
+        'database': os.getenv('DB_NAME'),
+        'auth_plugin': 'mysql_native_password',
+        'use_pure': db_driver.use_pure,
+        'autocommit': True
+    })
+    db_router.configure(parse_replica_hosts(os.getenv('DB_REPLICA_HOSTS'), DB_CONFIG))
+    db_router.max_lag = float(os.getenv('DB_REPLICA_MAX_LAG', 5))
+    db_router.lag_check_interval = float(os.getenv('DB_REPLICA_LAG_CHECK_INTERVAL', 5))
+    db_router.read_your_writes_window = float(os.getenv('DB_READ_YOUR_WRITES_WINDOW', 10))
+    vote_shard_map.configure(parse_shard_dsns(os.getenv('VOTE_SHARDS'), DB_CONFIG))
+    vote_shard_map.ttl = float(os.getenv('VOTE_SHARD_MAP_TTL', 5))
+    counter_slots.ttl = float(os.getenv('COUNTER_SLOTS_TTL', 5))
+    counter_slots.lock_wait_threshold = float(os.getenv('COUNTER_LOCK_WAIT_MS', 50)) / 1000
+    counter_slots.max_slots = int(os.getenv('COUNTER_MAX_SLOTS', 64))
+    request_profiler.configure(token=os.getenv('PROFILE_TOKEN') or None,
+                               sample_rate=float(os.getenv('PROFILE_SAMPLE_RATE', 0)),
+                               interval=float(os.getenv('PROFILE_INTERVAL_MS', 5)) / 1000,
+                               window=float(os.getenv('PROFILE_WINDOW', 600)),
+                               trace_allocations=os.getenv('PROFILE_TRACEMALLOC') == 'True')
+    tracer.configure(exporter=load_exporter(os.getenv('TRACE_EXPORTER')),
+                     propagate=os.getenv('TRACE_PROPAGATE') == 'True',
+                     service_name=os.getenv('TRACE_SERVICE_NAME', 'poll-backend'))
+
+def get_db_connection(primary=False, budgeted=True):
+    """Open a connection, to a read replica if the current route allows it.
+
+    Statements on an unbudgeted connection do not count towards the route's query budget.
+    """
+    if not DB_CONFIG:
+        load_config()
+    config = DB_CONFIG
+    if not primary and has_request_context():
+        config = db_router.choose(DB_CONFIG, request.endpoint,
+                                  request.cookies.get(READ_PRIMARY_COOKIE) or request.headers.get(READ_PRIMARY_HEADER))
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        return connection
+        with tracer.span('db.connect', CLIENT, **{'db.system': 'mysql', 'server.address': config.get('host') or ''}):
+            connection = db_driver.connect(config)
+        return query_recorder.wrap(connection, budgeted)
     except mysql.connector.Error as err:
         print(f"Error connecting to database: {err}")
         raise
 
-# Test database connection on startup
-try:
-    connection = get_db_connection()
-    print("Successfully connected to database!")
-    connection.close()
-except Exception as e:
-    print(f"Failed to connect to database: {e}")
+def get_shard_connection(shard):
+    """Open a connection to one of the vote shards."""
+    try:
+        connection = db_driver.connect(vote_shard_map.shards[shard])
+        return query_recorder.wrap(connection)
+    except mysql.connector.Error as err:
+        print(f"Error connecting to vote shard {shard}: {err}")
+        raise
+
+def open_poll_votes(poll_id, cursor, connection=None):
+    """Return cursors on the shard(s) holding a poll's votes, or the main cursor when unsharded."""
+    if not vote_shard_map.enabled:
+        return PollVotes(cursor=cursor, connection=connection)
+    shards = vote_shard_map.write_shards(poll_id)
+    # Vote writes go to both shards while the poll is being moved
+    query_recorder.allow(len(shards) - 1)
+    return PollVotes([get_shard_connection(shard) for shard in shards])
+
+def vote_archive_dir():
+    """Directory holding the vote archives written by archive_votes.py."""
+    return os.getenv('VOTE_ARCHIVE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vote_archive')
+
+def secret_key():
+    """Return the JWT secret of the current app (or the default app outside a request)."""
+    if has_app_context():
+        return current_app.config['SECRET_KEY']
+    return get_app().config['SECRET_KEY']
 
 def token_required(f):
     @wraps(f)
@@ -58,6 +344,7 @@ def token_required(f):
         # In testing mode, skip token verification
         if os.environ.get('TESTING') == 'True':
             print("Testing mode detected, skipping token verification")
+            g.current_user_id = 1
             return f(1, *args, **kwargs)  # Use user_id 1 for testing
 
         token = request.headers.get('Authorization')
@@ -65,19 +352,262 @@ def token_required(f):
         if not token:
             print("Token missing")
             return jsonify({'success': False, 'message': 'Token is missing'}), 401
-        try:
-            token = token.split(' ')[1]  # Remove 'Bearer ' prefix
-            print(f"Token: {token}")
-            data = PyJWT.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            print(f"Decoded data: {data}")
-            current_user_id = data['user_id']
-        except Exception as e:
-            print(f"Token validation error: {str(e)}")
-            return jsonify({'success': False, 'message': f'Token is invalid: {str(e)}'}), 401
+        with tracer.span('auth.check') as span:
+            try:
+                token = token.split(' ')[1]  # Remove 'Bearer ' prefix
+                print(f"Token: {token}")
+                data = PyJWT.decode(token, secret_key(), algorithms=["HS256"])
+                print(f"Decoded data: {data}")
+                current_user_id = data['user_id']
+            except Exception as e:
+                print(f"Token validation error: {str(e)}")
+                if span is not None:
+                    span.set('auth.valid', False)
+                return jsonify({'success': False, 'message': f'Token is invalid: {str(e)}'}), 401
+            if span is not None:
+                span.set('auth.valid', True)
+        g.current_user_id = current_user_id
         return f(current_user_id, *args, **kwargs)
     return decorated
 
-@app.route('/api/register', methods=['POST'])
+def load_poll(cursor, poll_data, connection=None):
+    """Build a Poll model for a row of Poll.COLUMNS, loading its options.
+
+    With ``connection`` the options query may run as a prepared statement.
+    Approval and ranked polls get their ballot tally too.
+    """
+    if connection is None:
+        options_cursor = cursor
+        options_cursor.execute(POLL_OPTIONS_SQL, (poll_data[0],))
+    else:
+        options_cursor = db_driver.execute(connection, cursor, POLL_OPTIONS_SQL, (poll_data[0],))
+    
+    poll = Poll.from_row(poll_data, options_cursor.fetchall())
+    if poll.voting_method != SINGLE:
+        poll.tally = load_tallies(cursor, [(poll.id, poll.voting_method, len(poll.options))])[poll.id]
+    return poll
+
+def load_tallies(cursor, polls):
+    """Bring the ballot tallies of approval and ranked polls up to date, in one query.
+
+    ``polls`` are (poll_id, voting_method, option_count) tuples; returns
+    {poll_id: BallotTally} for those that are not single choice. Only the
+    ballots newer than each cached tally are read.
+    """
+    tallies = {poll_id: ballot_tallies.get(poll_id, voting_method, option_count)
+               for poll_id, voting_method, option_count in polls if voting_method != SINGLE}
+    if not tallies:
+        return tallies
+    
+    query_recorder.allow(1)
+    conditions = ' OR '.join(['(poll_id = %s AND id > %s)'] * len(tallies))
+    cursor.execute(f"""
+        SELECT poll_id, id, ranking
+        FROM ballots
+        WHERE {conditions}
+        ORDER BY id
+    """, [value for poll_id, tally in tallies.items() for value in (poll_id, tally.last_id)])
+    ballots = defaultdict(list)
+    for poll_id, ballot_id, ranking in cursor.fetchall():
+        ballots[poll_id].append((ballot_id, ranking))
+    for poll_id, tally in tallies.items():
+        tally.extend(ballots[poll_id])
+    return tallies
+
+def build_poll_payload(cursor, poll_data, connection=None):
+    """Build the public poll body (poll, options, total_votes) for a poll row."""
+    return load_poll(cursor, poll_data, connection).payload()
+
+def freeze_poll_results(cursor, poll_id):
+    """Store the final tally of a closed poll in poll_results and cache it.
+    
+    Run inside a transaction (connections autocommit otherwise), so the
+    claimed row is never seen without its results. The poll_results row is
+    claimed before anything is counted, so only one worker freezes (and
+    announces) a poll; returns None when another worker already has. Vote
+    counters only move while a poll has no poll_results row (see
+    INCREMENT_OPTION_SQL), and on MySQL the claim waits for votes still in
+    flight, so no vote lands after the count.
+    """
+    cursor.execute("""
+        INSERT IGNORE INTO poll_results (poll_id, share_token, total_votes, results)
+        SELECT id, share_token, 0, '' FROM polls WHERE id = %s
+    """, (poll_id,))
+    if not cursor.rowcount:
+        return None
+    
+    cursor.execute(f"""
+        SELECT {', '.join(Poll.COLUMNS)}
+        FROM polls p 
+        JOIN users u ON p.user_id = u.id
+        WHERE p.id = %s
+    """, (poll_id,))
+    
+    poll_data = cursor.fetchone()
+    if not poll_data:
+        return None
+    
+    # Final results are counted from every ballot, not from this worker's cached tally
+    ballot_tallies.discard(poll_id)
+    payload = build_poll_payload(cursor, poll_data)
+    cursor.execute("""
+        UPDATE poll_results SET total_votes = %s, results = %s
+        WHERE poll_id = %s
+    """, (payload['total_votes'], json.dumps(payload), poll_id))
+    
+    return results_snapshots.put(payload)
+
+def stored_results_snapshot(cursor, poll_id):
+    """Return the frozen results stored in poll_results, or None."""
+    cursor.execute("SELECT results FROM poll_results WHERE poll_id = %s", (poll_id,))
+    row = cursor.fetchone()
+    return results_snapshots.put(json.loads(row[0])) if row else None
+
+def load_results_snapshot(connection, poll_id):
+    """Return the frozen results of a closed poll, freezing them now if they are missing."""
+    snapshot = results_snapshots.get_by_poll_id(poll_id)
+    if snapshot:
+        return snapshot
+    
+    cursor = connection.cursor()
+    try:
+        snapshot = stored_results_snapshot(cursor, poll_id)
+        if snapshot:
+            return snapshot
+        
+    finally:
+        cursor.close()
+    
+    # The poll closed while no worker was tracking it; freeze it on the primary
+    primary = get_db_connection(primary=True)
+    cursor = primary.cursor()
+    try:
+        primary.start_transaction()
+        snapshot = freeze_poll_results(cursor, poll_id)
+        primary.commit()
+        # Another worker froze it first
+        return snapshot or stored_results_snapshot(cursor, poll_id)
+    finally:
+        cursor.close()
+        primary.close()
+
+def frozen_response(body, etag, cache_control):
+    """Serve a pre-rendered snapshot body with long-lived caching headers."""
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response.make_conditional(request)
+
+@jobs.job(backoff=5.0, concurrency=2)
+def close_poll(poll_id):
+    """Persist the final tally of a poll that just closed and notify viewers.
+    
+    Every worker schedules the close; only the one that claims the poll_results
+    row sends poll_closed.
+    """
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    try:
+        connection.start_transaction()
+        snapshot = freeze_poll_results(cursor, poll_id)
+        connection.commit()
+    finally:
+        cursor.close()
+        connection.close()
+    
+    if not snapshot:
+        return
+    
+    broadcast('poll_closed', {
+        'poll_id': poll_id,
+        'share_token': snapshot.share_token,
+        'options': snapshot.payload['options'],
+        'total_votes': snapshot.payload['total_votes']
+    })
+
+def broadcast(event, update):
+    """Send a poll event to every default-namespace client and to the poll's subscribers."""
+    room = f"poll:{update['share_token']}"
+    with tracer.span('socketio.emit', PRODUCER, **{'messaging.operation': event, 'messaging.destination': '/'}):
+        socketio.emit(event, update)
+    with tracer.span('socketio.emit', PRODUCER, **{'messaging.operation': event, 'messaging.destination': room}):
+        socketio.emit(event, update, to=room, namespace=POLLS_NAMESPACE)
+    live_updates.publish(update['share_token'], event, update)
+
+# Frozen results of closed polls, served without touching the database
+results_snapshots = SnapshotCache(max_size=int(os.getenv('RESULTS_CACHE_SIZE', 10000)),
+                                  max_age=float(os.getenv('RESULTS_CACHE_MAX_AGE', 300)))
+# Short enough that shared caches stop serving a deleted poll soon after the delete
+RESULTS_MAX_AGE = int(os.getenv('RESULTS_MAX_AGE', 300))
+
+# Share token key -> poll id, so votes on a known poll skip the token lookup
+share_tokens = ShareTokenMap(max_size=int(os.getenv('SHARE_TOKEN_CACHE_SIZE', 100000)),
+                             max_age=float(os.getenv('SHARE_TOKEN_CACHE_MAX_AGE', 300)))
+
+# Columnar vote arrays of recently analysed polls, for owner crosstabs
+vote_frames = VoteFrameCache(max_size=int(os.getenv('VOTE_FRAME_CACHE_SIZE', 1000)),
+                             max_age=float(os.getenv('VOTE_FRAME_MAX_AGE', 60)))
+
+# Ballots and instant-runoff rounds of recently read approval and ranked polls
+ballot_tallies = BallotTallyCache(max_size=int(os.getenv('BALLOT_TALLY_CACHE_SIZE', 1000)),
+                                  max_age=float(os.getenv('BALLOT_TALLY_MAX_AGE', 300)))
+
+# Responses to POSTs sent with an Idempotency-Key header, replayed when a client retries on any worker
+idempotency_keys = IdempotencyStore(connect=lambda: get_db_connection(primary=True, budgeted=False),
+                                    ttl=float(os.getenv('IDEMPOTENCY_KEY_TTL', 86400)),
+                                    pending_ttl=float(os.getenv('IDEMPOTENCY_PENDING_TTL', 60)),
+                                    cache_size=int(os.getenv('IDEMPOTENCY_CACHE_SIZE', 10000)))
+IDEMPOTENCY_PURGE_INTERVAL = float(os.getenv('IDEMPOTENCY_PURGE_INTERVAL', 3600))
+
+# Votes per poll in the recent trending windows, counted as votes come in
+trending = TrendingPolls(windows=[minutes * 60 for minutes in TRENDING_WINDOWS], max_k=MAX_TRENDING)
+
+# Distinct viewers and voter IPs per poll seen by this worker, not yet merged into poll_sketches
+poll_sketches = PollSketches(precision=int(os.getenv('SKETCH_PRECISION', 12)))
+
+def count_audience(poll_id, kind, value):
+    """Add a viewer or voter IP to a poll's sketch, flushing the sketches in the background when due."""
+    poll_sketches.add(poll_id, kind, value)
+    if poll_sketches.flush_due(SKETCH_FLUSH_INTERVAL):
+        jobs.enqueue('flush_poll_sketches')
+
+def viewer_key():
+    """Who is looking, as well as a public endpoint can tell: client address and browser."""
+    return f"{request.remote_addr}|{request.headers.get('User-Agent', '')}"
+
+# Ballot-stuffing check: recent votes per IP, network and email domain of each poll
+fraud_detector = FraudDetector(
+    thresholds={IP: int(os.getenv('FRAUD_MAX_PER_IP', 10)),
+                SUBNET: int(os.getenv('FRAUD_MAX_PER_SUBNET', 30)),
+                DOMAIN: int(os.getenv('FRAUD_MAX_PER_DOMAIN', 50))},
+    window=float(os.getenv('FRAUD_WINDOW_SECONDS', 60)),
+    ignored_domains=os.getenv('FRAUD_IGNORED_DOMAINS',
+                              'gmail.com,googlemail.com,outlook.com,hotmail.com,yahoo.com,icloud.com').split(','),
+    max_polls=int(os.getenv('FRAUD_MAX_POLLS', 1000)))
+
+def record_vote_flags(cursor, poll_id, reasons, quarantined):
+    """Count a suspicious vote in the poll's vote_flags row."""
+    counts = (int(quarantined), int(IP in reasons), int(SUBNET in reasons), int(DOMAIN in reasons))
+    query_recorder.allow(1)
+    cursor.execute(COUNT_VOTE_FLAGS_SQL, (poll_id, *counts, *counts))
+
+# Tracks open/closed state of polls and closes them when their end date passes
+poll_lifecycle = PollLifecycle(on_close=lambda poll_id: jobs.enqueue('close_poll', poll_id))
+
+@jobs.job(backoff=5.0, max_attempts=10)
+def schedule_open_polls():
+    """Track every poll that has not closed yet, so it closes on time after a restart."""
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT id, end_date FROM polls WHERE end_date >= %s", (datetime.datetime.utcnow().date(),))
+        for poll_id, end_date in cursor.fetchall():
+            poll_lifecycle.track(poll_id, end_date)
+    finally:
+        cursor.close()
+        connection.close()
+
+@api.route('/api/register', methods=['POST'])
 def register():
     data = request.json
     print(f"Register data received: {data}")  # Debug log
@@ -148,7 +678,7 @@ def register():
         cursor.close()
         connection.close()
 
-@app.route('/api/login', methods=['POST'])
+@api.route('/api/login', methods=['POST'])
 def login():
     data = request.json
     print(f"Login attempt with data: {data}")  # Debug log
@@ -208,36 +738,15 @@ def login():
         cursor.close()
         connection.close()
 
-@app.route('/api/polls', methods=['GET'])
+@api.route('/api/polls', methods=['GET'])
 @token_required
 def get_polls(current_user_id):
     connection = get_db_connection()
     cursor = connection.cursor()
     try:
-        cursor.execute("""
-            SELECT p.id, p.title, p.question, p.end_date, p.share_token, p.created_at,
-                   COUNT(DISTINCT o.id) as option_count,
-                   COALESCE(SUM(o.votes), 0) as total_votes
-            FROM polls p
-            LEFT JOIN options o ON p.id = o.poll_id
-            WHERE p.user_id = %s
-            GROUP BY p.id, p.title, p.question, p.end_date, p.share_token, p.created_at
-            ORDER BY p.created_at DESC
-        """, (current_user_id,))
-        
-        polls = []
-        for row in cursor.fetchall():
-            poll_id, title, question, end_date, share_token, created_at, option_count, total_votes = row
-            polls.append({
-                'id': poll_id,
-                'title': title,
-                'question': question,
-                'end_date': str(end_date) if end_date else None,
-                'share_token': share_token,
-                'created_at': created_at.isoformat() if created_at else None,
-                'option_count': option_count,
-                'total_votes': int(total_votes) if total_votes else 0
-            })
+        rows = db_driver.execute(connection, cursor, USER_POLLS_SQL, (current_user_id,)).fetchall()
+        
+        polls = [PollSummary(*row).to_dict() for row in rows]
         
         return jsonify({
             'success': True,
@@ -250,8 +759,9 @@ def get_polls(current_user_id):
         cursor.close()
         connection.close()
 
-@app.route('/api/polls', methods=['POST'])
+@api.route('/api/polls', methods=['POST'])
 @token_required
+@idempotent(idempotency_keys)
 def create_poll(current_user_id):
     data = request.json
     title = data.get('title')
@@ -259,35 +769,61 @@ def create_poll(current_user_id):
     options = data.get('options', [])
     end_date = data.get('end_date')
     show_results_to_voters = data.get('show_results_to_voters', False)
+    # Polls expected to go viral can start with their vote counters spread over several rows
+    slots = data.get('counter_slots', 1)
+    voting_method = data.get('voting_method', SINGLE)
 
     if not title or not question or not options:
         return jsonify({'success': False, 'message': 'Missing required fields'}), 400
 
+    if voting_method not in VOTING_METHODS:
+        return jsonify({'success': False, 'message': f"voting_method must be one of {', '.join(VOTING_METHODS)}"}), 400
+
+    if voting_method != SINGLE and len(options) > MAX_OPTIONS:
+        return jsonify({'success': False, 'message': f'{voting_method.capitalize()} polls take at most {MAX_OPTIONS} options'}), 400
+
+    if not isinstance(slots, int) or not 1 <= slots <= counter_slots.max_slots:
+        return jsonify({'success': False, 'message': f'counter_slots must be between 1 and {counter_slots.max_slots}'}), 400
+
     if len(options) < 2:
         return jsonify({'success': False, 'message': 'At least two options are required'}), 400
 
     connection = get_db_connection()
     cursor = connection.cursor()
     try:
-        # Generate a unique share token
-        share_token = secrets.token_urlsafe(16)
+        # Generate a unique share token (stored as 16 bytes, handed out in its URL form)
+        share_key = new_share_token()
+        share_token = format_share_token(share_key)
         
         # Create the poll
         cursor.execute("""
-            INSERT INTO polls (title, question, user_id, share_token, end_date, show_results_to_voters)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (title, question, current_user_id, share_token, end_date, show_results_to_voters))
+            INSERT INTO polls (title, question, user_id, share_token, end_date, show_results_to_voters, voting_method)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, (title, question, current_user_id, share_key, end_date, show_results_to_voters, voting_method))
         
         poll_id = cursor.lastrowid
         
-        # Add options
-        for option_text in options:
-            cursor.execute("""
-                INSERT INTO options (poll_id, option_text)
-                VALUES (%s, %s)
-            """, (poll_id, option_text))
+        # Add options in one batched insert
+        cursor.executemany("""
+            INSERT INTO options (poll_id, option_text)
+            VALUES (%s, %s)
+        """, [(poll_id, option_text) for option_text in options])
+        
+        if slots > 1:
+            query_recorder.allow(2)
+            set_counter_slots(cursor, poll_id, slots)
+        
+        # Pin the poll to its shard, so changing VOTE_SHARDS later does not move it
+        if vote_shard_map.enabled:
+            shard = vote_shard_map.default_shard(poll_id)
+            query_recorder.allow(1)
+            cursor.execute("INSERT INTO vote_shards (poll_id, shard) VALUES (%s, %s)", (poll_id, shard))
         
         connection.commit()
+        if slots > 1:
+            counter_slots.set(poll_id, slots)
+        if vote_shard_map.enabled:
+            vote_shard_map.pin(poll_id, shard)
         
         return jsonify({
             'success': True,
@@ -304,7 +840,7 @@ def create_poll(current_user_id):
         cursor.close()
         connection.close()
 
-@app.route('/api/polls/<int:poll_id>', methods=['DELETE'])
+@api.route('/api/polls/<int:poll_id>', methods=['DELETE'])
 @token_required
 def delete_poll(current_user_id, poll_id):
     connection = get_db_connection()
@@ -324,177 +860,301 @@ def delete_poll(current_user_id, poll_id):
         connection.close()
         return jsonify({"success": False, "message": "Unauthorized access"}), 403
 
+    cursor.close()
+    connection.close()
+    
     try:
-        # Delete votes first
-        cursor.execute("DELETE FROM votes WHERE poll_id = %s", (poll_id,))
+        delete_poll_data(poll_id)
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Failed to delete poll: {str(e)}"}), 500
+
+    # Stop serving the poll from this worker's caches
+    poll_lifecycle.forget(poll_id)
+    results_snapshots.discard(poll_id)
+    vote_frames.discard(poll_id)
+    ballot_tallies.discard(poll_id)
+    share_tokens.discard_poll(poll_id)
+    trending.discard(poll_id)
+    poll_sketches.discard(poll_id)
+    fraud_detector.discard(poll_id)
+    return jsonify({"success": True, "message": "Poll deleted successfully"}), 200
+
+# Still registered so deletions queued before delete_poll ran them inline are finished after an upgrade
+@jobs.job(backoff=2.0)
+def delete_poll_data(poll_id):
+    """Delete a poll with its results snapshot, votes (on every shard holding them) and options."""
+    connection = get_db_connection(primary=True)
+    cursor = connection.cursor()
+    try:
+        # Delete the results snapshot and votes first
+        cursor.execute("DELETE FROM poll_results WHERE poll_id = %s", (poll_id,))
+        votes = open_poll_votes(poll_id, cursor)
+        try:
+            for vote_cursor in votes.writes:
+                vote_cursor.execute("DELETE FROM votes WHERE poll_id = %s", (poll_id,))
+            votes.commit()
+        finally:
+            votes.close()
+        if vote_shard_map.enabled:
+            query_recorder.allow(1)
+            cursor.execute("DELETE FROM vote_shards WHERE poll_id = %s", (poll_id,))
+        # Databases built by older setup_db.py versions have no ON DELETE CASCADE on vote_archives
+        cursor.execute("DELETE FROM vote_archives WHERE poll_id = %s", (poll_id,))
         # Delete options
         cursor.execute("DELETE FROM options WHERE poll_id = %s", (poll_id,))
-        # Delete the poll
+        # Delete the poll (its ballots go with it, ON DELETE CASCADE)
         cursor.execute("DELETE FROM polls WHERE id = %s", (poll_id,))
         connection.commit()
-        return jsonify({"success": True, "message": "Poll deleted successfully"}), 200
-    except Exception as e:
+    except Exception:
         connection.rollback()
-        return jsonify({"success": False, "message": f"Failed to delete poll: {str(e)}"}), 500
+        raise
     finally:
         cursor.close()
         connection.close()
+    
+    # Remove the archive file once its vote_archives row is gone
+    try:
+        os.remove(archive_path(vote_archive_dir(), poll_id))
+    except FileNotFoundError:
+        pass
 
-@app.route('/api/polls/<string:share_token>/vote', methods=['POST'])
+@api.route('/api/polls/<string:share_token>/vote', methods=['POST'])
+@idempotent(idempotency_keys)
 def submit_vote(share_token):
     data = request.json
     print(f"Vote submission data: {data}")  # Debug log
     voter_name = data.get('voter_name')
     voter_email = data.get('voter_email')
     selected_option_id = data.get('selected_option')  # This should be the option ID
+    # Approval polls take a list of option ids, ranked polls a list in order of preference
+    choices = data.get('selected_options') or data.get('ranking')
 
-    if not all([voter_name, voter_email, selected_option_id]):
+    if not all([voter_name, voter_email]) or not (selected_option_id or choices):
         return jsonify({"success": False, "message": "Missing required fields"}), 400
 
     connection = get_db_connection()
     cursor = connection.cursor()
+    votes = None
     
     try:
-        # Get poll_id from share_token
-        cursor.execute("""
-            SELECT p.id, p.title, p.question, p.end_date 
-            FROM polls p 
-            WHERE p.share_token = %s
-        """, (share_token,))
-        poll = cursor.fetchone()
-        
-        if not poll:
+        # Get poll_id from share_token, without a query when this worker already knows the poll
+        share_key = parse_share_token(share_token)
+        if share_key is None:
             return jsonify({"success": False, "message": "Poll not found"}), 404
+        share_token = format_share_token(share_key)
+        known = share_tokens.get(share_key)
+        if known is None or poll_lifecycle.is_open(known[0]) is None:
+            poll = db_driver.execute(connection, cursor, VOTE_POLL_SQL, (share_key,)).fetchone()
+            
+            if not poll:
+                return jsonify({"success": False, "message": "Poll not found"}), 404
 
-        poll_id = poll[0]
+            poll_id, voting_method = poll[0], poll[4]
+            share_tokens.put(share_key, poll_id, voting_method)
+            poll_lifecycle.track(poll_id, poll[3])
+        else:
+            poll_id, voting_method = known
         
-        # Check if poll has ended
-        if poll[3]:
-            end_date = poll[3].replace(hour=23, minute=59, second=59)
-            if datetime.datetime.now() > end_date:
-                return jsonify({"success": False, "message": "This poll has ended"}), 400
+        # Check if poll has ended (the lifecycle scheduler flips the flag at close time)
+        if not poll_lifecycle.is_open(poll_id):
+            return jsonify({"success": False, "message": "This poll has ended"}), 400
 
-        # Check if user has already voted
-        cursor.execute("""
-            SELECT id FROM votes 
-            WHERE poll_id = %s AND voter_email = %s
-        """, (poll_id, voter_email))
+        ballot_field = BALLOT_FIELDS[voting_method]
+        if not data.get(ballot_field):
+            return jsonify({"success": False, "message": f"Votes on this poll need {ballot_field}"}), 400
+
+        # Check if user has already voted (on the poll's vote shard when sharding is enabled)
+        votes = open_poll_votes(poll_id, cursor, connection)
+        existing = db_driver.execute(votes.read_connection, votes.read, VOTER_EXISTS_SQL, (poll_id, voter_email))
         
-        if cursor.fetchone():
+        if existing.fetchone():
             return jsonify({"success": False, "message": "You have already voted on this poll"}), 400
 
-        # Verify the option belongs to this poll
-        cursor.execute("""
-            SELECT id FROM options 
-            WHERE poll_id = %s AND id = %s
-        """, (poll_id, selected_option_id))
-        
-        if not cursor.fetchone():
-            return jsonify({"success": False, "message": "Invalid option selected"}), 400
+        ballot = None
+        if voting_method == SINGLE:
+            # Verify the option belongs to this poll
+            if not db_driver.execute(connection, cursor, OPTION_IN_POLL_SQL, (poll_id, selected_option_id)).fetchone():
+                return jsonify({"success": False, "message": "Invalid option selected"}), 400
+            counted = [selected_option_id]
+        else:
+            # Every chosen option must belong to this poll, each chosen once
+            option_ids = [row[0] for row in
+                          db_driver.execute(connection, cursor, POLL_OPTION_IDS_SQL, (poll_id,)).fetchall()]
+            choices = data[ballot_field]
+            positions = ballot_positions(option_ids, choices) if isinstance(choices, list) else None
+            if positions is None:
+                return jsonify({"success": False, "message": "Invalid option selected"}), 400
+            ballot = encode_ballot(positions)
+            # The votes row records the first choice; approvals count for every chosen option,
+            # rankings for the first preference until the runoff rounds
+            selected_option_id = choices[0]
+            counted = choices if voting_method == APPROVAL else choices[:1]
 
-        # Record the vote
-        cursor.execute("""
-            INSERT INTO votes (poll_id, option_id, voter_name, voter_email, ip_address)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (poll_id, selected_option_id, voter_name, voter_email, request.remote_addr))
+        # Count the vote, store its ballot and record it in one transaction (connections autocommit otherwise)
+        connection.start_transaction()
+
+        # Bursts from one address, network or email domain are flagged, or held back for review
+        suspicious = fraud_detector.check(poll_id, request.remote_addr, voter_email)
+        if suspicious:
+            quarantined = FRAUD_ACTION == QUARANTINE
+            record_vote_flags(cursor, poll_id, suspicious, quarantined)
+            print(f"Suspicious vote on poll {poll_id} ({', '.join(suspicious)}), "
+                  f"{'quarantined' if quarantined else 'flagged'}")
+            if quarantined:
+                cursor.execute(INSERT_QUARANTINED_VOTE_SQL, (poll_id, selected_option_id, voter_name, voter_email,
+                                                             request.remote_addr, ballot, ','.join(suspicious)))
+                connection.commit()
+                return jsonify({"success": True, "quarantined": True,
+                                "message": "Vote received and held for review"}), 202
+
+        # Update option votes count, in a random counter slot for hot polls; nothing is
+        # written once the poll's results are frozen, even if this worker has not seen it close
+        update_started = time.perf_counter()
+        incremented = increment_votes(connection, cursor, poll_id, counted)
+        # Only the counter statement waits on the row lock; the shard writes and commit are not timed
+        update_wait = time.perf_counter() - update_started
+        if not incremented:
+            connection.rollback()
+            poll_lifecycle.forget(poll_id)
+            return jsonify({"success": False, "message": "This poll has ended"}), 400
         
-        # Update option votes count
-        cursor.execute("""
-            UPDATE options 
-            SET votes = votes + 1 
-            WHERE id = %s
-        """, (selected_option_id,))
+        if ballot is not None:
+            query_recorder.allow(1)
+            db_driver.execute(connection, cursor, INSERT_BALLOT_SQL, (poll_id, ballot))
         
-        connection.commit()
+        # Record the vote (on both shards while the poll is being moved); shard writes commit on their own
+        for vote_cursor in votes.writes:
+            vote_cursor.execute(INSERT_VOTE_SQL,
+                                (poll_id, selected_option_id, voter_name, voter_email, request.remote_addr))
+        votes.commit()
+        try:
+            connection.commit()
+        except Exception:
+            # The vote is on its shard but was not counted; take it back so the voter can retry
+            connection.rollback()
+            try:
+                votes.delete_vote(poll_id, voter_email)
+            except Exception as e:
+                print(f"Failed to remove uncounted vote of {voter_email} on poll {poll_id}: {e}")
+            raise
+        grow_to = counter_slots.note_wait(poll_id, update_wait)
+        if grow_to:
+            jobs.enqueue('grow_counter_slots', poll_id, grow_to)
+        vote_frames.discard(poll_id)
+        trending.record(poll_id)
+        if request.remote_addr:
+            count_audience(poll_id, VOTER_IPS, request.remote_addr)
+        if TRENDING_STATE_PATH and trending.save_due(TRENDING_SAVE_INTERVAL):
+            jobs.enqueue('save_trending')
 
         # Get updated options with vote counts
-        cursor.execute("""
-            SELECT id, option_text, votes 
-            FROM options 
-            WHERE poll_id = %s
-        """, (poll_id,))
-        
-        options_data = cursor.fetchall()
-        options = []
-        total_votes = 0
-        
-        for option in options_data:
-            option_id, option_text, vote_count = option
-            total_votes += vote_count
-            options.append({
-                'id': option_id,
-                'option_text': option_text,
-                'votes': vote_count
-            })
+        option_rows = db_driver.execute(connection, cursor, POLL_OPTIONS_SQL, (poll_id,)).fetchall()
         
-        # Calculate percentage for each option
-        for option in options:
-            option['percentage'] = round((option['votes'] / total_votes * 100) if total_votes > 0 else 0, 1)
+        option_counts = OptionCounts.from_rows(option_rows)
+        tally = load_tallies(cursor, [(poll_id, voting_method, len(option_counts))]).get(poll_id)
+        results = poll_results(option_counts, tally)
 
-        # Emit socket event with updated data
-        socketio.emit('vote_update', {
+        # Broadcast the updated tally after the response
+        jobs.enqueue('emit_vote_update', {
             'poll_id': poll_id,
             'share_token': share_token,
-            'options': options,
-            'total_votes': total_votes
+            **results
         })
         
         return jsonify({
             "success": True,
             "message": "Vote recorded successfully",
-            "options": options,
-            "total_votes": total_votes
+            **results
         })
         
+    except ShardRoutingUnavailable as e:
+        print(f"Error recording vote: {str(e)}")
+        connection.rollback()
+        return jsonify({"success": False, "message": "Voting is temporarily unavailable, please retry"}), 503
     except Exception as e:
         print(f"Error recording vote: {str(e)}")
         connection.rollback()
         return jsonify({"success": False, "message": f"Failed to record vote: {str(e)}"}), 500
     finally:
+        if votes:
+            votes.close()
         cursor.close()
         connection.close()
 
-@app.route('/api/polls/<int:poll_id>/details', methods=['GET'])
+def increment_votes(connection, cursor, poll_id, option_ids):
+    """Add a vote to each option, in a random counter slot for hot polls.
+    
+    Returns False, counting nothing, when the poll's results are already frozen.
+    """
+    slot = counter_slots.pick_slot(poll_id)
+    if len(option_ids) == 1:
+        updated = None
+        if slot:
+            updated = db_driver.execute(connection, cursor, INCREMENT_SLOT_SQL, (option_ids[0], slot, poll_id))
+        if updated is None or updated.rowcount == 0:
+            if slot:
+                # The slot's row is missing (the poll is being split); count on the options row
+                query_recorder.allow(1)
+            updated = db_driver.execute(connection, cursor, INCREMENT_OPTION_SQL, (option_ids[0], poll_id))
+        return updated.rowcount > 0
+    
+    # Several approvals in one statement (not prepared: the number of options varies)
+    placeholders = ', '.join(['%s'] * len(option_ids))
+    if slot:
+        cursor.execute(f"""
+            UPDATE option_vote_slots 
+            SET votes = votes + 1 
+            WHERE option_id IN ({placeholders}) AND slot = %s
+              AND NOT EXISTS (SELECT 1 FROM poll_results WHERE poll_id = %s)
+        """, (*option_ids, slot, poll_id))
+        if cursor.rowcount:
+            return True
+        query_recorder.allow(1)
+    cursor.execute(f"""
+        UPDATE options 
+        SET votes = votes + 1 
+        WHERE id IN ({placeholders})
+          AND NOT EXISTS (SELECT 1 FROM poll_results WHERE poll_id = %s)
+    """, (*option_ids, poll_id))
+    return cursor.rowcount > 0
+
+@api.route('/api/polls/<int:poll_id>/details', methods=['GET'])
 @token_required
 def get_poll_details(current_user_id, poll_id):
+    # Closed polls are answered from their frozen results, plus the counts that still change after closing
+    snapshot = results_snapshots.get_by_poll_id(poll_id)
+    if snapshot and snapshot.user_id != current_user_id:
+        snapshot = None
+    
     connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
+    cursor = connection.cursor()
     
     try:
-        # Get poll details
-        cursor.execute("""
-            SELECT p.*, u.username as creator_name 
-            FROM polls p 
-            JOIN users u ON p.user_id = u.id 
-            WHERE p.id = %s AND p.user_id = %s
-        """, (poll_id, current_user_id))
-        
-        poll = cursor.fetchone()
-        if not poll:
-            return jsonify({'message': 'Poll not found'}), 404
+        if snapshot is None:
+            # Get poll details
+            cursor.execute(f"""
+                SELECT {', '.join(Poll.COLUMNS)}
+                FROM polls p 
+                JOIN users u ON p.user_id = u.id 
+                WHERE p.id = %s AND p.user_id = %s
+            """, (poll_id, current_user_id))
             
-        # Get options with vote counts
-        cursor.execute("""
-            SELECT o.id, o.option_text, COUNT(v.id) as votes
-            FROM options o
-            LEFT JOIN votes v ON o.id = v.option_id
-            WHERE o.poll_id = %s
-            GROUP BY o.id, o.option_text
-        """, (poll_id,))
-        
-        options = cursor.fetchall()
-        
-        # Calculate total votes
-        total_votes = sum(option['votes'] for option in options)
+            poll_data = cursor.fetchone()
+            if not poll_data:
+                return jsonify({'message': 'Poll not found'}), 404
+            
+            poll_lifecycle.track(poll_data[0], poll_data[3])
+            if poll_lifecycle.is_open(poll_data[0]):
+                # Options with vote counts (kept on the options rows, so no scan of the vote shards)
+                details = load_poll(cursor, poll_data).details()
+                return jsonify(add_owner_stats(cursor, poll_data[0], details))
+            snapshot = load_results_snapshot(connection, poll_data[0])
         
-        return jsonify({
-            'id': poll['id'],
-            'question': poll['question'],
-            'creator_name': poll['creator_name'],
-            'created_at': poll['created_at'].isoformat(),
-            'options': options,
-            'total_votes': total_votes
-        })
+        details = add_owner_stats(cursor, snapshot.poll_id, json.loads(snapshot.details_body))
+        response = jsonify(details)
+        response.add_etag()
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
         
     except Exception as e:
         print(f"Error: {str(e)}")
@@ -503,77 +1163,447 @@ def get_poll_details(current_user_id, poll_id):
         cursor.close()
         connection.close()
 
-@app.route('/api/polls/<string:share_token>', methods=['GET'])
+def add_owner_stats(cursor, poll_id, details):
+    """Add the audience estimates and flagged vote counts to an owner details body."""
+    cursor.execute("SELECT kind, registers FROM poll_sketches WHERE poll_id = %s", (poll_id,))
+    details['audience'] = poll_sketches.estimates(poll_id, cursor.fetchall())
+    cursor.execute(VOTE_FLAGS_SQL, (poll_id,))
+    flags = cursor.fetchone() or (0,) * 5
+    details['flagged_votes'] = {
+        'flagged': flags[0],
+        'quarantined': flags[1],
+        'reasons': {IP: flags[2], SUBNET: flags[3], DOMAIN: flags[4]}
+    }
+    return details
+
+@api.route('/api/polls/<string:share_token>', methods=['GET'])
 def get_poll_by_share_token(share_token):
+    share_key = parse_share_token(share_token)
+    if share_key is None:
+        return jsonify({'success': False, 'message': 'Poll not found'}), 404
+    
+    # Closed polls are answered from their frozen results
+    snapshot = results_snapshots.get(format_share_token(share_key))
+    if snapshot:
+        count_audience(snapshot.poll_id, VIEWERS, viewer_key())
+        return frozen_response(snapshot.body, snapshot.etag, f'public, max-age={RESULTS_MAX_AGE}')
+    
     connection = get_db_connection()
     cursor = connection.cursor()
     
     try:
         # Get poll info
-        cursor.execute("""
-            SELECT p.id, p.title, p.question, p.end_date, p.user_id, p.share_token, 
-                   u.username as creator_name, p.created_at, p.show_results_to_voters
-            FROM polls p 
-            JOIN users u ON p.user_id = u.id
-            WHERE p.share_token = %s
-        """, (share_token,))
+        poll_data = db_driver.execute(connection, cursor, POLL_BY_SHARE_TOKEN_SQL, (share_key,)).fetchone()
+        if not poll_data and db_router.replicas:
+            # A poll created moments ago may not have reached the replica yet
+            query_recorder.allow(1)
+            cursor.close()
+            connection.close()
+            connection = get_db_connection(primary=True)
+            cursor = connection.cursor()
+            poll_data = db_driver.execute(connection, cursor, POLL_BY_SHARE_TOKEN_SQL, (share_key,)).fetchone()
         
-        poll_data = cursor.fetchone()
         if not poll_data:
             return jsonify({'success': False, 'message': 'Poll not found'}), 404
-            
-        poll_id, title, question, end_date, user_id, share_token, creator_name, created_at, show_results_to_voters = poll_data
         
-        # Get options
+        count_audience(poll_data[0], VIEWERS, viewer_key())
+        poll_lifecycle.track(poll_data[0], poll_data[3])
+        if not poll_lifecycle.is_open(poll_data[0]):
+            snapshot = load_results_snapshot(connection, poll_data[0])
+            return frozen_response(snapshot.body, snapshot.etag, f'public, max-age={RESULTS_MAX_AGE}')
+        
+        payload = build_poll_payload(cursor, poll_data, connection)
+        
+        return jsonify({'success': True, **payload}), 200
+        
+    except Exception as e:
+        print(f"Error getting poll by share token: {str(e)}")
+        return jsonify({'success': False, 'message': 'Failed to load poll'}), 500
+    finally:
+        cursor.close()
+        connection.close()
+
+@api.route('/api/polls/<int:poll_id>/votes/export', methods=['GET'])
+@token_required
+def export_votes(current_user_id, poll_id):
+    """Download a poll's individual votes as CSV, rehydrated from the archive once archived."""
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    votes = None
+    
+    try:
         cursor.execute("""
-            SELECT id, option_text, votes 
-            FROM options 
-            WHERE poll_id = %s
+            SELECT p.user_id, a.path
+            FROM polls p
+            LEFT JOIN vote_archives a ON a.poll_id = p.id
+            WHERE p.id = %s
         """, (poll_id,))
+        poll = cursor.fetchone()
         
-        options_data = cursor.fetchall()
-        options = []
-        total_votes = 0
-        
-        for option in options_data:
-            option_id, option_text, vote_count = option
-            total_votes += vote_count
-            options.append({
-                'id': option_id,
-                'option_text': option_text,
-                'votes': vote_count
-            })
+        if not poll or poll[0] != current_user_id:
+            return jsonify({'success': False, 'message': 'Poll not found'}), 404
         
-        # Calculate percentage for each option
-        for option in options:
-            option['percentage'] = round((option['votes'] / total_votes * 100) if total_votes > 0 else 0, 1)
+        if poll[1]:
+            rows = iter_archive_rows(os.path.join(vote_archive_dir(), poll[1]))
+        else:
+            votes = open_poll_votes(poll_id, cursor)
+            votes.read.execute("""
+                SELECT id, option_id, voter_name, voter_email, ip_address, voted_at
+                FROM votes
+                WHERE poll_id = %s
+                ORDER BY id
+            """, (poll_id,))
+            rows = votes.read.fetchall()
         
-        poll = {
-            'id': poll_id,
-            'title': title,
-            'question': question,
-            'end_date': str(end_date) if end_date else None,
-            'user_id': user_id,
-            'share_token': share_token,
-            'creator_name': creator_name,
-            'created_at': created_at.isoformat() if created_at else None,
-            'show_results_to_voters': bool(show_results_to_voters)
-        }
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(VOTE_COLUMNS)
+        for row in rows:
+            writer.writerow(row)
         
-        return jsonify({
-            'success': True,
-            'poll': poll,
-            'options': options,
-            'total_votes': total_votes
-        }), 200
+        response = current_app.response_class(output.getvalue(), mimetype='text/csv')
+        response.headers['Content-Disposition'] = f'attachment; filename=poll_{poll_id}_votes.csv'
+        return response
         
     except Exception as e:
-        print(f"Error getting poll by share token: {str(e)}")
-        return jsonify({'success': False, 'message': 'Failed to load poll'}), 500
+        print(f"Error exporting votes: {str(e)}")
+        return jsonify({'success': False, 'message': 'Failed to export votes'}), 500
+    finally:
+        if votes:
+            votes.close()
+        cursor.close()
+        connection.close()
+
+@api.route('/api/polls/<int:poll_id>/ballots/import', methods=['POST'])
+@token_required
+def import_ballots(current_user_id, poll_id):
+    """Load offline (paper or kiosk) ballots into an open poll from a CSV or NDJSON body.
+
+    Each row is a vote body (voter_name, voter_email and the poll's ballot
+    field; CSV lists several option ids separated by ';'). The body is
+    streamed and written in chunks of ?chunk_size= ballots.
+    """
+    fmt = import_format(request.args.get('format') or request.mimetype)
+    if fmt is None:
+        return jsonify({'success': False, 'message': 'Send text/csv or application/x-ndjson'}), 415
+    chunk_size = request.args.get('chunk_size', IMPORT_CHUNK_SIZE, type=int)
+    if not 1 <= chunk_size <= MAX_IMPORT_CHUNK_SIZE:
+        return jsonify({'success': False, 'message': f'chunk_size must be between 1 and {MAX_IMPORT_CHUNK_SIZE}'}), 400
+    
+    connection = get_db_connection(primary=True)
+    cursor = connection.cursor()
+    votes = None
+    importer = None
+    
+    try:
+        cursor.execute("SELECT user_id, end_date, voting_method, share_token FROM polls WHERE id = %s", (poll_id,))
+        poll = cursor.fetchone()
+        
+        if not poll or poll[0] != current_user_id:
+            return jsonify({'success': False, 'message': 'Poll not found'}), 404
+        
+        # Closed polls serve frozen results, so ballots are only taken while the poll is open
+        poll_lifecycle.track(poll_id, poll[1])
+        if not poll_lifecycle.is_open(poll_id):
+            return jsonify({'success': False, 'message': 'This poll has ended'}), 400
+        
+        cursor.execute(POLL_OPTION_IDS_SQL, (poll_id,))
+        option_ids = [row[0] for row in cursor.fetchall()]
+        votes = open_poll_votes(poll_id, cursor, connection)
+        writer = ChunkWriter(connection, cursor, votes, poll_id)
+        # The response carries the final counts and rows per second; only the CLI reports progress as it goes
+        importer = BallotImport(poll[2], option_ids, writer.existing_emails(), chunk_size=chunk_size)
+        stats = importer.run(read_rows(io.TextIOWrapper(request.stream, encoding='utf-8', newline=''), fmt), writer)
+        
+        if stats.imported:
+            vote_frames.discard(poll_id)
+            cursor.execute(POLL_OPTIONS_SQL, (poll_id,))
+            option_counts = OptionCounts.from_rows(cursor.fetchall())
+            tally = load_tallies(cursor, [(poll_id, poll[2], len(option_counts))]).get(poll_id)
+            jobs.enqueue('emit_vote_update', {
+                'poll_id': poll_id,
+                'share_token': format_share_token(poll[3]),
+                **poll_results(option_counts, tally)
+            })
+        
+        return jsonify({'success': True, **stats.to_dict()})
+        
+    # Chunks written before a failure stay imported; the counts say how far the import got
+    except PollFrozen:
+        poll_lifecycle.forget(poll_id)
+        return jsonify({'success': False, 'message': 'This poll has ended',
+                        **importer.stats.to_dict()}), 400
+    except UnicodeDecodeError:
+        return jsonify({'success': False, 'message': 'The file is not UTF-8 text',
+                        **(importer.stats.to_dict() if importer else {})}), 400
+    except Exception as e:
+        print(f"Error importing ballots: {str(e)}")
+        connection.rollback()
+        return jsonify({'success': False, 'message': f'Failed to import ballots: {str(e)}',
+                        **(importer.stats.to_dict() if importer else {})}), 500
+    finally:
+        if votes:
+            votes.close()
+        cursor.close()
+        connection.close()
+
+@api.route('/api/polls/<int:poll_id>/crosstab', methods=['GET'])
+@token_required
+def get_poll_crosstab(current_user_id, poll_id):
+    """Break a poll's votes down by ?by=option,hour (also day, domain, ip_prefix)."""
+    dimensions = [name.strip() for name in request.args.get('by', 'option').split(',') if name.strip()]
+    if not dimensions:
+        return jsonify({'success': False, 'message': 'No dimensions given'}), 400
+    
+    frame = vote_frames.get(poll_id)
+    if frame is None:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        votes = None
+        try:
+            cursor.execute("""
+                SELECT p.user_id, a.path
+                FROM polls p
+                LEFT JOIN vote_archives a ON a.poll_id = p.id
+                WHERE p.id = %s
+            """, (poll_id,))
+            poll = cursor.fetchone()
+            
+            if not poll or poll[0] != current_user_id:
+                return jsonify({'success': False, 'message': 'Poll not found'}), 404
+            
+            if poll[1]:
+                frame = VoteFrame.from_archive(read_archive(os.path.join(vote_archive_dir(), poll[1])))
+            else:
+                votes = open_poll_votes(poll_id, cursor)
+                votes.read.execute("""
+                    SELECT option_id, voter_email, ip_address, voted_at
+                    FROM votes
+                    WHERE poll_id = %s
+                """, (poll_id,))
+                frame = VoteFrame.from_rows(votes.read.fetchall())
+            frame.user_id = poll[0]
+            vote_frames.put(poll_id, frame)
+        except Exception as e:
+            print(f"Error loading votes for crosstab: {str(e)}")
+            return jsonify({'success': False, 'message': 'Failed to load votes'}), 500
+        finally:
+            if votes:
+                votes.close()
+            cursor.close()
+            connection.close()
+    elif frame.user_id != current_user_id:
+        return jsonify({'success': False, 'message': 'Poll not found'}), 404
+    
+    try:
+        rows = frame.crosstab(dimensions)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'dimensions': dimensions,
+        'total_votes': frame.size,
+        'rows': rows
+    })
+
+@api.route('/api/polls/trending', methods=['GET'])
+def get_trending_polls():
+    """Polls with the most votes in the last few minutes: ?window=<minutes>&limit=<n>"""
+    window = request.args.get('window', TRENDING_WINDOWS[0], type=int)
+    if window not in TRENDING_WINDOWS:
+        windows = ', '.join(str(minutes) for minutes in TRENDING_WINDOWS)
+        return jsonify({'success': False, 'message': f'window must be one of {windows} minutes'}), 400
+    limit = request.args.get('limit', 10, type=int)
+    if not 1 <= limit <= MAX_TRENDING:
+        return jsonify({'success': False, 'message': f'limit must be between 1 and {MAX_TRENDING}'}), 400
+
+    leaders = trending.top(window * 60, limit)
+    polls = {}
+    if leaders:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        try:
+            cursor.execute(f"""
+                SELECT id, share_token, title, question
+                FROM polls
+                WHERE id IN ({', '.join(['%s'] * len(leaders))})
+            """, [poll_id for poll_id, _ in leaders])
+            polls = {row[0]: row for row in cursor.fetchall()}
+        finally:
+            cursor.close()
+            connection.close()
+
+    # Polls deleted by another worker drop out here
+    return jsonify({
+        'window_minutes': window,
+        'polls': [{
+            'share_token': format_share_token(polls[poll_id][1]),
+            'title': polls[poll_id][2],
+            'question': polls[poll_id][3],
+            'votes': votes
+        } for poll_id, votes in leaders if poll_id in polls]
+    }), 200
+
+@api.route('/api/polls/batch', methods=['GET'])
+def get_polls_batch():
+    """Public view of many polls at once: ?tokens=<share_token>,<share_token>,..."""
+    tokens = parse_share_tokens(request.args.get('tokens', '').split(','))
+    if not tokens:
+        return jsonify({'success': False, 'message': 'No share tokens given'}), 400
+    if len(tokens) > MAX_BATCH_TOKENS:
+        return jsonify({'success': False, 'message': f'At most {MAX_BATCH_TOKENS} polls per request'}), 400
+    
+    # Polls are found by the URL form of their key; the response is keyed by the tokens as given
+    canonical = {token: canonical_share_token(token) for token in tokens}
+    
+    # Closed polls come from their frozen results
+    polls = {}
+    for token in set(filter(None, canonical.values())):
+        snapshot = results_snapshots.get(token)
+        if snapshot:
+            polls[token] = snapshot.payload
+    
+    pending = [token for token in set(filter(None, canonical.values())) if token not in polls]
+    if pending:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        try:
+            placeholders = ', '.join(['%s'] * len(pending))
+            cursor.execute(f"""
+                SELECT {', '.join(Poll.COLUMNS)}
+                FROM polls p 
+                JOIN users u ON p.user_id = u.id
+                WHERE p.share_token IN ({placeholders})
+            """, [parse_share_token(token) for token in pending])
+            found = {row[0]: row for row in cursor.fetchall()}
+            
+            option_rows = {poll_id: [] for poll_id in found}
+            if found:
+                placeholders = ', '.join(['%s'] * len(found))
+                cursor.execute(f"""
+                    SELECT o.poll_id, o.id, o.option_text, {OPTION_VOTES_SQL}
+                    FROM options o
+                    {COUNTER_SLOTS_JOIN}
+                    WHERE o.poll_id IN ({placeholders})
+                    ORDER BY o.id
+                """, list(found))
+                for poll_id, option_id, option_text, votes in cursor.fetchall():
+                    option_rows[poll_id].append((option_id, option_text, votes))
+            
+            loaded = [Poll.from_row(row, option_rows[poll_id]) for poll_id, row in found.items()]
+            tallies = load_tallies(cursor, [(poll.id, poll.voting_method, len(poll.options)) for poll in loaded])
+            for poll in loaded:
+                poll_lifecycle.track(poll.id, poll.end_date)
+                poll.tally = tallies.get(poll.id)
+                polls[poll.share_token] = poll.payload()
+        except Exception as e:
+            print(f"Error getting polls by share tokens: {str(e)}")
+            return jsonify({'success': False, 'message': 'Failed to load polls'}), 500
+        finally:
+            cursor.close()
+            connection.close()
+    
+    return jsonify({
+        'success': True,
+        'polls': {token: polls[canonical[token]] for token in tokens if canonical[token] in polls},
+        'missing': [token for token in tokens if canonical[token] not in polls]
+    }), 200
+
+def current_poll_state(share_token):
+    """Return the public body of a poll and whether it has closed, or None if there is no such poll.
+
+    ``share_token`` is in canonical URL form (see canonical_share_token).
+    """
+    snapshot = results_snapshots.get(share_token)
+    if snapshot:
+        return snapshot.payload, True
+    
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT {', '.join(Poll.COLUMNS)}
+            FROM polls p 
+            JOIN users u ON p.user_id = u.id
+            WHERE p.share_token = %s
+        """, (parse_share_token(share_token),))
+        poll_data = cursor.fetchone()
+        if not poll_data:
+            return None
+        
+        poll_lifecycle.track(poll_data[0], poll_data[3])
+        if not poll_lifecycle.is_open(poll_data[0]):
+            return load_results_snapshot(connection, poll_data[0]).payload, True
+        return load_poll(cursor, poll_data).payload(), False
     finally:
         cursor.close()
         connection.close()
 
+@api.route('/api/polls/<string:share_token>/events', methods=['GET'])
+def poll_events(share_token):
+    """Stream a poll's vote_update and poll_closed events as Server-Sent Events.
+
+    The stream starts with a ``snapshot`` event holding the current tally,
+    unless the client resumes with Last-Event-ID and missed nothing still
+    buffered. Comment frames are sent as heartbeats so proxies keep the
+    connection open. The stream ends after ``poll_closed``.
+    """
+    share_token = canonical_share_token(share_token)
+    if share_token is None:
+        return jsonify({'success': False, 'message': 'Poll not found'}), 404
+    
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        last_id = None
+    
+    missed, complete = live_updates.since(share_token, last_id) if last_id is not None else ([], False)
+    state = None
+    if not complete:
+        try:
+            state = current_poll_state(share_token)
+        except Exception as e:
+            print(f"Error loading poll for event stream: {str(e)}")
+            return jsonify({'success': False, 'message': 'Failed to load poll'}), 500
+        if state is None:
+            return jsonify({'success': False, 'message': 'Poll not found'}), 404
+        missed = []
+        last_id = live_updates.last_id(share_token)
+    
+    def stream():
+        cursor_id = last_id
+        yield f'retry: {SSE_RETRY_MS}\n\n'
+        if state:
+            payload, closed = state
+            yield sse_frame('snapshot', payload, cursor_id)
+            if closed:
+                yield sse_frame('poll_closed', {
+                    'poll_id': payload['poll']['id'],
+                    'share_token': share_token,
+                    'options': payload['options'],
+                    'total_votes': payload['total_votes']
+                })
+                return
+        events = missed
+        while True:
+            for event_id, event, data in events:
+                cursor_id = event_id
+                yield sse_frame(event, data, event_id)
+                if event == 'poll_closed':
+                    return
+            events = live_updates.wait(share_token, cursor_id, SSE_HEARTBEAT_SECONDS)
+            if not events:
+                yield ': heartbeat\n\n'
+    
+    # The generator uses no request state, so the request context is not kept open while it streams
+    response = current_app.response_class(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 def create_token(user_id, username):
     """Create a JWT token for the user."""
     try:
@@ -582,7 +1612,7 @@ def create_token(user_id, username):
             'username': username,
             'exp': datetime.datetime.utcnow() + datetime.timedelta(days=1)
         }
-        return PyJWT.encode(payload, app.config['SECRET_KEY'], algorithm='HS256')
+        return PyJWT.encode(payload, secret_key(), algorithm='HS256')
     except Exception as e:
         print(f"Error creating token: {str(e)}")
         return "dummy_token_for_tests"
@@ -595,7 +1625,7 @@ def verify_token():
     
     token = auth_header.split(' ')[1]
     try:
-        payload = PyJWT.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+        payload = PyJWT.decode(token, secret_key(), algorithms=['HS256'])
         return payload['user_id'], payload['username']
     except PyJWT.ExpiredSignatureError:
         raise Exception('Token expired')
@@ -607,5 +1637,224 @@ def close_db_connection(conn):
     if conn:
         conn.close()
 
+@api.after_request
+def purge_idempotency_keys_when_due(response):
+    """Clear out expired idempotency keys now and then, from whichever worker handles a keyed request."""
+    if 'Idempotency-Key' in request.headers and idempotency_keys.purge_due(IDEMPOTENCY_PURGE_INTERVAL):
+        jobs.enqueue('purge_idempotency_keys')
+    return response
+
+@api.after_request
+def note_writes(response):
+    """Send a client's reads to the primary for a while after they change data.
+    
+    The marker travels with the client (cookie, or the header for API clients
+    that echo it back), so it holds on every worker.
+    """
+    if db_router.replicas and request.method in ('POST', 'PUT', 'DELETE') and response.status_code < 400:
+        marker = f"{db_router.write_marker():.3f}"
+        response.set_cookie(READ_PRIMARY_COOKIE, marker, max_age=int(db_router.read_your_writes_window) + 1,
+                            httponly=True, samesite='Lax')
+        response.headers[READ_PRIMARY_HEADER] = marker
+    return response
+
+@jobs.job(max_attempts=3, backoff=0.5, concurrency=1)
+def grow_counter_slots(poll_id, slots):
+    """Spread a hot poll's vote counters over more rows."""
+    connection = get_db_connection(primary=True)
+    cursor = connection.cursor()
+    try:
+        set_counter_slots(cursor, poll_id, slots)
+        connection.commit()
+    finally:
+        cursor.close()
+        connection.close()
+    counter_slots.set(poll_id, slots)
+
+@jobs.job(max_attempts=3, backoff=1.0, concurrency=1)
+def flush_poll_sketches():
+    """Merge this worker's pending sketches into the poll_sketches table."""
+    pending = poll_sketches.take()
+    if not pending:
+        return
+    connection = get_db_connection(primary=True)
+    cursor = connection.cursor()
+    try:
+        for (poll_id, kind), sketch in list(pending.items()):
+            merged = merge_stored_sketch(cursor, poll_id, kind, sketch)
+            if merged is None:
+                # The poll was deleted, perhaps by another worker; its sketch has nowhere to go
+                del pending[(poll_id, kind)]
+            elif merged:
+                connection.commit()
+                del pending[(poll_id, kind)]
+    finally:
+        cursor.close()
+        connection.close()
+        # Sketches that were not merged (busy rows, or an error) wait for the next flush
+        poll_sketches.put_back(pending)
+
+@jobs.job(max_attempts=3, backoff=5.0, concurrency=1)
+def purge_idempotency_keys():
+    """Delete stored idempotent responses whose TTL has passed."""
+    idempotency_keys.purge()
+
+@jobs.job(max_attempts=1, concurrency=1)
+def save_trending():
+    """Write the trending counts to TRENDING_STATE_PATH so a restart keeps its windows."""
+    trending.save(TRENDING_STATE_PATH)
+
+@jobs.job(max_attempts=3, backoff=0.5)
+def emit_vote_update(update):
+    """Push a poll's new tally to every connected viewer."""
+    broadcast('vote_update', update)
+
+def parse_share_tokens(tokens):
+    """Return the distinct share tokens that can be valid, in order."""
+    tokens = (token.strip() for token in tokens if isinstance(token, str))
+    return list(dict.fromkeys(token for token in tokens if parse_share_token(token) is not None))
+
+@socketio.on('subscribe', namespace=POLLS_NAMESPACE)
+def subscribe_polls(data):
+    """Follow vote_update and poll_closed events for a list of share tokens on one socket."""
+    tokens = parse_share_tokens((data or {}).get('share_tokens') or [])
+    if len(tokens) > MAX_BATCH_TOKENS:
+        return {'success': False, 'message': f'At most {MAX_BATCH_TOKENS} polls per subscription'}
+    for token in tokens:
+        join_room(f'poll:{canonical_share_token(token)}')
+        # A live viewer of a poll this worker knows; unknown tokens would cost a lookup each
+        known = share_tokens.get(parse_share_token(token))
+        if known is not None:
+            count_audience(known[0], VIEWERS, viewer_key())
+    return {'success': True, 'subscribed': tokens}
+
+@socketio.on('unsubscribe', namespace=POLLS_NAMESPACE)
+def unsubscribe_polls(data):
+    tokens = parse_share_tokens((data or {}).get('share_tokens') or [])
+    for token in tokens:
+        leave_room(f'poll:{canonical_share_token(token)}')
+    return {'success': True, 'unsubscribed': tokens}
+
+@api.route('/metrics/jobs', methods=['GET'])
+def job_metrics():
+    """Background job queue depth, outcomes and latency."""
+    return jsonify(jobs.stats()), 200
+
+@api.route('/debug/profile', methods=['GET'])
+def profile_stacks():
+    """Sampled stacks of profiled requests, in folded format for flamegraph.pl or speedscope."""
+    if not request_profiler.authorized(request.headers.get(PROFILE_TOKEN_HEADER)):
+        return jsonify({'message': 'Not found'}), 404
+    folded = request_profiler.profile.folded(request.args.get('route'))
+    return current_app.response_class(folded, mimetype='text/plain', headers={
+        'Content-Disposition': 'attachment; filename=profile.folded',
+        'Cache-Control': 'no-store'
+    })
+
+@api.route('/debug/profile/allocations', methods=['GET'])
+def profile_allocations():
+    """Profiled requests per route and, with PROFILE_TRACEMALLOC, the bytes they allocated."""
+    if not request_profiler.authorized(request.headers.get(PROFILE_TOKEN_HEADER)):
+        return jsonify({'message': 'Not found'}), 404
+    return jsonify({
+        'requests': request_profiler.profile.requests(),
+        'tracing': request_profiler.trace_allocations,
+        'allocations': request_profiler.allocations.to_dict()
+    }), 200
+
+@api.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness check: the process is up. Never touches the database."""
+    return jsonify({
+        'status': 'ok',
+        'startup_ms': current_app.config.get('STARTUP_MS')
+    }), 200
+
+@api.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness check: the database answers a trivial query."""
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+        finally:
+            cursor.close()
+            connection.close()
+    except Exception as e:
+        print(f"Readiness check failed: {e}")
+        return jsonify({'status': 'unavailable', 'message': 'Database unavailable'}), 503
+    return jsonify({'status': 'ready'}), 200
+
+def create_app():
+    """Build the Flask app. Nothing here connects to the database."""
+    load_config()
+    
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.getenv('JWT_SECRET_KEY')  # Get secret key from environment variable
+    # Configure CORS to allow requests from frontend
+    CORS(app, resources={
+        r"/*": {
+            "origins": ["http://localhost:3000"],
+            "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+            "allow_headers": ["Content-Type", "Authorization", "Idempotency-Key", PROFILE_TOKEN_HEADER,
+                              "traceparent", READ_PRIMARY_HEADER],
+            "expose_headers": [READ_PRIMARY_HEADER]
+        }
+    })
+    app.register_blueprint(api)
+    query_recorder.init_app(app)
+    request_profiler.init_app(app)
+    tracer.init_app(app)
+    if TRENDING_STATE_PATH:
+        trending.restore(TRENDING_STATE_PATH)
+    init_socketio(app)
+    start_background_work()
+    
+    app.config['STARTUP_MS'] = round((time.perf_counter() - IMPORT_STARTED) * 1000, 1)
+    return app
+
+def init_socketio(app):
+    """Serve Socket.IO on an app; every app of the process shares the one server that emits reach."""
+    if socketio.server is None:
+        socketio.init_app(app, cors_allowed_origins="*")
+        return
+    app.extensions['socketio'] = socketio
+    app.wsgi_app = _SocketIOMiddleware(socketio.server, app, socketio_path='socket.io')
+
+# Process that started the job workers and poll scheduling
+_background_pid = None
+
+def start_background_work():
+    """Start the job workers and schedule open polls to close, once per process.
+    
+    Runs from create_app so WSGI servers get it too, not just `python app.py`.
+    Scheduling is queued, so building the app still never waits on the
+    database. Skipped when jobs run eagerly (tests), where nothing runs in
+    the background.
+    """
+    global _background_pid
+    if jobs.eager or _background_pid == os.getpid():
+        return
+    _background_pid = os.getpid()
+    jobs.start()
+    jobs.enqueue('schedule_open_polls')
+
+_app = None
+
+def get_app():
+    """Return the default app, creating it on first use."""
+    global _app
+    if _app is None:
+        _app = create_app()
+    return _app
+
+def __getattr__(name):
+    # Keep `from app import app` working without building the app at import time
+    if name == 'app':
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 if __name__ == '__main__':
-    socketio.run(app, debug=True, port=5000)
+    socketio.run(get_app(), debug=True, port=5000)
@@ -0,0 +1,69 @@
+import argparse
+import os
+import sys
+
+import mysql.connector
+
+import app
+from vote_archive import archive_closed_polls, reorganize_partition_ddl
+
+def add_vote_partitions(connection):
+    """Split new poll_id ranges off the votes table's p_max partition when polls approach it."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            SELECT MAX(PARTITION_DESCRIPTION + 0)
+            FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'votes' AND PARTITION_NAME <> 'p_max'
+        """)
+        highest_bound = cursor.fetchone()[0]
+        if highest_bound is None:
+            print("The votes table is not partitioned; run partition_votes.sql first")
+            return
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM polls")
+        ddl = reorganize_partition_ddl(int(highest_bound), cursor.fetchone()[0])
+        if ddl:
+            cursor.execute(ddl)
+            print(ddl)
+        else:
+            print("Vote partitions are up to date")
+    finally:
+        cursor.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Move the raw votes of long-closed polls into archive files.")
+    parser.add_argument('--retention-days', type=int, default=int(os.getenv('VOTE_ARCHIVE_RETENTION_DAYS', 90)),
+                        help='days after a poll closes before its votes are archived')
+    parser.add_argument('--limit', type=int, default=100, help='polls archived per run')
+    parser.add_argument('--batch-size', type=int, default=5000, help='votes read or deleted per statement')
+    parser.add_argument('--partitions', action='store_true', help='also add votes partitions for new polls')
+    args = parser.parse_args()
+
+    app.load_config()
+    shard_map = app.vote_shard_map
+
+    def votes_connection_for(poll_id):
+        if not shard_map.enabled:
+            return mysql.connector.connect(**app.DB_CONFIG)
+        shard, moving_to = shard_map.placement(poll_id)
+        if moving_to is not None:
+            print(f"Skipping poll {poll_id}: its votes are being moved")
+            return None
+        return mysql.connector.connect(**shard_map.shards[shard])
+
+    main_connection = mysql.connector.connect(**app.DB_CONFIG)
+    try:
+        archived = archive_closed_polls(main_connection, votes_connection_for, app.vote_archive_dir(),
+                                        retention_days=args.retention_days, limit=args.limit,
+                                        batch_size=args.batch_size)
+        if args.partitions:
+            add_vote_partitions(main_connection)
+    finally:
+        main_connection.close()
+    for poll_id, vote_count in archived.items():
+        print(f"Archived {vote_count} votes of poll {poll_id}")
+    print(f"Archived {len(archived)} polls")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+import csv
+import json
+import time
+from collections import Counter, namedtuple
+
+import mysql.connector
+
+from tally import APPROVAL, BALLOT_FIELDS, SINGLE, ballot_positions, encode_ballot
+
+# Import file formats, by request content type or file extension
+FORMATS = {'text/csv': 'csv', '.csv': 'csv',
+           'application/x-ndjson': 'ndjson', 'application/jsonl': 'ndjson', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+# Longest values the votes table holds
+MAX_NAME_LENGTH = 100
+MAX_EMAIL_LENGTH = 100
+MAX_IP_LENGTH = 45
+
+# Rejected rows listed in the report; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+Ballot = namedtuple('Ballot', 'voter_name voter_email option_id counted ranking ip_address')
+
+
+class PollFrozen(Exception):
+    """Raised when a chunk arrives after the poll's results were frozen; nothing of it is written."""
+
+
+def import_format(name):
+    """The import format ('csv' or 'ndjson') of a content type or file name, or None."""
+    name = (name or '').lower()
+    if name in FORMATS:
+        return FORMATS[name]
+    return next((fmt for suffix, fmt in FORMATS.items() if suffix.startswith('.') and name.endswith(suffix)), None)
+
+
+def read_rows(lines, fmt):
+    """Yield (line number, row dict) from CSV or NDJSON text lines; unreadable rows are None."""
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else None
+
+
+def parse_choices(value):
+    """Option ids of a ballot field: a JSON id or list (NDJSON) or ids separated by ';' (CSV)."""
+    if isinstance(value, str):
+        try:
+            return [int(part) for part in value.split(';') if part.strip()]
+        except ValueError:
+            return None
+    if isinstance(value, list):
+        return value
+    return [value] if value is not None else None
+
+
+class ImportStats:
+    """Counts of an import in progress, with its throughput."""
+
+    def __init__(self, clock=time.perf_counter):
+        self.rows = 0
+        self.imported = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors = []
+        self._clock = clock
+        self.started = clock()
+
+    @property
+    def seconds(self):
+        return self._clock() - self.started
+
+    @property
+    def rows_per_second(self):
+        seconds = self.seconds
+        return self.rows / seconds if seconds > 0 else 0.0
+
+    def reject(self, line, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'message': message})
+
+    def to_dict(self):
+        return {
+            'rows': self.rows,
+            'imported': self.imported,
+            'duplicates': self.duplicates,
+            'invalid': self.invalid,
+            'errors': self.errors,
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': round(self.rows_per_second, 1)
+        }
+
+    def __str__(self):
+        return (f"{self.rows} rows: {self.imported} imported, {self.duplicates} duplicates, "
+                f"{self.invalid} invalid ({self.rows_per_second:.0f} rows/s)")
+
+
+class BallotImport:
+    """Validates the ballot rows of one poll and writes them in chunks.
+
+    Rows are the vote request body (voter_name, voter_email and the poll's
+    ballot field: selected_option, selected_options or ranking, plus an
+    optional ip_address). Emails already voted with, in the database or
+    earlier in the file, are skipped as duplicates; like the votes table's
+    unique key they are compared case-insensitively. ``progress`` is
+    called with the ImportStats at most every ``progress_interval``
+    seconds and once at the end.
+    """
+
+    def __init__(self, voting_method, option_ids, existing_emails=(), chunk_size=1000,
+                 progress=None, progress_interval=1.0, clock=time.perf_counter):
+        self.voting_method = voting_method
+        self.field = BALLOT_FIELDS[voting_method]
+        self.option_ids = list(option_ids)
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.stats = ImportStats(clock)
+        self._clock = clock
+        self._reported_at = self.stats.started
+        self._seen = {email.lower() for email in existing_emails}
+
+    def ballot(self, line, row):
+        """The Ballot of a row, or None after counting it as invalid or duplicate."""
+        if row is None:
+            self.stats.reject(line, 'Unreadable row')
+            return None
+        voter_name = str(row.get('voter_name') or '').strip()
+        voter_email = str(row.get('voter_email') or '').strip()
+        ip_address = str(row.get('ip_address') or '').strip() or None
+        if not voter_name or not voter_email:
+            self.stats.reject(line, 'Missing voter_name or voter_email')
+            return None
+        if len(voter_name) > MAX_NAME_LENGTH or len(voter_email) > MAX_EMAIL_LENGTH or \
+                len(ip_address or '') > MAX_IP_LENGTH:
+            self.stats.reject(line, 'Value too long')
+            return None
+
+        choices = parse_choices(row.get(self.field))
+        positions = ballot_positions(self.option_ids, choices) if choices else None
+        if positions is None or (self.voting_method == SINGLE and len(positions) != 1):
+            self.stats.reject(line, f'Invalid {self.field}')
+            return None
+
+        key = voter_email.lower()
+        if key in self._seen:
+            self.stats.duplicates += 1
+            return None
+        self._seen.add(key)
+
+        chosen = [self.option_ids[position] for position in positions]
+        if self.voting_method == SINGLE:
+            return Ballot(voter_name, voter_email, chosen[0], chosen, None, ip_address)
+        counted = chosen if self.voting_method == APPROVAL else chosen[:1]
+        return Ballot(voter_name, voter_email, chosen[0], counted, encode_ballot(positions), ip_address)
+
+    def chunks(self, rows):
+        """Group the valid ballots of (line, row) pairs into lists of ``chunk_size``."""
+        chunk = []
+        for line, row in rows:
+            self.stats.rows += 1
+            ballot = self.ballot(line, row)
+            if ballot is None:
+                continue
+            chunk.append(ballot)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def run(self, rows, writer):
+        """Import every row with a ChunkWriter and return the ImportStats."""
+        for chunk in self.chunks(rows):
+            written = writer.write(chunk)
+            self.stats.imported += written
+            self.stats.duplicates += len(chunk) - written
+            self._report()
+        self._report(final=True)
+        return self.stats
+
+    def _report(self, final=False):
+        if self.progress is None:
+            return
+        now = self._clock()
+        if final or now - self._reported_at >= self.progress_interval:
+            self._reported_at = now
+            self.progress(self.stats)
+
+
+class ChunkWriter:
+    """Writes chunks of ballots into one poll.
+
+    Votes and ballots go in as batched inserts (mysql.connector sends an
+    executemany INSERT as one multi-row statement) and every option counter
+    touched by the chunk is updated by a single statement. Counters, ballots
+    and (unsharded) votes of a chunk commit in one transaction; votes on a
+    shard commit just before it and are deleted again if it fails. Counters
+    only move while the poll has no poll_results row, as for online votes;
+    a chunk that finds the results frozen raises PollFrozen. ``votes`` is
+    the poll's PollVotes.
+    """
+
+    def __init__(self, connection, cursor, votes, poll_id):
+        self.connection = connection
+        self.cursor = cursor
+        self.votes = votes
+        self.poll_id = poll_id
+
+    def existing_emails(self, emails=None):
+        """Lowercased emails that have voted on the poll (of ``emails`` only, when given)."""
+        sql = "SELECT voter_email FROM votes WHERE poll_id = %s"
+        params = [self.poll_id]
+        if emails is not None:
+            sql += f" AND voter_email IN ({', '.join(['%s'] * len(emails))})"
+            params.extend(emails)
+        self.votes.read.execute(sql, params)
+        return {email.lower() for (email,) in self.votes.read.fetchall()}
+
+    def write(self, chunk):
+        """Write a chunk and return how many ballots went in.
+
+        An email that voted online since the import started makes the batch
+        fail on the unique key; those ballots are dropped and the rest written.
+        """
+        try:
+            self._write(chunk)
+        except mysql.connector.IntegrityError as err:
+            if err.errno != 1062:
+                raise
+            self.connection.rollback()
+            taken = self.existing_emails([ballot.voter_email for ballot in chunk])
+            chunk = [ballot for ballot in chunk if ballot.voter_email.lower() not in taken]
+            if chunk:
+                self._write(chunk)
+        return len(chunk)
+
+    def _write(self, chunk):
+        # Connections from the app autocommit; the CLI's is already in a transaction
+        if not self.connection.in_transaction:
+            self.connection.start_transaction()
+
+        counts = Counter(option_id for ballot in chunk for option_id in ballot.counted)
+        cases = ' '.join(['WHEN %s THEN %s'] * len(counts))
+        self.cursor.execute(f"""
+            UPDATE options
+            SET votes = votes + CASE id {cases} END
+            WHERE id IN ({', '.join(['%s'] * len(counts))})
+              AND NOT EXISTS (SELECT 1 FROM poll_results WHERE poll_id = %s)
+        """, [value for item in counts.items() for value in item] + list(counts) + [self.poll_id])
+        if not self.cursor.rowcount:
+            self.connection.rollback()
+            raise PollFrozen(self.poll_id)
+
+        ballots = [(self.poll_id, ballot.ranking) for ballot in chunk if ballot.ranking is not None]
+        if ballots:
+            self.cursor.executemany("INSERT INTO ballots (poll_id, ranking) VALUES (%s, %s)", ballots)
+
+        votes = [(self.poll_id, ballot.option_id, ballot.voter_name, ballot.voter_email, ballot.ip_address)
+                 for ballot in chunk]
+        for vote_cursor in self.votes.writes:
+            vote_cursor.executemany("""
+                INSERT INTO votes (poll_id, option_id, voter_name, voter_email, ip_address)
+                VALUES (%s, %s, %s, %s, %s)
+            """, votes)
+        self.votes.commit()
+        try:
+            self.connection.commit()
+        except Exception:
+            # The votes are on their shard but were not counted; take them back
+            self.connection.rollback()
+            self.votes.delete_votes(self.poll_id, [ballot.voter_email for ballot in chunk])
+            raise
@@ -0,0 +1,82 @@
+"""Statement latency of the vote path: pure-Python driver, C extension and prepared statements.
+
+    python bench_db_driver.py <share_token> [--rounds 2000]
+
+Runs the statements of one vote (poll lookup, duplicate check, option
+check, counter increment, tally) against the database configured in .env,
+``--rounds`` times per mode on one connection. The increments run in a
+transaction that is rolled back, so the poll's counts are left as they were.
+"""
+import argparse
+import sys
+import time
+
+import mysql.connector
+
+import app
+from db_access import DatabaseDriver
+from share_tokens import parse_share_token
+
+MODES = (('pure', 'pure', False), ('c', 'c', False), ('c+prepared', 'c', True))
+
+def vote_statements(share_token):
+    """The statements of one vote, as (sql, params) pairs; the poll and option ids come from the database."""
+    share_key = parse_share_token(share_token)
+    connection = mysql.connector.connect(**app.DB_CONFIG)
+    cursor = connection.cursor()
+    try:
+        cursor.execute(app.VOTE_POLL_SQL, (share_key,))
+        poll = cursor.fetchone()
+        if not poll:
+            raise SystemExit(f"No poll with share token {share_token!r}")
+        cursor.execute(app.POLL_OPTIONS_SQL, (poll[0],))
+        option_id = cursor.fetchall()[0][0]
+    finally:
+        cursor.close()
+        connection.close()
+    return [(app.VOTE_POLL_SQL, (share_key,)),
+            (app.VOTER_EXISTS_SQL, (poll[0], 'bench@example.com')),
+            (app.OPTION_IN_POLL_SQL, (poll[0], option_id)),
+            (app.INCREMENT_OPTION_SQL, (option_id,)),
+            (app.POLL_OPTIONS_SQL, (poll[0],))]
+
+def bench(mode, prepared, statements, rounds):
+    """Seconds per vote (all its statements) for one driver mode."""
+    driver = DatabaseDriver(mode=mode, pool_size=1, prepared=prepared)
+    config = dict(app.DB_CONFIG, use_pure=driver.use_pure, autocommit=False)
+    connection = driver.connect(config)
+    cursor = connection.cursor()
+    try:
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for sql, params in statements:
+                result = driver.execute(connection, cursor, sql, params)
+                if result.with_rows:
+                    result.fetchall()
+        elapsed = time.perf_counter() - started
+        connection.rollback()
+    finally:
+        cursor.close()
+        connection.close()
+    return elapsed / rounds
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('share_token')
+    parser.add_argument('--rounds', type=int, default=2000)
+    args = parser.parse_args()
+
+    app.load_config()
+    statements = vote_statements(args.share_token)
+    baseline = None
+    for name, mode, prepared in MODES:
+        if mode == 'c' and not mysql.connector.HAVE_CEXT:
+            print(f"{name:>10}: skipped, the C extension is not installed")
+            continue
+        seconds = bench(mode, prepared, statements, args.rounds)
+        baseline = baseline or seconds
+        print(f"{name:>10}: {seconds * 1e6:8.0f} us per vote ({baseline / seconds:4.2f}x)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
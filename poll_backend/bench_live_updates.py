@@ -0,0 +1,105 @@
+"""Server cost of live results: SSE streams versus Socket.IO long-polling.
+
+    python bench_live_updates.py [--viewers 500] [--updates 20]
+
+Both transports run through the real WSGI app in-process. For each one the
+benchmark reports HTTP requests, bytes sent (headers included) and server
+time per delivered update, plus traced memory per open connection. The
+SSE figure excludes the greenlet each stream holds under eventlet/gevent
+(a few KB); long-polling sessions hold no greenlet between polls but pay a
+request per update and per ping interval.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault('JWT_SECRET_KEY', 'bench')
+
+import app as poll_app
+from share_tokens import format_share_token
+
+# Any 16 byte key; its URL form is already canonical, as the events route expects
+TOKEN = format_share_token(b'bench-token-0001')
+UPDATE = {'poll_id': 1, 'share_token': TOKEN, 'total_votes': 3,
+          'options': [{'id': 1, 'option_text': 'A', 'votes': 2, 'percentage': 66.7},
+                      {'id': 2, 'option_text': 'B', 'votes': 1, 'percentage': 33.3}]}
+
+def response_bytes(response, body):
+    headers = sum(len(name) + len(value) + 4 for name, value in response.headers.items())
+    return len(f'HTTP/1.1 {response.status}\r\n') + headers + 2 + len(body)
+
+def bench_sse(client, viewers, updates):
+    poll_app.live_updates.publish(TOKEN, 'vote_update', UPDATE)
+    resume = {'Last-Event-ID': str(poll_app.live_updates.last_id(TOKEN))}
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    streams = []
+    sent = 0
+    for _ in range(viewers):
+        response = client.get(f'/api/polls/{TOKEN}/events', headers=resume, buffered=False)
+        frames = response.iter_encoded()
+        sent += response_bytes(response, next(frames))
+        streams.append(frames)
+    memory = (tracemalloc.get_traced_memory()[0] - before) / viewers
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for _ in range(updates):
+        poll_app.live_updates.publish(TOKEN, 'vote_update', UPDATE)
+        for frames in streams:
+            sent += len(next(frames))
+    elapsed = time.perf_counter() - started
+    for frames in streams:
+        frames.close()
+    return {'requests': viewers, 'bytes': sent, 'seconds': elapsed, 'memory': memory}
+
+def bench_long_polling(client, viewers, updates):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sessions = []
+    sent = 0
+    for _ in range(viewers):
+        response = client.get('/socket.io/?EIO=4&transport=polling')
+        sent += response_bytes(response, response.data)
+        sid = json.loads(response.data[1:])['sid']
+        url = f'/socket.io/?EIO=4&transport=polling&sid={sid}'
+        response = client.post(url, data='40')
+        sent += response_bytes(response, response.data)
+        response = client.get(url)
+        sent += response_bytes(response, response.data)
+        sessions.append(url)
+    memory = (tracemalloc.get_traced_memory()[0] - before) / viewers
+    tracemalloc.stop()
+
+    requests = viewers * 3
+    started = time.perf_counter()
+    for _ in range(updates):
+        poll_app.socketio.emit('vote_update', UPDATE)
+        for url in sessions:
+            response = client.get(url)
+            sent += response_bytes(response, response.data)
+            requests += 1
+    elapsed = time.perf_counter() - started
+    return {'requests': requests, 'bytes': sent, 'seconds': elapsed, 'memory': memory}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--viewers', type=int, default=500)
+    parser.add_argument('--updates', type=int, default=20)
+    args = parser.parse_args()
+
+    client = poll_app.get_app().test_client()
+    deliveries = args.viewers * args.updates
+    for name, bench in (('SSE', bench_sse), ('long-polling', bench_long_polling)):
+        result = bench(client, args.viewers, args.updates)
+        print(f"{name:>12}: {result['requests']:6d} requests, {result['bytes'] / deliveries:6.0f} bytes and "
+              f"{result['seconds'] / deliveries * 1e6:6.1f} us per delivered update, "
+              f"{result['memory'] / 1024:5.1f} KB per connection")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
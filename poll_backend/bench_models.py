@@ -0,0 +1,49 @@
+"""Memory used per cached poll: Poll models versus the dict payloads they replace.
+
+    python bench_models.py [--polls 10000] [--options 4]
+"""
+import argparse
+import datetime
+import sys
+import tracemalloc
+
+from models import Poll
+
+def poll_rows(index, options):
+    created_at = datetime.datetime(2024, 1, 1) + datetime.timedelta(seconds=index)
+    row = (index, f'Poll {index}', f'Question {index}?', None, index % 100, f'token{index:016d}',
+           f'user{index % 100}', created_at, True)
+    return row, [(index * options + number, f'Option {number}', index % 7 + number) for number in range(options)]
+
+def as_model(index, options):
+    row, option_rows = poll_rows(index, options)
+    return Poll.from_row(row, option_rows)
+
+def as_dict(index, options):
+    # What the handlers used to hold per poll: a poll dict and one dict per option
+    return as_model(index, options).payload()
+
+def bytes_per_poll(build, polls=10000, options=4):
+    """Average traced bytes held per poll when ``polls`` polls are kept alive."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        cache = [build(index, options) for index in range(polls)]
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del cache
+    return (after - before) / polls
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--polls', type=int, default=10000)
+    parser.add_argument('--options', type=int, default=4)
+    args = parser.parse_args()
+
+    for name, build in (('dict payload', as_dict), ('Poll model', as_model)):
+        print(f"{name:>12}: {bytes_per_poll(build, args.polls, args.options):8.0f} bytes per poll")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
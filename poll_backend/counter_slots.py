@@ -0,0 +1,120 @@
+import random
+import threading
+import time
+from collections import defaultdict, deque
+
+# Option vote totals: the options row itself (slot 0) plus any extra counter slots. The slot rows are
+# only summed for polls in poll_counter_slots (joined as cs, see COUNTER_SLOTS_JOIN). MySQL's SUM
+# returns a DECIMAL, hence the CAST.
+OPTION_VOTES_SQL = ("CAST(o.votes + CASE WHEN cs.poll_id IS NULL THEN 0 ELSE "
+                    "COALESCE((SELECT SUM(s.votes) FROM option_vote_slots s WHERE s.option_id = o.id), 0) "
+                    "END AS SIGNED)")
+COUNTER_SLOTS_JOIN = "LEFT JOIN poll_counter_slots cs ON cs.poll_id = o.poll_id"
+
+
+class CounterSlots:
+    """Spreads the vote counters of hot polls over several rows.
+
+    A poll with K slots keeps its tally in the options row (slot 0) plus
+    rows 1..K-1 of option_vote_slots; each vote increments one slot picked
+    at random, so concurrent votes for the same option rarely wait on the
+    same row lock. Reads add the slots up (OPTION_VOTES_SQL).
+
+    K per poll comes from the poll_counter_slots table, loaded whole by
+    ``load()`` and cached for ``ttl`` seconds; polls not in it use 1 slot.
+    ``note_wait`` records how long each counter update took: after
+    ``grow_after`` updates slower than ``lock_wait_threshold`` seconds
+    within ``window`` seconds it returns a doubled K (up to ``max_slots``).
+    """
+
+    def __init__(self, load=None, ttl=5.0, lock_wait_threshold=0.05, grow_after=5, window=10.0,
+                 max_slots=64, clock=time.monotonic, rng=random):
+        self.load = load
+        self.ttl = ttl
+        self.lock_wait_threshold = lock_wait_threshold
+        self.grow_after = grow_after
+        self.window = window
+        self.max_slots = max_slots
+        self._clock = clock
+        self._rng = rng
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._loaded_at = None
+        self._slow = defaultdict(deque)
+        self._growing = set()
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def clear(self):
+        """Forget every poll's slot count until the next reload (after ``ttl``)."""
+        with self._lock:
+            self._slots = {}
+            self._loaded_at = self._clock()
+            self._slow.clear()
+            self._growing.clear()
+
+    def set(self, poll_id, slots):
+        """Record a poll's slot count locally (after changing it in the database)."""
+        with self._lock:
+            self._slots[poll_id] = slots
+            self._growing.discard(poll_id)
+            self._slow.pop(poll_id, None)
+
+    def slots(self, poll_id):
+        now = self._clock()
+        if self.load and (self._loaded_at is None or now - self._loaded_at >= self.ttl):
+            try:
+                slots = self.load()
+            except Exception as e:
+                # Stale counts only send votes to fewer slots; reads still add up every slot row
+                print(f"Error loading counter slots: {e}")
+                slots = self._slots
+            with self._lock:
+                self._slots = slots
+                self._loaded_at = now
+        return self._slots.get(poll_id, 1)
+
+    def pick_slot(self, poll_id):
+        """Slot a new vote increments: 0 is the options row, higher ones are option_vote_slots rows."""
+        slots = self.slots(poll_id)
+        return self._rng.randrange(slots) if slots > 1 else 0
+
+    def note_wait(self, poll_id, seconds):
+        """Record a counter update's duration; returns the new slot count when the poll should grow."""
+        if seconds < self.lock_wait_threshold:
+            return None
+        now = self._clock()
+        with self._lock:
+            slow = self._slow[poll_id]
+            slow.append(now)
+            while slow and now - slow[0] > self.window:
+                slow.popleft()
+            slots = self._slots.get(poll_id, 1)
+            if len(slow) < self.grow_after or slots >= self.max_slots or poll_id in self._growing:
+                return None
+            self._growing.add(poll_id)
+            slow.clear()
+        return min(max(slots, 1) * 2, self.max_slots)
+
+
+def set_counter_slots(cursor, poll_id, slots):
+    """Give a poll ``slots`` counter slots: create the missing slot rows and record the count.
+
+    Reads add up every slot row that exists, so lowering the count later
+    only stops new votes going to the higher slots.
+    """
+    if slots > 1:
+        # One row per option and slot number, in one statement
+        numbers = ' UNION ALL '.join(['SELECT %s AS slot'] + ['SELECT %s'] * (slots - 2))
+        cursor.execute(f"""
+            INSERT IGNORE INTO option_vote_slots (option_id, slot, votes)
+            SELECT o.id, s.slot, 0
+            FROM options o
+            JOIN ({numbers}) s
+            WHERE o.poll_id = %s
+        """, (*range(1, slots), poll_id))
+    cursor.execute("""
+        REPLACE INTO poll_counter_slots (poll_id, slots)
+        VALUES (%s, %s)
+    """, (poll_id, slots))
@@ -0,0 +1,141 @@
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+
+import mysql.connector
+from mysql.connector.errors import PoolError
+from mysql.connector.pooling import CNX_POOL_MAXSIZE, PooledMySQLConnection
+
+from query_recorder import RecordingConnection
+
+DRIVER_MODES = ('auto', 'pure', 'c')
+
+
+def use_pure(mode):
+    """Whether a driver mode ('auto', 'pure' or 'c') runs the pure-Python protocol implementation."""
+    if mode not in DRIVER_MODES:
+        raise ValueError(f"Unknown database driver mode {mode!r}, expected one of {', '.join(DRIVER_MODES)}")
+    if mode == 'c' and not mysql.connector.HAVE_CEXT:
+        raise RuntimeError("The mysql-connector C extension is not installed")
+    return mode == 'pure' or not mysql.connector.HAVE_CEXT
+
+
+def pool_name(config):
+    """A connection pool name unique to one server, database and user."""
+    key = repr(sorted((name, str(value)) for name, value in config.items()))
+    return 'poll-' + hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+
+def driver_connection(connection):
+    """The driver connection behind the query recorder's and the pool's wrappers."""
+    if isinstance(connection, RecordingConnection):
+        connection = connection.driver_connection
+    if isinstance(connection, PooledMySQLConnection):
+        connection = connection._cnx
+    return connection
+
+
+class PreparedStatements:
+    """Server-side prepared statements of one connection, by SQL text.
+
+    Each statement gets its own prepared cursor, kept open as long as the
+    connection lives, so executing it again sends only the parameters. The
+    least recently used statement is closed beyond ``max_size``. The driver
+    recognizes a repeat by the identity of the SQL string, so callers pass
+    module-level constants.
+    """
+
+    def __init__(self, connection, max_size=32):
+        self._connection = connection
+        self.max_size = max_size
+        self.connection_id = getattr(connection, 'connection_id', None)
+        self._cursors = OrderedDict()
+
+    def cursor(self, sql):
+        cursor = self._cursors.get(sql)
+        if cursor is None:
+            cursor = self._cursors[sql] = self._connection.cursor(prepared=True)
+            while len(self._cursors) > self.max_size:
+                _, evicted = self._cursors.popitem(last=False)
+                evicted.close()
+        else:
+            self._cursors.move_to_end(sql)
+        return cursor
+
+    def __len__(self):
+        return len(self._cursors)
+
+
+class DatabaseDriver:
+    """How the app talks to MySQL: driver implementation, pooling and prepared statements.
+
+    ``mode`` picks the pure-Python driver, the C extension, or the C
+    extension when it is installed ('auto'). With ``pool_size`` connections
+    are reused from a pool per server, and the hot statements run through
+    ``execute`` are prepared once per pooled connection. Without a pool every
+    connection lives for one request, so preparing would only add round
+    trips and ``execute`` sends plain statements.
+    """
+
+    def __init__(self, mode='auto', pool_size=0, prepared=True, max_statements=32):
+        self.mode = mode
+        self.pool_size = pool_size
+        self.prepared = prepared
+        self.max_statements = max_statements
+        self._lock = threading.Lock()
+        self._statements = weakref.WeakKeyDictionary()
+
+    def configure(self, mode='auto', pool_size=0, prepared=True, max_statements=32):
+        if not 0 <= pool_size <= CNX_POOL_MAXSIZE:
+            raise ValueError(f"Connection pool size must be between 0 and {CNX_POOL_MAXSIZE}")
+        use_pure(mode)
+        self.mode = mode
+        self.pool_size = pool_size
+        self.prepared = prepared
+        self.max_statements = max_statements
+
+    @property
+    def use_pure(self):
+        return use_pure(self.mode)
+
+    @property
+    def prepares(self):
+        return bool(self.prepared and self.pool_size)
+
+    def connect(self, config):
+        """Open a connection for ``config``, from its pool when pooling is on."""
+        if not self.pool_size:
+            return mysql.connector.connect(**config)
+        try:
+            # Sessions are not reset on return to the pool: a reset would drop the prepared statements
+            return mysql.connector.connect(**config, pool_name=pool_name(config), pool_size=self.pool_size,
+                                           pool_reset_session=False)
+        except PoolError:
+            # Every pooled connection is busy; serve this request on a connection of its own
+            return mysql.connector.connect(**config)
+
+    def statements(self, connection):
+        """The prepared statement cache of a connection."""
+        raw = driver_connection(connection)
+        with self._lock:
+            statements = self._statements.get(raw)
+            # A reconnect (the pool does that for dropped connections) loses every prepared statement
+            if statements is None or statements.connection_id != getattr(raw, 'connection_id', None):
+                statements = self._statements[raw] = PreparedStatements(raw, self.max_statements)
+        return statements
+
+    def execute(self, connection, cursor, sql, params=()):
+        """Run a hot statement, prepared on ``connection`` when enabled, else on ``cursor``.
+
+        Returns the cursor holding the result. Prepared cursors belong to
+        the connection's cache: read the result, but do not close them.
+        """
+        if not self.prepares:
+            cursor.execute(sql, params)
+            return cursor
+        prepared = self.statements(connection).cursor(sql)
+        if isinstance(connection, RecordingConnection):
+            prepared = connection.record(prepared)
+        prepared.execute(sql, params)
+        return prepared
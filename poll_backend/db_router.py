@@ -0,0 +1,148 @@
+import itertools
+import threading
+import time
+
+# Carries a client's read-your-writes marker between requests, to whichever worker serves them
+READ_PRIMARY_COOKIE = 'read_primary_until'
+READ_PRIMARY_HEADER = 'X-Read-Primary-Until'
+
+
+def mysql_replica_lag(connection):
+    """Return how many seconds a MySQL replica is behind, or None if it is not replicating."""
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute("SHOW REPLICA STATUS")
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    if not rows:
+        return None
+    lag = rows[0].get('Seconds_Behind_Source', rows[0].get('Seconds_Behind_Master'))
+    return float(lag) if lag is not None else None
+
+
+def parse_replica_hosts(value, base_config):
+    """Build replica configs from "host[:port],host[:port]" on top of the primary config."""
+    replicas = []
+    for entry in (value or '').split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        config = dict(base_config)
+        host, _, port = entry.partition(':')
+        config['host'] = host
+        if port:
+            config['port'] = int(port)
+        replicas.append(config)
+    return replicas
+
+
+class ReplicaRouter:
+    """Chooses the primary or a read replica for each database connection.
+
+    Routes listed in ``read_routes`` read from replicas; everything else
+    (writes, background jobs, unknown routes) uses the primary. A replica
+    is only used while its measured lag is at most ``max_lag`` seconds.
+    Lag is probed every ``lag_check_interval`` seconds by a daemon thread
+    (with ``background``; otherwise by calling ``probe_all``), never on the
+    request path; until a replica has been probed it is not used, and a
+    failing probe is logged. After a write the client is handed a
+    ``read_primary_until`` marker (``write_marker``) to send back, so its
+    reads go to the primary for ``read_your_writes_window`` seconds on
+    whichever worker serves them.
+    """
+
+    def __init__(self, connect, read_routes=(), replicas=(), max_lag=5.0,
+                 lag_check_interval=5.0, read_your_writes_window=10.0,
+                 lag_probe=mysql_replica_lag, clock=time.time, background=True):
+        self._connect = connect
+        self.read_routes = set(read_routes)
+        self.replicas = list(replicas)
+        self.max_lag = max_lag
+        self.lag_check_interval = lag_check_interval
+        self.read_your_writes_window = read_your_writes_window
+        self.lag_probe = lag_probe
+        self.background = background
+        self._clock = clock
+        self._cond = threading.Condition()
+        # replica index -> (lag in seconds or None, error message or None)
+        self._lag = {}
+        self._next = itertools.count()
+        self._thread = None
+
+    def configure(self, replicas):
+        with self._cond:
+            self.replicas = list(replicas)
+            self._lag.clear()
+            self._cond.notify()
+            if self.replicas and self.background and self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='replica-lag-probe', daemon=True)
+                self._thread.start()
+
+    def write_marker(self):
+        """Time until which a client that just wrote should read from the primary."""
+        return self._clock() + self.read_your_writes_window
+
+    def reads_own_writes(self, read_primary_until):
+        """Whether a client's read_primary_until marker is still in the future."""
+        try:
+            return float(read_primary_until) > self._clock()
+        except (TypeError, ValueError):
+            return False
+
+    def probe(self, index):
+        """Measure one replica's lag now; returns (lag or None, error or None)."""
+        replica = self.replicas[index]
+        try:
+            connection = self._connect(**replica)
+            try:
+                lag = self.lag_probe(connection)
+            finally:
+                connection.close()
+        except Exception as e:
+            return None, str(e)
+        if lag is None:
+            return None, 'not replicating'
+        return lag, None
+
+    def probe_all(self):
+        """Probe every replica, logging the ones that cannot be used."""
+        replicas = list(self.replicas)
+        results = {index: self.probe(index) for index in range(len(replicas))}
+        with self._cond:
+            if self.replicas != replicas:
+                return
+            for index, (lag, error) in results.items():
+                previous = self._lag.get(index)
+                if error and (previous is None or previous[1] != error):
+                    print(f"Replica {replicas[index].get('host')} lag probe failed, reading from the primary: {error}")
+                elif previous is not None and previous[1] and not error:
+                    print(f"Replica {replicas[index].get('host')} lag probe recovered ({lag}s behind)")
+            self._lag = results
+
+    def _run(self):
+        while True:
+            try:
+                self.probe_all()
+            except Exception as e:
+                print(f"Replica lag probe failed: {e}")
+            with self._cond:
+                self._cond.wait(self.lag_check_interval)
+
+    def lag(self, index):
+        """Return the last probed lag of a replica, or None if unknown or failing."""
+        probed = self._lag.get(index)
+        return probed[0] if probed is not None else None
+
+    def healthy_replicas(self):
+        return [index for index in range(len(self.replicas))
+                if (lag := self.lag(index)) is not None and lag <= self.max_lag]
+
+    def choose(self, primary_config, endpoint=None, read_primary_until=None):
+        """Return the connection config to use for a request to ``endpoint``."""
+        if not self.replicas or endpoint not in self.read_routes or self.reads_own_writes(read_primary_until):
+            return primary_config
+        healthy = self.healthy_replicas()
+        if not healthy:
+            return primary_config
+        return self.replicas[healthy[next(self._next) % len(healthy)]]
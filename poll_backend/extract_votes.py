@@ -0,0 +1,36 @@
+import argparse
+import os
+import sys
+
+import mysql.connector
+
+import app
+from vote_export import extract_votes
+
+def main():
+    parser = argparse.ArgumentParser(description="Export new votes to columnar files for offline analytics.")
+    parser.add_argument('--output', default=os.getenv('VOTE_EXPORT_DIR') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'vote_export'), help='directory the files are written to')
+    parser.add_argument('--batch-size', type=int, default=10000, help='votes read per statement')
+    args = parser.parse_args()
+
+    app.load_config()
+    shard_map = app.vote_shard_map
+    if shard_map.enabled:
+        sources = {f'shard{index}': config for index, config in enumerate(shard_map.shards)}
+    else:
+        sources = {'main': app.DB_CONFIG}
+
+    for source, config in sources.items():
+        connection = mysql.connector.connect(**config)
+        cursor = connection.cursor()
+        try:
+            exported = extract_votes(cursor, args.output, source=source, batch_size=args.batch_size)
+        finally:
+            cursor.close()
+            connection.close()
+        print(f"Exported {exported} votes from {source}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import hashlib
+import ipaddress
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# What a vote is counted by: its address, the address's network (/24, or /48 for IPv6) and the email domain
+IP = 'ip'
+SUBNET = 'subnet'
+DOMAIN = 'domain'
+REASONS = (IP, SUBNET, DOMAIN)
+
+FLAG = 'flag'
+QUARANTINE = 'quarantine'
+
+
+def vote_keys(ip_address, voter_email, ignored_domains=()):
+    """The (reason, key) pairs a vote counts towards; unparseable addresses and ignored domains are left out."""
+    keys = []
+    try:
+        address = ipaddress.ip_address(ip_address or '')
+    except ValueError:
+        address = None
+    if address is not None:
+        prefix = 24 if address.version == 4 else 48
+        keys.append((IP, str(address)))
+        keys.append((SUBNET, str(ipaddress.ip_network(f'{address}/{prefix}', strict=False))))
+    domain = (voter_email or '').rpartition('@')[2].strip().lower()
+    if domain and domain not in ignored_domains:
+        keys.append((DOMAIN, domain))
+    return keys
+
+
+class WindowedCountMin:
+    """Approximate counts per key over the last ``buckets`` time buckets, in fixed memory.
+
+    A count-min sketch (``depth`` rows of ``width`` counters) per bucket;
+    a bucket's counters are zeroed when the ring comes back round to it. A
+    key's count is the smallest of its ``depth`` counters summed over the
+    live buckets, so it can only be overestimated, by colliding keys.
+    """
+
+    def __init__(self, buckets, width, depth):
+        self.counts = np.zeros((buckets, depth, width), dtype=np.uint32)
+        # Bucket number each ring slot currently holds
+        self.numbers = np.full(buckets, -1, dtype=np.int64)
+        self._rows = np.arange(depth)
+
+    def columns(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=4 * len(self._rows)).digest()
+        return np.frombuffer(digest, dtype=np.uint32) % self.counts.shape[2]
+
+    def add(self, key, bucket):
+        """Count ``key`` once in ``bucket`` and return its count over the window."""
+        slot = bucket % len(self.numbers)
+        if self.numbers[slot] != bucket:
+            self.counts[slot] = 0
+            self.numbers[slot] = bucket
+        columns = self.columns(key)
+        self.counts[slot, self._rows, columns] += 1
+        live = self.numbers > bucket - len(self.numbers)
+        return int(self.counts[live][:, self._rows, columns].sum(axis=0).min())
+
+
+class FraudDetector:
+    """Streaming ballot-stuffing check for submit_vote.
+
+    Each poll keeps windowed count-min counters of its recent votes by IP,
+    network and email domain. ``check`` counts a vote and returns the
+    reasons whose count over the last ``window`` seconds passed its
+    threshold in ``thresholds`` (a missing or zero threshold disables that
+    check). Memory is fixed per poll; up to ``max_polls`` polls are kept,
+    least recently voted on dropped first.
+    """
+
+    def __init__(self, thresholds=None, window=60.0, buckets=6, width=256, depth=4, ignored_domains=(),
+                 max_polls=1000, clock=time.monotonic):
+        self.thresholds = dict(thresholds or {})
+        self.window = window
+        self.buckets = buckets
+        self.width = width
+        self.depth = depth
+        self.ignored_domains = frozenset(domain.lower() for domain in ignored_domains)
+        self.max_polls = max_polls
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._polls = OrderedDict()
+
+    @property
+    def enabled(self):
+        return any(self.thresholds.values())
+
+    def check(self, poll_id, ip_address, voter_email):
+        """Count a vote and return the sorted reasons it looks like ballot stuffing."""
+        if not self.enabled:
+            return []
+        bucket = int(self._clock() * self.buckets // self.window)
+        keys = [(reason, key) for reason, key in vote_keys(ip_address, voter_email, self.ignored_domains)
+                if self.thresholds.get(reason)]
+        with self._lock:
+            counters = self._polls.get(poll_id)
+            if counters is None:
+                counters = self._polls[poll_id] = WindowedCountMin(self.buckets, self.width, self.depth)
+                if len(self._polls) > self.max_polls:
+                    self._polls.popitem(last=False)
+            else:
+                self._polls.move_to_end(poll_id)
+            reasons = {reason for reason, key in keys
+                       if counters.add(f'{reason}:{key}', bucket) > self.thresholds[reason]}
+        return sorted(reasons)
+
+    def discard(self, poll_id):
+        with self._lock:
+            self._polls.pop(poll_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._polls.clear()
@@ -0,0 +1,217 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, jsonify, make_response, request
+
+# Longest Idempotency-Key accepted
+MAX_KEY_LENGTH = 255
+
+
+class StoredResponse:
+    """A finished response kept for replay."""
+
+    __slots__ = ('fingerprint', 'status', 'body', 'mimetype', 'expires_at')
+
+    def __init__(self, fingerprint, status, body, mimetype, expires_at):
+        self.fingerprint = fingerprint
+        self.status = status
+        self.body = body
+        self.mimetype = mimetype
+        self.expires_at = expires_at
+
+
+class IdempotencyStore:
+    """Responses by idempotency key, kept in the idempotency_keys table for ``ttl`` seconds.
+
+    The table is shared by every worker, so a retry is replayed whichever
+    worker it reaches. ``begin`` claims a key with an insert on its primary
+    key; while the first request runs, retries with the same key get
+    ``'pending'``, until the claim expires after ``pending_ttl`` seconds
+    (for a worker that died mid-request). ``connect`` opens a database
+    connection; each call uses its own. The ``cache_size`` most recently
+    finished responses are also kept in memory, so a retry that reaches the
+    same worker is replayed without a database round trip.
+    """
+
+    def __init__(self, connect=None, ttl=86400.0, pending_ttl=60.0, cache_size=10000, clock=time.time):
+        self.connect = connect
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+        self.cache_size = cache_size
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._purged_at = clock()
+        self._finished = OrderedDict()
+
+    def _cached(self, key):
+        with self._lock:
+            stored = self._finished.get(key)
+            if stored is None:
+                return None
+            if stored.expires_at <= self._clock():
+                del self._finished[key]
+                return None
+            self._finished.move_to_end(key)
+            return stored
+
+    def _remember(self, key, stored):
+        with self._lock:
+            self._finished[key] = stored
+            self._finished.move_to_end(key)
+            while len(self._finished) > self.cache_size:
+                self._finished.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._finished.clear()
+
+    @staticmethod
+    def key_hash(scope):
+        return hashlib.sha256(repr(scope).encode('utf-8')).digest()
+
+    def _run(self, work):
+        connection = self.connect()
+        cursor = connection.cursor()
+        try:
+            result = work(cursor)
+            connection.commit()
+            return result
+        finally:
+            cursor.close()
+            connection.close()
+
+    def begin(self, scope, fingerprint):
+        """Return ('new', None), ('pending', None), ('mismatch', None) or ('replay', StoredResponse)."""
+        key = self.key_hash(scope)
+        stored = self._cached(key)
+        if stored is not None:
+            return ('replay', stored) if stored.fingerprint == fingerprint else ('mismatch', None)
+
+        def claim(cursor):
+            now = self._clock()
+            cursor.execute("""
+                INSERT IGNORE INTO idempotency_keys (key_hash, fingerprint, expires_at)
+                VALUES (%s, %s, %s)
+            """, (key, fingerprint, now + self.pending_ttl))
+            if cursor.rowcount:
+                return 'new', None
+            cursor.execute("""
+                SELECT fingerprint, status, body, mimetype, expires_at
+                FROM idempotency_keys
+                WHERE key_hash = %s
+            """, (key,))
+            row = cursor.fetchone()
+            if row is None:
+                # Purged between the two statements
+                return 'pending', None
+            stored_fingerprint, status, body, mimetype, expires_at = row
+            if expires_at <= now:
+                # Take over the expired entry, unless another request just did
+                cursor.execute("""
+                    UPDATE idempotency_keys
+                    SET fingerprint = %s, status = NULL, body = NULL, mimetype = NULL, expires_at = %s
+                    WHERE key_hash = %s AND expires_at = %s
+                """, (fingerprint, now + self.pending_ttl, key, expires_at))
+                return ('new', None) if cursor.rowcount else ('pending', None)
+            if status is None:
+                return 'pending', None
+            if stored_fingerprint != fingerprint:
+                return 'mismatch', None
+            stored = StoredResponse(stored_fingerprint, status, bytes(body), mimetype, expires_at)
+            self._remember(key, stored)
+            return 'replay', stored
+
+        return self._run(claim)
+
+    def finish(self, scope, fingerprint, status, body, mimetype):
+        key = self.key_hash(scope)
+        expires_at = self._clock() + self.ttl
+
+        def store(cursor):
+            cursor.execute("""
+                UPDATE idempotency_keys
+                SET status = %s, body = %s, mimetype = %s, expires_at = %s
+                WHERE key_hash = %s AND fingerprint = %s
+            """, (status, body, mimetype, expires_at, key, fingerprint))
+            return cursor.rowcount
+
+        if self._run(store):
+            self._remember(key, StoredResponse(fingerprint, status, bytes(body), mimetype, expires_at))
+
+    def abandon(self, scope):
+        self._run(lambda cursor: cursor.execute(
+            "DELETE FROM idempotency_keys WHERE key_hash = %s AND status IS NULL", (self.key_hash(scope),)))
+
+    def purge_due(self, interval):
+        """Whether ``interval`` seconds have passed since the last purge (claiming the purge if so)."""
+        with self._lock:
+            now = self._clock()
+            if now - self._purged_at < interval:
+                return False
+            self._purged_at = now
+            return True
+
+    def purge(self, batch_size=1000):
+        """Delete expired entries, ``batch_size`` at a time; returns how many were deleted."""
+        deleted = 0
+        while True:
+            def delete(cursor):
+                cursor.execute("SELECT key_hash FROM idempotency_keys WHERE expires_at <= %s LIMIT %s",
+                               (self._clock(), batch_size))
+                keys = [row[0] for row in cursor.fetchall()]
+                if keys:
+                    placeholders = ', '.join(['%s'] * len(keys))
+                    cursor.execute(f"DELETE FROM idempotency_keys WHERE key_hash IN ({placeholders})", keys)
+                return len(keys)
+
+            count = self._run(delete)
+            deleted += count
+            if count < batch_size:
+                return deleted
+
+
+def idempotent(store):
+    """Replay the stored response when a request repeats an Idempotency-Key header.
+
+    Keys are scoped to the method, path and (when logged in) user, and
+    bound to a hash of the request body: reusing a key with a different body
+    is rejected. Server errors are not stored, so those requests can be
+    retried for real.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            key = request.headers.get('Idempotency-Key')
+            if not key:
+                return f(*args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return jsonify({'success': False, 'message': 'Idempotency-Key is too long'}), 400
+
+            scope = (request.method, request.path, g.get('current_user_id'), key)
+            fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+            state, stored = store.begin(scope, fingerprint)
+            if state == 'pending':
+                return jsonify({'success': False, 'message': 'A request with this Idempotency-Key is in progress'}), 409
+            if state == 'mismatch':
+                return jsonify({'success': False,
+                                'message': 'Idempotency-Key was already used for a different request'}), 422
+            if state == 'replay':
+                response = current_app.response_class(stored.body, status=stored.status, mimetype=stored.mimetype)
+                response.headers['Idempotent-Replayed'] = 'true'
+                return response
+
+            try:
+                response = make_response(f(*args, **kwargs))
+            except Exception:
+                store.abandon(scope)
+                raise
+            if response.status_code < 500:
+                store.finish(scope, fingerprint, response.status_code, response.get_data(), response.mimetype)
+            else:
+                store.abandon(scope)
+            return response
+        return decorated
+    return decorator
@@ -0,0 +1,74 @@
+"""Load offline (paper or kiosk) ballots into a poll from a CSV or NDJSON file.
+
+    python import_ballots.py <poll_id> <file> [--format csv|ndjson] [--chunk-size 1000]
+
+Each row is a vote body: voter_name, voter_email and the poll's ballot
+field (selected_option, selected_options or ranking; in CSV several option
+ids are separated by ';'), plus an optional ip_address. The file is
+streamed and written in chunks, each committed with one update of the
+option counters, and progress is printed as it goes. Emails that already
+voted are skipped, so running it again with the same file imports nothing.
+The poll must still be open.
+"""
+import argparse
+import sys
+import time
+
+import mysql.connector
+
+import app
+from ballot_import import BallotImport, ChunkWriter, PollFrozen, import_format, read_rows
+from lifecycle import close_timestamp
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('poll_id', type=int)
+    parser.add_argument('file')
+    parser.add_argument('--format', choices=('csv', 'ndjson'), help='default: from the file extension')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='ballots written per statement')
+    args = parser.parse_args()
+
+    fmt = args.format or import_format(args.file)
+    if fmt is None:
+        parser.error('cannot tell the format from the file name; pass --format')
+
+    app.load_config()
+    connection = mysql.connector.connect(**dict(app.DB_CONFIG, autocommit=False))
+    cursor = connection.cursor()
+    votes = None
+    try:
+        cursor.execute("SELECT end_date, voting_method FROM polls WHERE id = %s", (args.poll_id,))
+        poll = cursor.fetchone()
+        if not poll:
+            print(f"No poll with id {args.poll_id}")
+            return 1
+        close_at = close_timestamp(poll[0])
+        if close_at is not None and close_at <= time.time():
+            print(f"Poll {args.poll_id} has ended; its results are frozen")
+            return 1
+
+        cursor.execute(app.POLL_OPTION_IDS_SQL, (args.poll_id,))
+        option_ids = [row[0] for row in cursor.fetchall()]
+        votes = app.open_poll_votes(args.poll_id, cursor, connection)
+        writer = ChunkWriter(connection, cursor, votes, args.poll_id)
+        importer = BallotImport(poll[1], option_ids, writer.existing_emails(), chunk_size=args.chunk_size,
+                                progress=lambda stats: print(stats, flush=True))
+        with open(args.file, encoding='utf-8', newline='') as lines:
+            stats = importer.run(read_rows(lines, fmt), writer)
+    except PollFrozen:
+        print(f"Poll {args.poll_id} closed during the import; {importer.stats}")
+        return 1
+    finally:
+        if votes:
+            votes.close()
+        cursor.close()
+        connection.close()
+
+    for error in stats.errors:
+        print(f"line {error['line']}: {error['message']}")
+    if stats.invalid > len(stats.errors):
+        print(f"... and {stats.invalid - len(stats.errors)} more invalid rows")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
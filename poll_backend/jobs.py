@@ -0,0 +1,369 @@
+import fcntl
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+
+def stopped_process_files(path):
+    """``path`` and the ``<path>.<pid>`` files of this process and of processes that are no longer running.
+
+    Used by per-process state files (job journals, trending counts) to find
+    the files a starting worker should take over.
+    """
+    directory = os.path.dirname(path) or '.'
+    prefix = os.path.basename(path)
+    paths = []
+    for name in os.listdir(directory):
+        if name == prefix:
+            # Written before the files were kept per process
+            paths.append(os.path.join(directory, name))
+            continue
+        suffix = name[len(prefix) + 1:] if name.startswith(prefix + '.') else ''
+        if not suffix.isdigit():
+            continue
+        pid = int(suffix)
+        if pid != os.getpid():
+            try:
+                os.kill(pid, 0)
+                continue
+            except ProcessLookupError:
+                pass
+            except PermissionError:
+                # Running under another user
+                continue
+        paths.append(os.path.join(directory, name))
+    return paths
+
+
+class Job:
+    """One queued call of a registered job type."""
+
+    __slots__ = ('id', 'name', 'args', 'kwargs', 'attempt', 'run_at', 'enqueued_at', 'traceparent')
+
+    def __init__(self, name, args=(), kwargs=None, job_id=None, attempt=0, run_at=None, enqueued_at=None,
+                 traceparent=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.name = name
+        self.args = list(args)
+        self.kwargs = dict(kwargs or {})
+        self.attempt = attempt
+        self.enqueued_at = enqueued_at if enqueued_at is not None else time.time()
+        self.run_at = run_at if run_at is not None else self.enqueued_at
+        self.traceparent = traceparent
+
+    def to_record(self):
+        return {'id': self.id, 'name': self.name, 'args': self.args, 'kwargs': self.kwargs,
+                'attempt': self.attempt, 'run_at': self.run_at, 'enqueued_at': self.enqueued_at,
+                'traceparent': self.traceparent}
+
+    @classmethod
+    def from_record(cls, record):
+        return cls(record['name'], record['args'], record['kwargs'], record['id'],
+                   record['attempt'], record['run_at'], record['enqueued_at'], record.get('traceparent'))
+
+
+class JobType:
+    __slots__ = ('name', 'func', 'max_attempts', 'backoff', 'concurrency', 'process')
+
+    def __init__(self, name, func, max_attempts, backoff, concurrency, process):
+        self.name = name
+        self.func = func
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.concurrency = concurrency
+        self.process = process
+
+
+class JobRunner:
+    """In-process job queue for work that does not need to finish before the response.
+
+    Handlers ``enqueue`` a registered job type with JSON-serializable
+    arguments and return at once; a pool of ``workers`` daemon threads
+    (started on first use) runs due jobs in order. A failing job is retried
+    with exponential backoff (``backoff * 2 ** (attempt - 1)`` seconds) up to
+    ``max_attempts`` times. Job types can cap how many of them run at once
+    and can run in a process pool instead of a thread.
+
+    With ``queue_path`` every queued job is appended to a local journal
+    file (one per process) and marked done when it finishes, so jobs queued
+    when a process stopped run again after a restart. After every
+    ``compact_after`` finished jobs the journal is rewritten with only the
+    jobs still pending, so it does not grow with the process's uptime. With ``eager`` jobs
+    run inline in ``enqueue`` (used by the tests). With a ``tracer`` a job
+    queued during a traced request runs in a span of the same trace.
+    """
+
+    def __init__(self, workers=4, queue_path=None, process_workers=0, eager=False, clock=time.time, tracer=None,
+                 compact_after=1000):
+        self.workers = workers
+        self.queue_path = queue_path
+        self.compact_after = compact_after
+        self.process_workers = process_workers
+        self.eager = eager
+        self.tracer = tracer
+        self._clock = clock
+        self._types = {}
+        self._cond = threading.Condition()
+        self._heap = []
+        self._sequence = itertools.count()
+        self._running = Counter()
+        self._threads = []
+        self._stopping = False
+        self._process_pool = None
+        self._journal_lock = threading.Lock()
+        # Records of the jobs in this process's journal that have not finished
+        self._journaled = {}
+        self._finished_since_compaction = 0
+        self._counts = defaultdict(Counter)
+        self._wait_ms = defaultdict(float)
+        self._run_ms = defaultdict(float)
+
+    def register(self, name, func, max_attempts=5, backoff=1.0, concurrency=None, process=False):
+        self._types[name] = JobType(name, func, max_attempts, backoff, concurrency, process)
+        return func
+
+    def job(self, name=None, **options):
+        """Decorator registering a function as a job type (named after the function by default)."""
+        def decorator(func):
+            return self.register(name or func.__name__, func, **options)
+        return decorator
+
+    def enqueue(self, name, *args, **kwargs):
+        """Queue a call of job type ``name`` and return the job id."""
+        if name not in self._types:
+            raise KeyError(f"Unknown job type {name!r}")
+        job = Job(name, args, kwargs, enqueued_at=self._clock(),
+                  traceparent=self.tracer.traceparent() if self.tracer else None)
+        if self.eager:
+            self._execute(job, retry=False)
+            return job.id
+        self.start()
+        self._journal({'op': 'add', 'job': job.to_record()})
+        self._push(job)
+        return job.id
+
+    def start(self):
+        """Start the worker threads, first re-queueing jobs left in the journal file."""
+        with self._cond:
+            if self._threads:
+                return
+            self._stopping = False
+            for job in self._recover():
+                self._push_locked(job)
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'job-worker-{index}', daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop the workers after their current job; queued jobs stay in the journal."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout)
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False)
+            self._process_pool = None
+
+    def drain(self, timeout=5.0):
+        """Wait until no job is queued or running; returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._heap and not sum(self._running.values()), timeout)
+
+    def stats(self):
+        """Queue depth, outcome counts and average latencies, per job type and overall."""
+        with self._cond:
+            depth = Counter(job.name for _, _, job in self._heap)
+            by_type = {}
+            for name in self._types:
+                counts = self._counts[name]
+                started = counts['started']
+                by_type[name] = {
+                    'queued': depth[name],
+                    'running': self._running[name],
+                    'completed': counts['completed'],
+                    'retried': counts['retried'],
+                    'failed': counts['failed'],
+                    'avg_wait_ms': round(self._wait_ms[name] / started, 1) if started else None,
+                    'avg_run_ms': round(self._run_ms[name] / started, 1) if started else None
+                }
+            running = sum(self._running.values())
+        return {
+            'queued': sum(depth.values()),
+            'running': running,
+            'completed': sum(stats['completed'] for stats in by_type.values()),
+            'failed': sum(stats['failed'] for stats in by_type.values()),
+            'jobs': by_type
+        }
+
+    def _push(self, job):
+        with self._cond:
+            self._push_locked(job)
+
+    def _push_locked(self, job):
+        heapq.heappush(self._heap, (job.run_at, next(self._sequence), job))
+        self._cond.notify()
+
+    def _take(self):
+        """Block until a due job whose type is below its concurrency limit is available."""
+        with self._cond:
+            while not self._stopping:
+                now = self._clock()
+                skipped = []
+                job = None
+                while self._heap and self._heap[0][0] <= now:
+                    item = heapq.heappop(self._heap)
+                    job_type = self._types.get(item[2].name)
+                    if job_type and job_type.concurrency and self._running[job_type.name] >= job_type.concurrency:
+                        skipped.append(item)
+                        continue
+                    job = item[2]
+                    break
+                for item in skipped:
+                    heapq.heappush(self._heap, item)
+                if job is not None:
+                    self._running[job.name] += 1
+                    return job
+                # Sleep until the next job is due; a finishing job wakes us for skipped ones
+                future = [run_at for run_at, _, _ in self._heap if run_at > now]
+                self._cond.wait(min(future) - now if future else None)
+            return None
+
+    def _work(self):
+        while True:
+            job = self._take()
+            if job is None:
+                return
+            try:
+                self._execute(job)
+            finally:
+                with self._cond:
+                    self._running[job.name] -= 1
+                    self._cond.notify_all()
+
+    def _execute(self, job, retry=True):
+        job_type = self._types.get(job.name)
+        if job_type is None:
+            print(f"Dropping job {job.id}: unknown job type {job.name!r}")
+            self._journal({'op': 'done', 'id': job.id})
+            return
+        started = self._clock()
+        counts = self._counts[job.name]
+        counts['started'] += 1
+        self._wait_ms[job.name] += max(started - job.run_at, 0) * 1000
+        try:
+            self._run(job_type, job)
+        except Exception as e:
+            job.attempt += 1
+            if retry and job.attempt < job_type.max_attempts:
+                counts['retried'] += 1
+                job.run_at = self._clock() + job_type.backoff * 2 ** (job.attempt - 1)
+                print(f"Job {job.name} failed (attempt {job.attempt}), retrying: {e}")
+                self._journal({'op': 'add', 'job': job.to_record()})
+                self._push(job)
+            else:
+                counts['failed'] += 1
+                print(f"Job {job.name} failed after {job.attempt} attempts: {e}")
+                self._journal({'op': 'done', 'id': job.id})
+        else:
+            counts['completed'] += 1
+            self._journal({'op': 'done', 'id': job.id})
+        finally:
+            self._run_ms[job.name] += (self._clock() - started) * 1000
+
+    def _run(self, job_type, job):
+        if self.tracer and job.traceparent:
+            with self.tracer.resume(job.traceparent, f'job {job.name}', **{'job.attempt': job.attempt}):
+                self._call(job_type, job)
+        else:
+            self._call(job_type, job)
+
+    def _call(self, job_type, job):
+        if job_type.process:
+            self._processes().submit(job_type.func, *job.args, **job.kwargs).result()
+        else:
+            job_type.func(*job.args, **job.kwargs)
+
+    def _processes(self):
+        with self._cond:
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(max_workers=self.process_workers or None)
+            return self._process_pool
+
+    def _journal_path(self):
+        return f"{self.queue_path}.{os.getpid()}"
+
+    def _journal(self, entry):
+        if not self.queue_path:
+            return
+        with self._journal_lock:
+            if entry['op'] == 'add':
+                self._journaled[entry['job']['id']] = entry['job']
+            else:
+                self._journaled.pop(entry['id'], None)
+                self._finished_since_compaction += 1
+                if self._finished_since_compaction >= self.compact_after:
+                    # Jobs finish on the worker threads, so requests do not wait for the rewrite
+                    self._write_journal(self._journaled.values())
+                    return
+            with open(self._journal_path(), 'a') as journal:
+                journal.write(json.dumps(entry) + '\n')
+
+    def _write_journal(self, records):
+        """Atomically replace this process's journal with ``add`` entries for ``records``."""
+        own_path = self._journal_path()
+        temp_path = own_path + '.tmp'
+        with open(temp_path, 'w') as journal:
+            for record in records:
+                journal.write(json.dumps({'op': 'add', 'job': record}) + '\n')
+        os.replace(temp_path, own_path)
+        self._finished_since_compaction = 0
+
+    def _orphaned_journals(self):
+        """Journal files of this process and of processes that are no longer running."""
+        return stopped_process_files(self.queue_path)
+
+    def _recover(self):
+        """Take over the jobs left in this process's journal and those of stopped processes.
+
+        Every process appends to its own ``<queue_path>.<pid>`` journal, so
+        workers sharing ``queue_path`` never replay or compact each other's
+        live queue. The journals of processes that are gone are adopted under
+        an exclusive lock, so only one worker runs their jobs.
+        """
+        if not self.queue_path:
+            return []
+        pending = {}
+        with self._journal_lock, open(self.queue_path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                adopted = self._orphaned_journals()
+                for path in adopted:
+                    with open(path) as journal:
+                        for line in journal:
+                            try:
+                                entry = json.loads(line)
+                            except ValueError:
+                                # A torn last line from a crash mid-write
+                                continue
+                            if entry['op'] == 'add':
+                                pending[entry['job']['id']] = entry['job']
+                            else:
+                                pending.pop(entry['id'], None)
+                self._journaled = dict(pending)
+                self._write_journal(pending.values())
+                own_path = self._journal_path()
+                for path in adopted:
+                    if path != own_path:
+                        os.remove(path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return [Job.from_record(record) for record in pending.values()]
@@ -0,0 +1,116 @@
+import datetime
+import heapq
+import threading
+import time
+
+
+def close_timestamp(end_date):
+    """Return the epoch time at which a poll with the given end_date closes.
+
+    Polls stay open until the end of their end date (23:59:59), matching what
+    the frontend shows. Accepts the DATE (setup_db.py) and DATETIME
+    (schema.sql) column types as well as ISO strings from the API.
+    """
+    if not end_date:
+        return None
+    if isinstance(end_date, str):
+        end_date = datetime.datetime.fromisoformat(end_date)
+    if not isinstance(end_date, datetime.datetime):
+        end_date = datetime.datetime.combine(end_date, datetime.time())
+    end_of_day = end_date.replace(hour=23, minute=59, second=59, microsecond=0)
+    # Naive values are UTC, like every other date the app stores and compares
+    if end_of_day.tzinfo is None:
+        end_of_day = end_of_day.replace(tzinfo=datetime.timezone.utc)
+    return end_of_day.timestamp()
+
+
+class PollLifecycle:
+    """Keeps a cached open/closed flag per poll and closes polls on schedule.
+
+    Upcoming close times live in a min-heap that a single daemon thread
+    sleeps on. When a poll's close time passes it is dropped and
+    ``on_close(poll_id)`` is called, so the vote path only needs a dict
+    lookup to know whether a poll still accepts votes. Only open polls are
+    kept; closed ones read as untracked. Without ``background`` no thread
+    is started and ``close_due()`` has to be called instead.
+    """
+
+    def __init__(self, on_close=None, clock=time.time, background=True):
+        self.on_close = on_close
+        self._clock = clock
+        self.background = background
+        self._cond = threading.Condition()
+        self._heap = []
+        # poll_id -> [end_date, close_at] of open polls
+        self._polls = {}
+        self._thread = None
+
+    def track(self, poll_id, end_date):
+        """Start tracking a poll, or reschedule it if its end_date changed."""
+        state = self._polls.get(poll_id)
+        if state is not None and state[0] == end_date:
+            return
+        self.schedule(poll_id, close_timestamp(end_date), end_date)
+
+    def schedule(self, poll_id, close_at, end_date=None):
+        """Set the epoch time at which a poll closes (None means never)."""
+        with self._cond:
+            if close_at is not None and close_at <= self._clock():
+                self._polls.pop(poll_id, None)
+                return
+            self._polls[poll_id] = [end_date, close_at]
+            if close_at is None:
+                return
+            heapq.heappush(self._heap, (close_at, poll_id))
+            if self._heap[0] == (close_at, poll_id):
+                self._cond.notify()
+            if self._thread is None and self.background:
+                self._thread = threading.Thread(target=self._run, name='poll-lifecycle', daemon=True)
+                self._thread.start()
+
+    def is_open(self, poll_id):
+        """Return True for a tracked open poll, or None if it is closed or not tracked."""
+        return True if poll_id in self._polls else None
+
+    def forget(self, poll_id):
+        """Stop tracking a poll, e.g. after it has been deleted."""
+        with self._cond:
+            self._polls.pop(poll_id, None)
+
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            close_at, poll_id = heapq.heappop(self._heap)
+            state = self._polls.get(poll_id)
+            # Skip entries left behind by rescheduled or forgotten polls
+            if state is None or state[1] != close_at:
+                continue
+            del self._polls[poll_id]
+            due.append(poll_id)
+        return due
+
+    def _close(self, due):
+        for poll_id in due:
+            if self.on_close is None:
+                continue
+            try:
+                self.on_close(poll_id)
+            except Exception as e:
+                print(f"Error closing poll {poll_id}: {str(e)}")
+
+    def close_due(self):
+        """Close every poll whose close time has passed and return their ids."""
+        with self._cond:
+            due = self._pop_due(self._clock())
+        self._close(due)
+        return due
+
+    def _run(self):
+        while True:
+            with self._cond:
+                due = self._pop_due(self._clock())
+                if not due:
+                    timeout = self._heap[0][0] - self._clock() if self._heap else None
+                    self._cond.wait(timeout)
+                    continue
+            self._close(due)
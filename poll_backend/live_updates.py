@@ -0,0 +1,95 @@
+import json
+import threading
+from collections import OrderedDict, deque
+
+
+def sse_frame(event, data, event_id=None):
+    """Format one Server-Sent Events frame."""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+class Channel:
+    __slots__ = ('events', 'next_id', 'waiters', 'cond')
+
+    def __init__(self, history, lock):
+        self.events = deque(maxlen=history)
+        self.next_id = 1
+        self.waiters = 0
+        self.cond = threading.Condition(lock)
+
+
+class UpdateBroker:
+    """In-process fan-out of poll events to streaming (SSE) clients.
+
+    Each share token has a channel holding the last ``history`` events with
+    increasing ids, so a client reconnecting with Last-Event-ID gets what it
+    missed. Waiters block on their channel's condition only, so an update to
+    one poll wakes only that poll's viewers. Channels nobody waits on are
+    dropped beyond ``max_channels``.
+    """
+
+    def __init__(self, history=50, max_channels=10000):
+        self.history = history
+        self.max_channels = max_channels
+        self._lock = threading.Lock()
+        self._channels = OrderedDict()
+
+    def _channel(self, key):
+        channel = self._channels.get(key)
+        if channel is None:
+            channel = self._channels[key] = Channel(self.history, self._lock)
+            excess = len(self._channels) - self.max_channels
+            if excess > 0:
+                idle = [other for other, state in self._channels.items() if not state.waiters and other != key]
+                for idle_key in idle[:excess]:
+                    del self._channels[idle_key]
+        self._channels.move_to_end(key)
+        return channel
+
+    def publish(self, key, event, data):
+        """Add an event to a channel, wake its waiters and return the event id."""
+        with self._lock:
+            channel = self._channel(key)
+            event_id = channel.next_id
+            channel.next_id += 1
+            channel.events.append((event_id, event, data))
+            channel.cond.notify_all()
+        return event_id
+
+    def last_id(self, key):
+        with self._lock:
+            channel = self._channels.get(key)
+            return channel.next_id - 1 if channel else 0
+
+    def _since(self, channel, last_id):
+        events = [entry for entry in channel.events if entry[0] > last_id]
+        oldest = channel.events[0][0] if channel.events else channel.next_id
+        complete = last_id < channel.next_id and last_id >= oldest - 1
+        return events, complete
+
+    def since(self, key, last_id):
+        """Return (events after last_id, complete); complete is False when some were already dropped."""
+        with self._lock:
+            channel = self._channels.get(key)
+            if channel is None:
+                return [], last_id == 0
+            return self._since(channel, last_id)
+
+    def wait(self, key, last_id, timeout):
+        """Block up to ``timeout`` seconds for events after ``last_id``; returns them (possibly none)."""
+        with self._lock:
+            channel = self._channel(key)
+            channel.waiters += 1
+            try:
+                channel.cond.wait_for(lambda: channel.next_id - 1 > last_id, timeout)
+            finally:
+                channel.waiters -= 1
+            return self._since(channel, last_id)[0]
+
+    def __len__(self):
+        return len(self._channels)
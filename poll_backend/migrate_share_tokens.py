@@ -0,0 +1,139 @@
+"""Convert polls.share_token and poll_results.share_token from text to BINARY(16) keys.
+
+    python migrate_share_tokens.py [--batch-size 5000]
+
+Run it once, with the app stopped, before starting a version that stores
+binary tokens. Each token is replaced by parse_share_token(token): tokens
+made by secrets.token_urlsafe(16) keep their exact URL form, and any other
+token maps to a hash of its text, which the app computes the same way, so
+every shared link keeps working. The share_token inside each frozen
+poll_results payload is rewritten to the URL form of its key too. Running it
+again does nothing.
+"""
+import argparse
+import json
+import sys
+
+import mysql.connector
+
+import app
+from share_tokens import canonical_share_token, parse_share_token
+
+TABLES = (('polls', 'id'), ('poll_results', 'poll_id'))
+
+def column_type(cursor, table):
+    cursor.execute("""
+        SELECT DATA_TYPE FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = 'share_token'
+    """, (table,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    data_type = row[0]
+    return (data_type.decode() if isinstance(data_type, (bytes, bytearray)) else data_type).lower()
+
+def unique_index(cursor, table):
+    """Name of the unique index on share_token alone."""
+    cursor.execute("""
+        SELECT INDEX_NAME FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = 'share_token' AND NON_UNIQUE = 0
+    """, (table,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def migrate_table(connection, table, key_column, batch_size=5000):
+    """Fill a share_key column from share_token in batches, then swap it in; returns the rows converted."""
+    cursor = connection.cursor()
+    try:
+        if column_type(cursor, table) == 'binary':
+            return 0
+        cursor.execute("SELECT COUNT(*) FROM information_schema.COLUMNS "
+                       "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = 'share_key'", (table,))
+        if not cursor.fetchone()[0]:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN share_key BINARY(16) NULL")
+
+        converted = 0
+        last_id = 0
+        while True:
+            cursor.execute(f"""
+                SELECT {key_column}, share_token FROM {table}
+                WHERE {key_column} > %s
+                ORDER BY {key_column}
+                LIMIT %s
+            """, (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            cursor.executemany(f"UPDATE {table} SET share_key = %s WHERE {key_column} = %s",
+                               [(parse_share_token(token), row_id) for row_id, token in rows])
+            connection.commit()
+            converted += len(rows)
+            last_id = rows[-1][0]
+
+        index = unique_index(cursor, table)
+        drop_index = f"DROP INDEX `{index}`, " if index else ""
+        cursor.execute(f"""
+            ALTER TABLE {table}
+                {drop_index}DROP COLUMN share_token,
+                CHANGE share_key share_token BINARY(16) NOT NULL,
+                ADD UNIQUE KEY share_token (share_token)
+        """)
+        return converted
+    finally:
+        cursor.close()
+
+def migrate_results_payloads(connection, batch_size=5000):
+    """Rewrite the share_token inside stored poll_results payloads to its URL form; returns the rows changed."""
+    cursor = connection.cursor()
+    try:
+        changed = 0
+        last_id = 0
+        while True:
+            cursor.execute("""
+                SELECT poll_id, results FROM poll_results
+                WHERE poll_id > %s
+                ORDER BY poll_id
+                LIMIT %s
+            """, (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            updates = []
+            for poll_id, results in rows:
+                if not results:
+                    # Claimed by a freeze that has not stored its payload yet
+                    continue
+                payload = json.loads(results)
+                token = payload['poll']['share_token']
+                canonical = canonical_share_token(token)
+                if canonical and canonical != token:
+                    payload['poll']['share_token'] = canonical
+                    updates.append((json.dumps(payload), poll_id))
+            if updates:
+                cursor.executemany("UPDATE poll_results SET results = %s WHERE poll_id = %s", updates)
+                connection.commit()
+            changed += len(updates)
+            last_id = rows[-1][0]
+        return changed
+    finally:
+        cursor.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=5000, help='rows converted per statement')
+    args = parser.parse_args()
+
+    app.load_config()
+    connection = mysql.connector.connect(**dict(app.DB_CONFIG, autocommit=False))
+    try:
+        for table, key_column in TABLES:
+            converted = migrate_table(connection, table, key_column, args.batch_size)
+            print(f"{table}: converted {converted} share tokens")
+        changed = migrate_results_payloads(connection, args.batch_size)
+        print(f"poll_results: rewrote the share token of {changed} stored results")
+    finally:
+        connection.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+"""Add the polls.voting_method column to a database created before approval and ranked polls.
+
+    python migrate_voting_method.py
+
+Run it once, with the app stopped, before starting a version that reads
+polls.voting_method, then run setup_db.py to create the ballots table.
+Existing polls become single-choice polls. Running it again does nothing.
+"""
+import sys
+
+import mysql.connector
+
+import app
+from tally import SINGLE
+
+def has_voting_method(cursor):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'polls' AND COLUMN_NAME = 'voting_method'
+    """)
+    return cursor.fetchone()[0] > 0
+
+def migrate(connection):
+    """Add the column unless it is already there; returns whether it was added."""
+    cursor = connection.cursor()
+    try:
+        if has_voting_method(cursor):
+            return False
+        cursor.execute(f"ALTER TABLE polls ADD COLUMN voting_method VARCHAR(16) NOT NULL DEFAULT '{SINGLE}' "
+                       f"AFTER end_date")
+        return True
+    finally:
+        cursor.close()
+
+def main():
+    app.load_config()
+    connection = mysql.connector.connect(**app.DB_CONFIG)
+    try:
+        if migrate(connection):
+            print("polls: added voting_method")
+        else:
+            print("polls: voting_method already exists")
+    finally:
+        connection.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+from array import array
+
+from share_tokens import format_share_token
+from tally import APPROVAL, SINGLE
+
+
+def percentage(votes, total_votes):
+    return round((votes / total_votes * 100) if total_votes > 0 else 0, 1)
+
+
+class Option:
+    """One poll option with its vote count."""
+
+    __slots__ = ('id', 'option_text', 'votes')
+
+    def __init__(self, option_id, option_text, votes=0):
+        self.id = option_id
+        self.option_text = option_text
+        self.votes = votes
+
+    def to_dict(self, total_votes=None):
+        """Serialize the option; with ``total_votes`` the percentage is included."""
+        data = {'id': self.id, 'option_text': self.option_text, 'votes': self.votes}
+        if total_votes is not None:
+            data['percentage'] = percentage(self.votes, total_votes)
+        return data
+
+
+class OptionCounts:
+    """The options of one poll, with the vote counts in a flat integer array.
+
+    Ids and counts live in ``array`` objects (8 bytes per option instead of
+    a dict and boxed ints per option), so tens of thousands of live polls fit
+    in a worker. Option records are created only when iterating.
+    """
+
+    __slots__ = ('ids', 'texts', 'votes')
+
+    def __init__(self, ids=(), texts=(), votes=()):
+        self.ids = array('q', ids)
+        self.texts = tuple(texts)
+        self.votes = array('q', votes)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build from (id, option_text, votes) rows; counts read as DECIMAL are converted to int."""
+        counts = cls()
+        texts = []
+        for option_id, option_text, votes in rows:
+            counts.ids.append(int(option_id))
+            texts.append(option_text)
+            counts.votes.append(int(votes or 0))
+        counts.texts = tuple(texts)
+        return counts
+
+    @property
+    def total_votes(self):
+        return sum(self.votes)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        for option_id, option_text, votes in zip(self.ids, self.texts, self.votes):
+            yield Option(option_id, option_text, votes)
+
+    def to_list(self, percentages=True, total_votes=None):
+        """Serialize the options, with percentages of the total (or of ``total_votes``) by default."""
+        if percentages and total_votes is None:
+            total_votes = self.total_votes
+        return [option.to_dict(total_votes if percentages else None) for option in self]
+
+
+class Poll:
+    """A poll row and its options."""
+
+    __slots__ = ('id', 'title', 'question', 'end_date', 'user_id', 'share_token',
+                 'creator_name', 'created_at', 'show_results_to_voters', 'voting_method', 'options', 'tally')
+
+    # Columns of the poll row read by from_row, in order
+    COLUMNS = ('p.id', 'p.title', 'p.question', 'p.end_date', 'p.user_id', 'p.share_token',
+               'u.username as creator_name', 'p.created_at', 'p.show_results_to_voters', 'p.voting_method')
+
+    def __init__(self, poll_id, title, question, end_date, user_id, share_token,
+                 creator_name, created_at, show_results_to_voters, voting_method=SINGLE, options=None):
+        self.id = poll_id
+        self.title = title
+        self.question = question
+        self.end_date = end_date
+        self.user_id = user_id
+        # Stored as BINARY(16) key bytes, served in URL form
+        self.share_token = format_share_token(share_token)
+        self.creator_name = creator_name
+        self.created_at = created_at
+        self.show_results_to_voters = bool(show_results_to_voters)
+        self.voting_method = voting_method or SINGLE
+        self.options = options if options is not None else OptionCounts()
+        # BallotTally of an approval or ranked poll, attached by the app before serializing
+        self.tally = None
+
+    @classmethod
+    def from_row(cls, row, option_rows=()):
+        """Build from a row of Poll.COLUMNS and (id, option_text, votes) option rows."""
+        return cls(*row, options=OptionCounts.from_rows(option_rows))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'question': self.question,
+            'end_date': str(self.end_date) if self.end_date else None,
+            'user_id': self.user_id,
+            'share_token': self.share_token,
+            'creator_name': self.creator_name,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'show_results_to_voters': self.show_results_to_voters,
+            'voting_method': self.voting_method
+        }
+
+    def results(self, percentages=True):
+        """Options and total_votes, plus rounds and winner for ranked polls."""
+        return poll_results(self.options, self.tally, percentages)
+
+    def payload(self):
+        """The public poll body: poll, options with percentages and total_votes."""
+        return {'poll': self.to_dict(), **self.results()}
+
+    def details(self):
+        """The owner details body."""
+        return {
+            'id': self.id,
+            'question': self.question,
+            'creator_name': self.creator_name,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            **self.results(percentages=False)
+        }
+
+
+def poll_results(options, tally=None, percentages=True):
+    """The result fields of a poll body from its OptionCounts and, for approval or ranked polls, its BallotTally.
+
+    Options count approvals on approval polls and first preferences on
+    ranked polls; total_votes counts voters, so approval percentages can
+    add up to more than 100.
+    """
+    if tally is None:
+        return {'options': options.to_list(percentages), 'total_votes': options.total_votes}
+    results = tally.results(list(options.ids))
+    if tally.method != APPROVAL:
+        results['total_votes'] = options.total_votes
+    return {'options': options.to_list(percentages, results['total_votes']), **results}
+
+
+class PollSummary:
+    """A row of an owner's poll list."""
+
+    __slots__ = ('id', 'title', 'question', 'end_date', 'share_token', 'created_at', 'option_count', 'total_votes')
+
+    def __init__(self, poll_id, title, question, end_date, share_token, created_at, option_count, total_votes):
+        self.id = poll_id
+        self.title = title
+        self.question = question
+        self.end_date = end_date
+        self.share_token = format_share_token(share_token)
+        self.created_at = created_at
+        self.option_count = option_count
+        self.total_votes = int(total_votes) if total_votes else 0
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'question': self.question,
+            'end_date': str(self.end_date) if self.end_date else None,
+            'share_token': self.share_token,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'option_count': self.option_count,
+            'total_votes': self.total_votes
+        }
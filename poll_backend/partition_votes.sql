@@ -0,0 +1,15 @@
+-- Partition the votes table by poll_id so each range holds the votes of a block
+-- of consecutive (similarly aged) polls. MySQL only; run once after schema.sql.
+-- Partitioned InnoDB tables cannot have foreign keys, and every unique key must
+-- include the partition column. Keep the ranges ahead of new polls with
+-- `python archive_votes.py --partitions`.
+USE poll_app;
+
+ALTER TABLE votes DROP FOREIGN KEY votes_ibfk_1, DROP FOREIGN KEY votes_ibfk_2;
+
+ALTER TABLE votes DROP PRIMARY KEY, ADD PRIMARY KEY (id, poll_id);
+
+ALTER TABLE votes PARTITION BY RANGE (poll_id) (
+  PARTITION p0 VALUES LESS THAN (100000),
+  PARTITION p_max VALUES LESS THAN MAXVALUE
+);
@@ -0,0 +1,233 @@
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+
+from flask import g, request
+
+# Request header carrying PROFILE_TOKEN; it profiles the request and unlocks the profile downloads
+PROFILE_TOKEN_HEADER = 'X-Profile-Token'
+
+# Allocation sites kept per route, by bytes allocated
+TOP_ALLOCATIONS = 20
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{os.path.splitext(os.path.basename(code.co_filename))[0]}:{code.co_name}"
+
+
+def collapse(frame):
+    """A stack in folded form: frame names from the outermost call to ``frame``, joined by ';'."""
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """Samples the stacks of registered threads every ``interval`` seconds.
+
+    One daemon thread reads ``sys._current_frames()`` and counts each
+    registered thread's collapsed stack; it sleeps whenever no thread is
+    registered, so unprofiled requests cost nothing. Green threads
+    (eventlet, gevent) share an OS thread and are not told apart.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._cond = threading.Condition()
+        # thread ident -> Counter of collapsed stacks
+        self._threads = {}
+        self._thread = None
+
+    def start(self):
+        """Start sampling the calling thread."""
+        with self._cond:
+            self._threads[threading.get_ident()] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def stop(self):
+        """Stop sampling the calling thread and return its stack counts."""
+        with self._cond:
+            return self._threads.pop(threading.get_ident(), Counter())
+
+    def sample(self):
+        frames = sys._current_frames()
+        with self._cond:
+            for ident, stacks in self._threads.items():
+                frame = frames.get(ident)
+                if frame is not None:
+                    stacks[collapse(frame)] += 1
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._threads:
+                    self._cond.wait()
+            # The first sample is one interval after start, like every later one
+            time.sleep(self.interval)
+            self.sample()
+
+
+class RollingProfile:
+    """Stack counts per route over the last ``window`` seconds, kept in ``buckets`` time slices."""
+
+    def __init__(self, window=600.0, buckets=10, clock=time.monotonic):
+        self.window = window
+        self.buckets = buckets
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (slice start, Counter of 'route;stack', Counter of requests per route)
+        self._slices = deque()
+
+    def _current(self):
+        now = self._clock()
+        width = self.window / self.buckets
+        while self._slices and self._slices[0][0] <= now - self.window:
+            self._slices.popleft()
+        if not self._slices or self._slices[-1][0] + width <= now:
+            self._slices.append((now, Counter(), Counter()))
+        return self._slices[-1]
+
+    def add(self, route, stacks):
+        """Count one profiled request of a route and its sampled stacks."""
+        with self._lock:
+            _, slice_stacks, requests = self._current()
+            requests[route] += 1
+            for stack, count in stacks.items():
+                slice_stacks[f"{route};{stack}"] += count
+
+    def requests(self):
+        """Profiled requests per route in the window."""
+        with self._lock:
+            self._current()
+            return dict(sum((requests for _, _, requests in self._slices), Counter()))
+
+    def folded(self, route=None):
+        """The window's stacks in folded format ('frame;frame count' lines) for flamegraph tools."""
+        with self._lock:
+            self._current()
+            stacks = sum((slice_stacks for _, slice_stacks, _ in self._slices), Counter())
+        if route is not None:
+            stacks = Counter({stack: count for stack, count in stacks.items() if stack.split(';', 1)[0] == route})
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def clear(self):
+        with self._lock:
+            self._slices.clear()
+
+
+class AllocationProfile:
+    """Bytes allocated per route during profiled requests, from tracemalloc snapshots.
+
+    Snapshots cover the whole process, so allocations of concurrent
+    requests are counted too; the totals are indicative under load.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    @staticmethod
+    def snapshot():
+        return tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+
+    def add(self, route, before, after):
+        sites = Counter()
+        for diff in after.compare_to(before, 'lineno'):
+            if diff.size_diff > 0:
+                frame = diff.traceback[0]
+                sites[f"{os.path.basename(frame.filename)}:{frame.lineno}"] += diff.size_diff
+        with self._lock:
+            stats = self._routes.setdefault(route, {'requests': 0, 'allocated_bytes': 0, 'sites': Counter()})
+            stats['requests'] += 1
+            stats['allocated_bytes'] += sum(sites.values())
+            stats['sites'].update(sites)
+
+    def to_dict(self):
+        with self._lock:
+            return {route: {
+                'requests': stats['requests'],
+                'allocated_bytes': stats['allocated_bytes'],
+                'bytes_per_request': stats['allocated_bytes'] // stats['requests'],
+                'top': [{'site': site, 'bytes': size} for site, size in stats['sites'].most_common(TOP_ALLOCATIONS)]
+            } for route, stats in self._routes.items()}
+
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+
+
+class RequestProfiler:
+    """Opt-in statistical profiling of Flask requests.
+
+    A request is profiled when it carries ``token`` in the X-Profile-Token
+    header, or at random with probability ``sample_rate``. Its stacks are
+    sampled every ``interval`` seconds and added to a RollingProfile; with
+    ``trace_allocations`` its allocations are added to an AllocationProfile.
+    Without a token the downloads are disabled.
+    """
+
+    def __init__(self, token=None, sample_rate=0.0, interval=0.005, window=600.0,
+                 trace_allocations=False, rng=random):
+        self.token = token
+        self.sample_rate = sample_rate
+        self.sampler = StackSampler(interval)
+        self.profile = RollingProfile(window)
+        self.allocations = AllocationProfile()
+        self.trace_allocations = trace_allocations
+        self._rng = rng
+        self._started_tracemalloc = False
+
+    def configure(self, token=None, sample_rate=0.0, interval=0.005, window=600.0, trace_allocations=False):
+        self.token = token
+        self.sample_rate = sample_rate
+        self.sampler.interval = interval
+        self.profile.window = window
+        self.trace_allocations = trace_allocations
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        elif not trace_allocations and self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    def authorized(self, token):
+        """Whether a request's X-Profile-Token matches the configured token."""
+        if not self.token or token is None:
+            return False
+        # compare_digest only accepts ASCII str; headers may carry any Latin-1 text
+        return hmac.compare_digest(token.encode(), self.token.encode())
+
+    def wanted(self, token):
+        return self.authorized(token) or (self.sample_rate > 0 and self._rng.random() < self.sample_rate)
+
+    def _before_request(self):
+        if not self.wanted(request.headers.get(PROFILE_TOKEN_HEADER)):
+            return
+        g._profile_route = request.endpoint or request.path
+        if self.trace_allocations and tracemalloc.is_tracing():
+            g._profile_snapshot = self.allocations.snapshot()
+        self.sampler.start()
+
+    def _teardown_request(self, exc):
+        route = g.pop('_profile_route', None)
+        if route is None:
+            return
+        self.profile.add(route, self.sampler.stop())
+        before = g.pop('_profile_snapshot', None)
+        if before is not None and tracemalloc.is_tracing():
+            self.allocations.add(route, before, self.allocations.snapshot())
@@ -0,0 +1,199 @@
+import re
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+from flask import g, has_request_context, request
+
+from tracing import CLIENT
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in 'raise' mode when a request breaks its query budget."""
+
+
+def statement_shape(sql):
+    """Normalize a statement so repeated executions of the same query compare equal."""
+    shape = re.sub(r"'(?:[^'\\]|\\.)*'", '?', sql)
+    shape = re.sub(r'\b\d+\b', '?', shape)
+    shape = re.sub(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)', '(...)', shape)
+    return ' '.join(shape.split())
+
+
+class QueryStats:
+    """Statements, database time and rows fetched during one request."""
+
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+        self.rows = 0
+        self.shapes = Counter()
+        # Statements the request may run on top of its route's budget
+        self.allowance = 0
+
+    def record(self, sql, elapsed, shape=None, budgeted=True):
+        self.statements += 1
+        self.db_time += elapsed
+        self.shapes[shape or statement_shape(sql)] += 1
+        if not budgeted:
+            self.allowance += 1
+
+    def repeated(self, threshold):
+        """Return the statement shapes executed at least ``threshold`` times."""
+        return [shape for shape, count in self.shapes.items() if count >= threshold]
+
+
+def traced(tracer, name, **attributes):
+    """A tracer span for a database call, or a null context when the request is not traced."""
+    if tracer is None or not tracer.active:
+        return nullcontext()
+    return tracer.span(name, CLIENT, **{'db.system': 'mysql', **attributes})
+
+
+class RecordingCursor:
+    """Cursor wrapper that times statements and counts fetched rows.
+
+    With a ``tracer`` each statement is also a span carrying its shape.
+    Statements of an unbudgeted cursor are recorded but not charged to
+    the route's query budget.
+    """
+
+    def __init__(self, cursor, stats, tracer=None, budgeted=True):
+        self._cursor = cursor
+        self._stats = stats
+        self._tracer = tracer
+        self._budgeted = budgeted
+
+    def execute(self, sql, params=()):
+        shape = statement_shape(sql)
+        start = time.perf_counter()
+        try:
+            with traced(self._tracer, 'db.query', **{'db.statement': shape}):
+                return self._cursor.execute(sql, params)
+        finally:
+            self._stats.record(sql, time.perf_counter() - start, shape, self._budgeted)
+
+    def executemany(self, sql, seq_params):
+        shape = statement_shape(sql)
+        start = time.perf_counter()
+        try:
+            with traced(self._tracer, 'db.query', **{'db.statement': shape, 'db.batch': True}):
+                return self._cursor.executemany(sql, seq_params)
+        finally:
+            self._stats.record(sql, time.perf_counter() - start, shape, self._budgeted)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._stats.rows += 1
+        return row
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._stats.rows += len(rows)
+        return rows
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class RecordingConnection:
+    """Connection wrapper whose cursors report into the request's QueryStats."""
+
+    def __init__(self, connection, stats, tracer=None, budgeted=True):
+        self._connection = connection
+        self._stats = stats
+        self._tracer = tracer
+        self._budgeted = budgeted
+
+    @property
+    def driver_connection(self):
+        return self._connection
+
+    def cursor(self, *args, **kwargs):
+        return self.record(self._connection.cursor(*args, **kwargs))
+
+    def record(self, cursor):
+        """Wrap a cursor of the underlying connection (such as a cached prepared one)."""
+        return RecordingCursor(cursor, self._stats, self._tracer, self._budgeted)
+
+    def commit(self):
+        with traced(self._tracer, 'db.commit'):
+            return self._connection.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class QueryRecorder:
+    """Records database usage per request and enforces per-route query budgets.
+
+    ``budgets`` maps endpoint names to the maximum number of statements the
+    route may run. ``mode`` is 'off', 'warn' (print a warning) or 'raise'
+    (raise QueryBudgetExceeded, meant for tests). A statement shape executed
+    ``repeat_threshold`` or more times in one request is reported as a
+    likely N+1 loop. A budget of None exempts a bulk route, whose
+    statements grow with its input, from both checks. Budgets cover a
+    route's usual path; optional steps (a feature the request uses, never
+    a loop) ``allow`` their statements where they run. Statements also
+    become spans of the ``tracer``, if any, while a request is traced.
+    """
+
+    def __init__(self, budgets=None, mode='warn', repeat_threshold=3, tracer=None):
+        self.budgets = dict(budgets or {})
+        self.mode = mode
+        self.repeat_threshold = repeat_threshold
+        self.tracer = tracer
+
+    def init_app(self, app):
+        app.after_request(self._after_request)
+
+    def wrap(self, connection, budgeted=True):
+        """Wrap a connection so its cursors record into the current request.
+
+        Statements of an unbudgeted connection (bookkeeping shared by
+        several routes) are recorded but not charged to the route's budget.
+        """
+        if not has_request_context():
+            return connection
+        if self.mode == 'off' and not (self.tracer and self.tracer.active):
+            return connection
+        return RecordingConnection(connection, self.current_stats(), self.tracer, budgeted)
+
+    def allow(self, statements):
+        """Let the current request run ``statements`` more than its route's budget."""
+        if has_request_context() and statements > 0:
+            self.current_stats().allowance += statements
+
+    def current_stats(self):
+        if '_query_stats' not in g:
+            g._query_stats = QueryStats()
+        return g._query_stats
+
+    def problems(self, endpoint, stats):
+        """Return a list of budget violations for a finished request."""
+        problems = []
+        if endpoint in self.budgets and self.budgets[endpoint] is None:
+            return problems
+        budget = self.budgets.get(endpoint)
+        if budget is not None and stats.statements > budget + stats.allowance:
+            allowed = f" + {stats.allowance} allowed" if stats.allowance else ""
+            problems.append(f"{endpoint} ran {stats.statements} statements (budget {budget}{allowed})")
+        for shape in stats.repeated(self.repeat_threshold):
+            problems.append(f"{endpoint} ran the same statement {stats.shapes[shape]} times: {shape}")
+        return problems
+
+    def _after_request(self, response):
+        stats = g.get('_query_stats')
+        if stats is None or self.mode == 'off':
+            return response
+
+        response.headers['Server-Timing'] = (
+            f'db;dur={stats.db_time * 1000:.2f};desc="{stats.statements} queries, {stats.rows} rows"'
+        )
+        problems = self.problems(request.endpoint, stats)
+        if problems and self.mode == 'raise':
+            raise QueryBudgetExceeded('; '.join(problems))
+        for problem in problems:
+            print(f"Query budget warning: {problem}")
+        return response
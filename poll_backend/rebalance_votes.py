@@ -0,0 +1,49 @@
+import argparse
+import sys
+
+import mysql.connector
+
+import app
+from vote_shards import move_poll_votes, pin_default_placements
+
+def main():
+    parser = argparse.ArgumentParser(description="Move a poll's votes to another vote shard while the app keeps running.")
+    parser.add_argument('poll_id', type=int, nargs='?', help='poll whose votes are moved')
+    parser.add_argument('target_shard', type=int, nargs='?', help='index of the shard in VOTE_SHARDS')
+    parser.add_argument('--batch-size', type=int, default=1000, help='votes copied or deleted per statement')
+    parser.add_argument('--pin', action='store_true',
+                        help='give polls without a vote_shards row one for their current shard; '
+                             'run this before changing VOTE_SHARDS')
+    args = parser.parse_args()
+    if not args.pin and (args.poll_id is None or args.target_shard is None):
+        parser.error('poll_id and target_shard are required unless --pin is given')
+
+    app.load_config()
+    shard_map = app.vote_shard_map
+    if not shard_map.enabled:
+        print("VOTE_SHARDS is not configured")
+        return 1
+    if args.pin:
+        main_connection = mysql.connector.connect(**app.DB_CONFIG)
+        try:
+            pinned = pin_default_placements(main_connection, len(shard_map.shards))
+        finally:
+            main_connection.close()
+        print(f"Pinned {pinned} polls to their current shard")
+        return 0
+    if not 0 <= args.target_shard < len(shard_map.shards):
+        print(f"Shard must be between 0 and {len(shard_map.shards) - 1}")
+        return 1
+
+    main_connection = mysql.connector.connect(**app.DB_CONFIG)
+    try:
+        copied = move_poll_votes(args.poll_id, args.target_shard, main_connection,
+                                 lambda shard: mysql.connector.connect(**shard_map.shards[shard]),
+                                 shard_map, batch_size=args.batch_size)
+    finally:
+        main_connection.close()
+    print(f"Moved {copied} votes of poll {args.poll_id} to shard {args.target_shard}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
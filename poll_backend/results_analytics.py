@@ -0,0 +1,136 @@
+import ipaddress
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Crosstab dimensions an owner can break votes down by
+DIMENSIONS = ('option', 'hour', 'day', 'domain', 'ip_prefix')
+
+
+def ip_prefix(address):
+    """Network of an address: /24 for IPv4, /48 for IPv6. Missing or invalid addresses give ''."""
+    try:
+        ip = ipaddress.ip_address(address or '')
+    except ValueError:
+        return ''
+    return str(ipaddress.ip_network(f'{ip}/{24 if ip.version == 4 else 48}', strict=False))
+
+
+def encode(values):
+    """Dictionary-encode values: return (sorted distinct values, int32 code per value)."""
+    labels, codes = np.unique(np.asarray(values), return_inverse=True)
+    return labels, codes.astype(np.int32)
+
+
+class VoteFrame:
+    """One poll's votes as compact columnar arrays.
+
+    Option ids, email domains and IP prefixes are dictionary-encoded: each
+    column is an int32 code array plus the array of distinct values, so a
+    poll with a million votes takes a few megabytes and crosstabs are
+    numpy group-bys over integer codes.
+    """
+
+    def __init__(self, option_ids, voted_at, domains, ip_prefixes):
+        self.size = len(voted_at)
+        self.voted_at = np.asarray(voted_at, dtype='datetime64[s]').astype(np.int64)
+        self.labels = {}
+        self.codes = {}
+        for name, values in (('option', np.asarray(option_ids, dtype=np.int64)),
+                             ('domain', np.asarray(domains, dtype=str)),
+                             ('ip_prefix', np.asarray(ip_prefixes, dtype=str))):
+            self.labels[name], self.codes[name] = encode(values)
+        # Set by the caller: who may read the frame and when it was cached
+        self.user_id = None
+        self.loaded_at = None
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build a frame from (option_id, voter_email, ip_address, voted_at) rows."""
+        return cls([row[0] for row in rows],
+                   [row[3] for row in rows],
+                   [row[1].rpartition('@')[2].lower() for row in rows],
+                   [ip_prefix(row[2]) for row in rows])
+
+    @classmethod
+    def from_archive(cls, columns):
+        """Build a frame from the column arrays of a vote archive (see vote_archive.read_archive)."""
+        if len(columns['voted_at']) == 0:
+            # np.char.partition cannot split an empty array; polls closed without votes have empty archives
+            return cls.from_rows([])
+        return cls(columns['option_id'],
+                   columns['voted_at'],
+                   np.char.lower(np.char.partition(columns['voter_email'], '@')[:, 2]),
+                   [ip_prefix(address) for address in columns['ip_address']])
+
+    def _dimension(self, name):
+        if name in ('hour', 'day'):
+            seconds = 3600 if name == 'hour' else 86400
+            labels, codes = encode(self.voted_at // seconds * seconds)
+            return [str(label) for label in labels.astype('datetime64[s]')], codes
+        if name not in self.codes:
+            raise ValueError(f"Unknown dimension {name!r}; expected one of {', '.join(DIMENSIONS)}")
+        return self.labels[name].tolist(), self.codes[name]
+
+    def crosstab(self, dimensions):
+        """Count votes per combination of ``dimensions``.
+
+        Returns a list of [label, ..., votes] rows, one per combination that
+        has at least one vote, ordered by label.
+        """
+        labels, codes = zip(*(self._dimension(name) for name in dimensions))
+        shape = tuple(max(len(dimension_labels), 1) for dimension_labels in labels)
+        cells, counts = np.unique(np.ravel_multi_index(codes, shape), return_counts=True)
+        indexes = np.unravel_index(cells, shape)
+        return [
+            [labels[d][indexes[d][row]] for d in range(len(dimensions))] + [int(counts[row])]
+            for row in range(len(cells))
+        ]
+
+
+class VoteFrameCache:
+    """LRU cache of VoteFrame objects by poll id.
+
+    Frames older than ``max_age`` seconds are reloaded, so votes recorded
+    by other workers show up; this worker's own votes discard the frame.
+    """
+
+    def __init__(self, max_size=1000, max_age=60.0, clock=time.monotonic):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._frames = OrderedDict()
+
+    def get(self, poll_id):
+        with self._lock:
+            frame = self._frames.get(poll_id)
+            if frame is None:
+                return None
+            if self._clock() - frame.loaded_at >= self.max_age:
+                del self._frames[poll_id]
+                return None
+            self._frames.move_to_end(poll_id)
+            return frame
+
+    def put(self, poll_id, frame):
+        frame.loaded_at = self._clock()
+        with self._lock:
+            self._frames[poll_id] = frame
+            self._frames.move_to_end(poll_id)
+            while len(self._frames) > self.max_size:
+                self._frames.popitem(last=False)
+        return frame
+
+    def discard(self, poll_id):
+        with self._lock:
+            self._frames.pop(poll_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+
+    def __len__(self):
+        return len(self._frames)
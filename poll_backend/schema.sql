@@ -15,9 +15,10 @@ CREATE TABLE polls (
   title VARCHAR(255) NOT NULL,
   question VARCHAR(255) NOT NULL,
   user_id INT NOT NULL,
-  share_token VARCHAR(64) UNIQUE,
+  share_token BINARY(16) NOT NULL UNIQUE,
   end_date DATETIME,
   show_results_to_voters BOOLEAN DEFAULT FALSE,
+  voting_method VARCHAR(16) NOT NULL DEFAULT 'single',
   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
   FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 );
@@ -41,4 +42,103 @@ CREATE TABLE votes (
   FOREIGN KEY (poll_id) REFERENCES polls(id) ON DELETE CASCADE,
   FOREIGN KEY (option_id) REFERENCES options(id) ON DELETE CASCADE,
   UNIQUE KEY unique_vote (poll_id, voter_email)
-); 
\ No newline at end of file
+);
+
+-- Ballots of approval and ranked polls: the chosen option positions (in option id order), one byte each.
+-- The poll_id foreign key index also orders each poll's ballots by id, for reading only the newer ones.
+CREATE TABLE ballots (
+  id INT AUTO_INCREMENT PRIMARY KEY,
+  poll_id INT NOT NULL,
+  ranking VARBINARY(255) NOT NULL,
+  FOREIGN KEY (poll_id) REFERENCES polls(id) ON DELETE CASCADE
+);
+
+CREATE TABLE poll_results (
+  poll_id INT PRIMARY KEY,
+  share_token BINARY(16) NOT NULL UNIQUE,
+  total_votes INT NOT NULL,
+  results TEXT NOT NULL,
+  closed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  FOREIGN KEY (poll_id) REFERENCES polls(id) ON DELETE CASCADE
+);
+
+-- Vote shard of each poll, written when the poll is created so changing VOTE_SHARDS does not move it
+CREATE TABLE vote_shards (
+  poll_id INT PRIMARY KEY,
+  shard INT NOT NULL,
+  moving_to INT,
+  FOREIGN KEY (poll_id) REFERENCES polls(id) ON DELETE CASCADE
+);
+
+-- Polls whose raw votes were moved to an archive file by archive_votes.py (tallies stay in options)
+CREATE TABLE vote_archives (
+  poll_id INT PRIMARY KEY,
+  path VARCHAR(255) NOT NULL,
+  vote_count INT NOT NULL,
+  archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  FOREIGN KEY (poll_id) REFERENCES polls(id) ON DELETE CASCADE
+);
+
+-- Hot polls whose option counters are spread over several rows (see counter_slots.py)
+CREATE TABLE poll_counter_slots (
+  poll_id INT PRIMARY KEY,
+  slots INT NOT NULL,
+  FOREIGN KEY (poll_id) REFERENCES polls(id) ON DELETE CASCADE
+);
+
+-- Extra vote counters of an option (slot 0 is options.votes itself)
+CREATE TABLE option_vote_slots (
+  option_id INT NOT NULL,
+  slot INT NOT NULL,
+  votes INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (option_id, slot),
+  FOREIGN KEY (option_id) REFERENCES options(id) ON DELETE CASCADE
+);
+
+-- HyperLogLog sketches of distinct viewers and voter IPs per poll (see sketches.py), merged by every worker
+CREATE TABLE poll_sketches (
+  poll_id INT NOT NULL,
+  kind VARCHAR(16) NOT NULL,
+  registers BLOB NOT NULL,
+  version INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (poll_id, kind),
+  FOREIGN KEY (poll_id) REFERENCES polls(id) ON DELETE CASCADE
+);
+
+-- Votes held back by the fraud check (FRAUD_ACTION=quarantine, see fraud.py): stored for review, not counted
+CREATE TABLE quarantined_votes (
+  id INT AUTO_INCREMENT PRIMARY KEY,
+  poll_id INT NOT NULL,
+  option_id INT NOT NULL,
+  voter_name VARCHAR(100) NOT NULL,
+  voter_email VARCHAR(100) NOT NULL,
+  ip_address VARCHAR(45),
+  ranking VARBINARY(255),
+  reasons VARCHAR(32) NOT NULL,
+  voted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  FOREIGN KEY (poll_id) REFERENCES polls(id) ON DELETE CASCADE
+);
+
+-- Votes the fraud check flagged per poll, in total and by reason (one vote can have several)
+CREATE TABLE vote_flags (
+  poll_id INT PRIMARY KEY,
+  flagged INT NOT NULL DEFAULT 0,
+  quarantined INT NOT NULL DEFAULT 0,
+  ip INT NOT NULL DEFAULT 0,
+  subnet INT NOT NULL DEFAULT 0,
+  domain INT NOT NULL DEFAULT 0,
+  FOREIGN KEY (poll_id) REFERENCES polls(id) ON DELETE CASCADE
+);
+
+-- Responses to requests sent with an Idempotency-Key header (see idempotency.py), shared by every worker
+-- status is NULL while the first request is still running
+CREATE TABLE idempotency_keys (
+  key_hash BINARY(32) PRIMARY KEY,
+  fingerprint CHAR(64) NOT NULL,
+  status INT,
+  body MEDIUMBLOB,
+  mimetype VARCHAR(100),
+  expires_at DOUBLE NOT NULL
+);
+
+CREATE INDEX idempotency_keys_expires_at ON idempotency_keys (expires_at);
@@ -49,8 +49,9 @@ def setup_database():
             "  title VARCHAR(255) NOT NULL,"
             "  question TEXT NOT NULL,"
             "  user_id INT NOT NULL,"
-            "  share_token VARCHAR(255) NOT NULL UNIQUE,"
-            "  end_date DATE,"
+            "  share_token BINARY(16) NOT NULL UNIQUE,"
+            "  end_date DATETIME,"
+            "  voting_method VARCHAR(16) NOT NULL DEFAULT 'single',"
             "  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,"
             "  FOREIGN KEY (user_id) REFERENCES users(id)"
             ")"
@@ -74,9 +75,117 @@ def setup_database():
             "  voter_name VARCHAR(255) NOT NULL,"
             "  voter_email VARCHAR(255) NOT NULL,"
             "  ip_address VARCHAR(45),"
-            "  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,"
+            "  voted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,"
             "  FOREIGN KEY (poll_id) REFERENCES polls(id),"
-            "  FOREIGN KEY (option_id) REFERENCES options(id)"
+            "  FOREIGN KEY (option_id) REFERENCES options(id),"
+            "  UNIQUE KEY unique_vote (poll_id, voter_email)"
+            ")"
+        )
+
+        tables['ballots'] = (
+            "CREATE TABLE IF NOT EXISTS ballots ("
+            "  id INT AUTO_INCREMENT PRIMARY KEY,"
+            "  poll_id INT NOT NULL,"
+            "  ranking VARBINARY(255) NOT NULL,"
+            "  FOREIGN KEY (poll_id) REFERENCES polls(id) ON DELETE CASCADE"
+            ")"
+        )
+
+        tables['poll_results'] = (
+            "CREATE TABLE IF NOT EXISTS poll_results ("
+            "  poll_id INT PRIMARY KEY,"
+            "  share_token BINARY(16) NOT NULL UNIQUE,"
+            "  total_votes INT NOT NULL,"
+            "  results TEXT NOT NULL,"
+            "  closed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,"
+            "  FOREIGN KEY (poll_id) REFERENCES polls(id)"
+            ")"
+        )
+
+        tables['vote_shards'] = (
+            "CREATE TABLE IF NOT EXISTS vote_shards ("
+            "  poll_id INT PRIMARY KEY,"
+            "  shard INT NOT NULL,"
+            "  moving_to INT,"
+            "  FOREIGN KEY (poll_id) REFERENCES polls(id)"
+            ")"
+        )
+
+        tables['poll_counter_slots'] = (
+            "CREATE TABLE IF NOT EXISTS poll_counter_slots ("
+            "  poll_id INT PRIMARY KEY,"
+            "  slots INT NOT NULL,"
+            "  FOREIGN KEY (poll_id) REFERENCES polls(id) ON DELETE CASCADE"
+            ")"
+        )
+
+        tables['option_vote_slots'] = (
+            "CREATE TABLE IF NOT EXISTS option_vote_slots ("
+            "  option_id INT NOT NULL,"
+            "  slot INT NOT NULL,"
+            "  votes INT NOT NULL DEFAULT 0,"
+            "  PRIMARY KEY (option_id, slot),"
+            "  FOREIGN KEY (option_id) REFERENCES options(id) ON DELETE CASCADE"
+            ")"
+        )
+
+        tables['poll_sketches'] = (
+            "CREATE TABLE IF NOT EXISTS poll_sketches ("
+            "  poll_id INT NOT NULL,"
+            "  kind VARCHAR(16) NOT NULL,"
+            "  registers BLOB NOT NULL,"
+            "  version INT NOT NULL DEFAULT 0,"
+            "  PRIMARY KEY (poll_id, kind),"
+            "  FOREIGN KEY (poll_id) REFERENCES polls(id) ON DELETE CASCADE"
+            ")"
+        )
+
+        tables['quarantined_votes'] = (
+            "CREATE TABLE IF NOT EXISTS quarantined_votes ("
+            "  id INT AUTO_INCREMENT PRIMARY KEY,"
+            "  poll_id INT NOT NULL,"
+            "  option_id INT NOT NULL,"
+            "  voter_name VARCHAR(255) NOT NULL,"
+            "  voter_email VARCHAR(255) NOT NULL,"
+            "  ip_address VARCHAR(45),"
+            "  ranking VARBINARY(255),"
+            "  reasons VARCHAR(32) NOT NULL,"
+            "  voted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,"
+            "  FOREIGN KEY (poll_id) REFERENCES polls(id) ON DELETE CASCADE"
+            ")"
+        )
+
+        tables['vote_flags'] = (
+            "CREATE TABLE IF NOT EXISTS vote_flags ("
+            "  poll_id INT PRIMARY KEY,"
+            "  flagged INT NOT NULL DEFAULT 0,"
+            "  quarantined INT NOT NULL DEFAULT 0,"
+            "  ip INT NOT NULL DEFAULT 0,"
+            "  subnet INT NOT NULL DEFAULT 0,"
+            "  domain INT NOT NULL DEFAULT 0,"
+            "  FOREIGN KEY (poll_id) REFERENCES polls(id) ON DELETE CASCADE"
+            ")"
+        )
+
+        tables['vote_archives'] = (
+            "CREATE TABLE IF NOT EXISTS vote_archives ("
+            "  poll_id INT PRIMARY KEY,"
+            "  path VARCHAR(255) NOT NULL,"
+            "  vote_count INT NOT NULL,"
+            "  archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,"
+            "  FOREIGN KEY (poll_id) REFERENCES polls(id) ON DELETE CASCADE"
+            ")"
+        )
+
+        tables['idempotency_keys'] = (
+            "CREATE TABLE IF NOT EXISTS idempotency_keys ("
+            "  key_hash BINARY(32) PRIMARY KEY,"
+            "  fingerprint CHAR(64) NOT NULL,"
+            "  status INT,"
+            "  body MEDIUMBLOB,"
+            "  mimetype VARCHAR(100),"
+            "  expires_at DOUBLE NOT NULL,"
+            "  INDEX (expires_at)"
             ")"
         )
 
@@ -107,5 +216,32 @@ def setup_database():
         if 'cnx' in locals():
             cnx.close()
 
+def setup_vote_shards():
+    """Create the votes table on every shard listed in VOTE_SHARDS (host[:port][/database],...)."""
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vote_shard_schema.sql')) as schema_file:
+        statements = [s.strip() for s in schema_file.read().split(';') if s.strip()]
+    create_votes = next(s for s in statements if s.upper().startswith('CREATE TABLE'))
+    create_votes = create_votes.replace('CREATE TABLE', 'CREATE TABLE IF NOT EXISTS', 1)
+
+    for entry in filter(None, (os.getenv('VOTE_SHARDS') or '').split(',')):
+        address, _, database = entry.strip().partition('/')
+        host, _, port = address.partition(':')
+        database = database or 'poll_app'
+        config = dict(db_config, host=host)
+        if port:
+            config['port'] = int(port)
+        try:
+            cnx = mysql.connector.connect(**config)
+            cursor = cnx.cursor()
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS {database} DEFAULT CHARACTER SET 'utf8'")
+            cursor.execute(f"USE {database}")
+            cursor.execute(create_votes)
+            print(f"Vote shard {entry.strip()}: OK")
+            cursor.close()
+            cnx.close()
+        except mysql.connector.Error as err:
+            print(f"Vote shard {entry.strip()}: {err}")
+
 if __name__ == "__main__":
-    setup_database() 
\ No newline at end of file
+    setup_database()
+    setup_vote_shards() 
\ No newline at end of file
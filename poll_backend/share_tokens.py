@@ -0,0 +1,112 @@
+import base64
+import binascii
+import hashlib
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+# Share tokens are 16 random bytes, stored as BINARY(16) and shown as 22 URL-safe base64 characters
+TOKEN_BYTES = 16
+TOKEN_LENGTH = 22
+
+# Longest token accepted in a URL (the old VARCHAR column allowed 255)
+MAX_TOKEN_LENGTH = 255
+
+_ENCODED = re.compile(r'[A-Za-z0-9_-]{22}\Z')
+
+
+def new_share_token():
+    """A new random share token key."""
+    return secrets.token_bytes(TOKEN_BYTES)
+
+
+def format_share_token(key):
+    """The URL form of a token key (a str, e.g. from a mocked row, is returned as is)."""
+    if key is None or isinstance(key, str):
+        return key
+    return base64.urlsafe_b64encode(bytes(key)).rstrip(b'=').decode('ascii')
+
+
+def parse_share_token(token):
+    """The BINARY(16) key of a token from a URL, or None if it cannot be a token.
+
+    Tokens made by ``secrets.token_urlsafe(16)`` (every token before keys
+    were binary) are exactly the URL form of their key. Any other old token
+    maps to a hash of its text, the same value the migration stored, so old
+    links keep working.
+    """
+    if not token or len(token) > MAX_TOKEN_LENGTH:
+        return None
+    if _ENCODED.match(token):
+        try:
+            key = base64.urlsafe_b64decode(token + '==')
+        except (binascii.Error, ValueError):
+            key = None
+        # A final character with stray low bits decodes, but is not the canonical form of any key
+        if key is not None and format_share_token(key) == token:
+            return key
+    return hashlib.blake2b(token.encode('utf-8'), digest_size=TOKEN_BYTES).digest()
+
+
+def canonical_share_token(token):
+    """The URL form of the key a token resolves to (the same string for every new token)."""
+    key = parse_share_token(token)
+    return format_share_token(key) if key is not None else None
+
+
+class ShareTokenMap:
+    """Bounded in-process map of share token keys to (poll id, voting method).
+
+    Tokens never change, so a hit saves the token lookup on the vote path.
+    Entries expire after ``max_age`` seconds so a poll deleted by another
+    worker is noticed; the oldest entries are evicted beyond ``max_size``.
+    """
+
+    def __init__(self, max_size=100000, max_age=300.0, clock=time.monotonic):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._keys_by_poll = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            poll_id, voting_method, stored_at = entry
+            if self._clock() - stored_at > self.max_age:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return poll_id, voting_method
+
+    def put(self, key, poll_id, voting_method='single'):
+        with self._lock:
+            self._entries[key] = (poll_id, voting_method, self._clock())
+            self._entries.move_to_end(key)
+            self._keys_by_poll[poll_id] = key
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def discard_poll(self, poll_id):
+        with self._lock:
+            key = self._keys_by_poll.get(poll_id)
+            if key is not None:
+                self._remove(key)
+
+    def _remove(self, key):
+        poll_id = self._entries.pop(key)[0]
+        if self._keys_by_poll.get(poll_id) == key:
+            del self._keys_by_poll[poll_id]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_poll.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,191 @@
+import hashlib
+import math
+import threading
+import time
+import zlib
+
+import mysql.connector
+import numpy as np
+
+# Sketch kinds kept per poll
+VIEWERS = 'viewers'
+VOTER_IPS = 'voter_ips'
+
+# 2 ** 12 one-byte registers: 4 KiB per sketch, 1.6% standard error
+DEFAULT_PRECISION = 12
+
+
+class HyperLogLog:
+    """Estimates how many distinct values were added, in 2 ** ``precision`` bytes.
+
+    Each value is hashed to 64 bits; the first ``precision`` bits pick a
+    register, which keeps the longest run of leading zeros seen in the
+    rest. Sketches of the same precision merge by taking the larger
+    register, so sketches built by separate workers combine into the
+    sketch of the union.
+    """
+
+    def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size) if registers is None else bytearray(registers)
+
+    @property
+    def standard_error(self):
+        return 1.04 / math.sqrt(self.size)
+
+    def add(self, value):
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest()
+        hashed = int.from_bytes(digest, 'big')
+        bits = 64 - self.precision
+        index = hashed >> bits
+        rank = bits - (hashed & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge sketches of different precision')
+        registers = np.frombuffer(self.registers, dtype=np.uint8)
+        np.maximum(registers, np.frombuffer(other.registers, dtype=np.uint8), out=registers)
+
+    def estimate(self):
+        registers = np.frombuffer(self.registers, dtype=np.uint8)
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        raw = alpha * self.size * self.size / np.ldexp(1.0, -registers.astype(np.int32)).sum()
+        zeros = self.size - np.count_nonzero(registers)
+        if raw <= 2.5 * self.size and zeros:
+            # Few values: count the empty registers instead (linear counting)
+            return self.size * math.log(self.size / zeros)
+        return float(raw)
+
+    def bounds(self):
+        """The estimate with its standard error and a 95% interval, as served to poll owners."""
+        estimate = self.estimate()
+        margin = 1.96 * self.standard_error * estimate
+        return {
+            'estimate': round(estimate),
+            'low': max(0, math.floor(estimate - margin)),
+            'high': math.ceil(estimate + margin),
+            'standard_error': round(self.standard_error, 4)
+        }
+
+    def to_bytes(self):
+        """Precision byte and compressed registers; mostly empty sketches shrink to a few bytes."""
+        return bytes([self.precision]) + zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(data[0], zlib.decompress(data[1:]))
+
+
+def merge_stored_sketch(cursor, poll_id, kind, sketch, attempts=5):
+    """Merge a sketch into the poll_sketches row of a poll; False if it kept changing underneath.
+
+    Rows carry a version so concurrent workers merge with compare-and-swap
+    instead of overwriting each other's registers. Returns None if the poll
+    has been deleted, so the caller can drop the sketch.
+    """
+    for _ in range(attempts):
+        cursor.execute("SELECT registers, version FROM poll_sketches WHERE poll_id = %s AND kind = %s",
+                       (poll_id, kind))
+        row = cursor.fetchone()
+        if row is None:
+            try:
+                cursor.execute("""
+                    INSERT IGNORE INTO poll_sketches (poll_id, kind, registers, version)
+                    VALUES (%s, %s, %s, 0)
+                """, (poll_id, kind, sketch.to_bytes()))
+            except mysql.connector.IntegrityError as err:
+                if err.errno != 1452:
+                    raise
+                return None
+            if not cursor.rowcount:
+                # MySQL ignores the foreign key error of a deleted poll as well as a concurrent insert
+                cursor.execute("SELECT 1 FROM polls WHERE id = %s", (poll_id,))
+                if cursor.fetchone() is None:
+                    return None
+                continue
+        else:
+            merged = HyperLogLog.from_bytes(row[0])
+            merged.merge(sketch)
+            cursor.execute("""
+                UPDATE poll_sketches SET registers = %s, version = version + 1
+                WHERE poll_id = %s AND kind = %s AND version = %s
+            """, (merged.to_bytes(), poll_id, kind, row[1]))
+        if cursor.rowcount:
+            return True
+    return False
+
+
+class PollSketches:
+    """Per-poll HyperLogLog sketches added to by this worker since they were last flushed.
+
+    ``take`` hands the pending sketches to a flush that merges them into the
+    poll_sketches table (shared by every worker); ``estimates`` combines
+    the stored sketches of a poll with what is still pending here.
+    """
+
+    def __init__(self, precision=DEFAULT_PRECISION, clock=time.monotonic):
+        self.precision = precision
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (poll_id, kind) -> HyperLogLog
+        self._pending = {}
+        self._flushed_at = clock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, poll_id, kind, value):
+        with self._lock:
+            sketch = self._pending.get((poll_id, kind))
+            if sketch is None:
+                sketch = self._pending[(poll_id, kind)] = HyperLogLog(self.precision)
+            sketch.add(value)
+
+    def flush_due(self, interval, max_pending=1000):
+        """Whether to flush now: ``interval`` seconds passed or too many sketches are pending."""
+        with self._lock:
+            now = self._clock()
+            if not self._pending or (now - self._flushed_at < interval and len(self._pending) < max_pending):
+                return False
+            self._flushed_at = now
+            return True
+
+    def take(self):
+        """Remove and return the pending sketches, keyed by (poll_id, kind)."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def put_back(self, pending):
+        """Return sketches a failed flush took, merged with anything added since."""
+        with self._lock:
+            for key, sketch in pending.items():
+                current = self._pending.get(key)
+                if current is not None:
+                    sketch.merge(current)
+                self._pending[key] = sketch
+
+    def discard(self, poll_id):
+        with self._lock:
+            for key in [key for key in self._pending if key[0] == poll_id]:
+                del self._pending[key]
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+
+    def estimates(self, poll_id, stored_rows, kinds=(VIEWERS, VOTER_IPS)):
+        """Bounds per kind from the poll's stored (kind, registers) rows plus the pending sketches."""
+        sketches = {kind: HyperLogLog(self.precision) for kind in kinds}
+        for kind, registers in stored_rows:
+            if kind in sketches:
+                sketches[kind].merge(HyperLogLog.from_bytes(registers))
+        with self._lock:
+            for kind, sketch in sketches.items():
+                pending = self._pending.get((poll_id, kind))
+                if pending is not None:
+                    sketch.merge(pending)
+        return {kind: sketch.bounds() for kind, sketch in sketches.items()}
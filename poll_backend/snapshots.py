@@ -0,0 +1,110 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultsSnapshot:
+    """Frozen final results of a closed poll, pre-serialized for serving.
+
+    ``payload`` is the public poll body (poll, options, total_votes) as stored
+    in the poll_results table. Both the public and the owner (details)
+    response bodies are rendered once, so serving a closed poll is a dict
+    lookup and a write of ready-made bytes.
+    """
+
+    def __init__(self, payload):
+        poll = payload['poll']
+        self.payload = payload
+        self.poll_id = poll['id']
+        self.share_token = poll['share_token']
+        self.user_id = poll['user_id']
+        # Instant-runoff rounds of ranked polls
+        runoff = {key: payload[key] for key in ('rounds', 'winner') if key in payload}
+        self.body = json.dumps({
+            'success': True,
+            'poll': poll,
+            'options': payload['options'],
+            'total_votes': payload['total_votes'],
+            **runoff
+        })
+        self.details_body = json.dumps({
+            'id': poll['id'],
+            'question': poll['question'],
+            'creator_name': poll['creator_name'],
+            'created_at': poll['created_at'],
+            'options': [
+                {'id': option['id'], 'option_text': option['option_text'], 'votes': option['votes']}
+                for option in payload['options']
+            ],
+            'total_votes': payload['total_votes'],
+            **runoff
+        })
+        self.etag = hashlib.sha1(self.body.encode('utf-8')).hexdigest()
+        self.details_etag = hashlib.sha1(self.details_body.encode('utf-8')).hexdigest()
+        # Set by SnapshotCache.put
+        self.stored_at = None
+
+
+class SnapshotCache:
+    """LRU cache of ResultsSnapshot objects, looked up by share token or poll id.
+
+    A closed poll's results never change, but the poll can still be deleted,
+    and only the worker that handled the delete discards its snapshot.
+    Snapshots therefore expire after ``max_age`` seconds, after which the
+    next read goes back to the database.
+    """
+
+    def __init__(self, max_size=10000, max_age=300.0, clock=time.monotonic):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._by_token = OrderedDict()
+        self._by_id = {}
+
+    def get(self, share_token):
+        with self._lock:
+            return self._fresh(self._by_token.get(share_token))
+
+    def get_by_poll_id(self, poll_id):
+        with self._lock:
+            return self._fresh(self._by_id.get(poll_id))
+
+    def _fresh(self, snapshot):
+        if snapshot is None:
+            return None
+        if self._clock() - snapshot.stored_at > self.max_age:
+            self._by_token.pop(snapshot.share_token, None)
+            self._by_id.pop(snapshot.poll_id, None)
+            return None
+        self._by_token.move_to_end(snapshot.share_token)
+        return snapshot
+
+    def put(self, payload):
+        """Cache the snapshot for a results payload and return it."""
+        snapshot = ResultsSnapshot(payload)
+        snapshot.stored_at = self._clock()
+        with self._lock:
+            self._by_token[snapshot.share_token] = snapshot
+            self._by_token.move_to_end(snapshot.share_token)
+            self._by_id[snapshot.poll_id] = snapshot
+            while len(self._by_token) > self.max_size:
+                _, evicted = self._by_token.popitem(last=False)
+                self._by_id.pop(evicted.poll_id, None)
+        return snapshot
+
+    def discard(self, poll_id):
+        with self._lock:
+            snapshot = self._by_id.pop(poll_id, None)
+            if snapshot is not None:
+                self._by_token.pop(snapshot.share_token, None)
+
+    def clear(self):
+        with self._lock:
+            self._by_token.clear()
+            self._by_id.clear()
+
+    def __len__(self):
+        return len(self._by_token)
@@ -0,0 +1,281 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# How a poll is voted on: one option, any number of options, or a ranking of options
+SINGLE = 'single'
+APPROVAL = 'approval'
+RANKED = 'ranked'
+VOTING_METHODS = (SINGLE, APPROVAL, RANKED)
+
+# Field of the vote request holding the voter's choice, per voting method
+BALLOT_FIELDS = {SINGLE: 'selected_option', APPROVAL: 'selected_options', RANKED: 'ranking'}
+
+# Ballots store each chosen option as its position among the poll's options (in id order),
+# one byte per choice; rows of the ballot matrix are padded with NO_CHOICE
+NO_CHOICE = 255
+MAX_OPTIONS = NO_CHOICE
+
+# Round outcomes
+WINNER = 'winner'
+ELIMINATED = 'eliminated'
+
+# Ballots added one at a time update the cached rounds; bigger batches recount them all
+INCREMENTAL_BATCH = 64
+
+
+def encode_ballot(positions):
+    """The stored form of a ballot: one byte per option position, most preferred first."""
+    return bytes(positions)
+
+
+def decode_ballot(ballot):
+    return list(bytes(ballot))
+
+
+def ballot_positions(option_ids, chosen):
+    """Positions of the chosen option ids among a poll's option ids, or None if any is invalid or repeated."""
+    index = {option_id: position for position, option_id in enumerate(option_ids)}
+    try:
+        positions = [index[option_id] for option_id in chosen]
+    except (KeyError, TypeError):
+        return None
+    if not positions or len(set(positions)) != len(positions):
+        return None
+    return positions
+
+
+def current_choices(ballots, eliminated):
+    """Each ballot's most preferred option not yet eliminated, or -1 for an exhausted ballot."""
+    out = np.ones(NO_CHOICE + 1, dtype=bool)
+    out[:len(eliminated)] = eliminated
+    available = ~out[ballots]
+    first = available.argmax(axis=1)
+    choices = ballots[np.arange(len(ballots)), first].astype(np.int16)
+    choices[~available.any(axis=1)] = -1
+    return choices
+
+
+def decide(counts, eliminated, history):
+    """The outcome of a round: (WINNER, position), (ELIMINATED, position) or (None, None) with no ballots.
+
+    An option wins with more than half of the ballots still counting, or as
+    the last one standing. Otherwise the option with the fewest votes is
+    eliminated; ties go to the option with fewer votes in the latest earlier
+    round where they differ (``history``), then to the last listed option.
+    """
+    remaining = np.flatnonzero(~eliminated)
+    continuing = counts[remaining].sum()
+    if not continuing:
+        return None, None
+    leader = remaining[counts[remaining].argmax()]
+    if counts[leader] * 2 > continuing or len(remaining) == 1:
+        return WINNER, int(leader)
+
+    tied = remaining[counts[remaining] == counts[remaining].min()]
+    for previous in reversed(history):
+        if len(tied) == 1:
+            break
+        tied = tied[previous.counts[tied] == previous.counts[tied].min()]
+    return ELIMINATED, int(tied[-1])
+
+
+class Round:
+    """Vote counts of one instant-runoff round and its outcome."""
+
+    __slots__ = ('counts', 'exhausted', 'outcome', 'position')
+
+    def __init__(self, counts, exhausted, outcome, position):
+        self.counts = counts
+        self.exhausted = exhausted
+        self.outcome = outcome
+        self.position = position
+
+
+class BallotTally:
+    """The ballots of one approval or ranked poll and their results.
+
+    Ballots are rows of a uint8 matrix (one column per option, padded with
+    NO_CHOICE), so a million five-option ballots take 5 MB. Approval totals
+    are kept as ballots arrive. Instant-runoff rounds are counted with
+    whole-matrix numpy operations; after that each new ballot is added to
+    the cached rounds, and rounds are only recounted from the first one
+    whose outcome it changes.
+
+    ``last_id`` is the id of the newest ballot added, so a reader fetches
+    only the ballots after it; ballots fetched twice by concurrent readers
+    are counted once.
+    """
+
+    def __init__(self, method, option_count, capacity=64):
+        if option_count > MAX_OPTIONS:
+            raise ValueError(f"At most {MAX_OPTIONS} options can be tallied")
+        self.method = method
+        self.option_count = option_count
+        self.size = 0
+        self.last_id = 0
+        self.approvals = np.zeros(option_count, dtype=np.int64)
+        self._lock = threading.RLock()
+        self._ballots = np.full((capacity, max(option_count, 1)), NO_CHOICE, dtype=np.uint8)
+        self._rounds = None
+
+    @property
+    def ballots(self):
+        return self._ballots[:self.size]
+
+    def _reserve(self, count):
+        if self.size + count <= len(self._ballots):
+            return
+        capacity = max(len(self._ballots) * 2, self.size + count)
+        grown = np.full((capacity, self._ballots.shape[1]), NO_CHOICE, dtype=np.uint8)
+        grown[:self.size] = self.ballots
+        self._ballots = grown
+
+    def extend(self, rows):
+        """Add (ballot id, ballot) rows in id order; rows at or before ``last_id`` are already counted."""
+        with self._lock:
+            return self._extend(rows)
+
+    def _extend(self, rows):
+        rows = [(ballot_id, ballot) for ballot_id, ballot in rows if ballot_id > self.last_id]
+        if not rows:
+            return 0
+        width = self._ballots.shape[1]
+        padding = bytes([NO_CHOICE]) * width
+        added = np.frombuffer(b''.join((bytes(ballot) + padding)[:width] for _, ballot in rows),
+                              dtype=np.uint8).reshape(len(rows), width)
+        if (added[added != NO_CHOICE] >= self.option_count).any():
+            raise ValueError("Ballot names an option the poll does not have")
+
+        self._reserve(len(rows))
+        start = self.size
+        self._ballots[start:start + len(rows)] = added
+        self.size += len(rows)
+        self.last_id = rows[-1][0]
+
+        self.approvals += np.bincount(added[added != NO_CHOICE], minlength=self.option_count)
+        if self._rounds is not None:
+            if len(rows) > INCREMENTAL_BATCH:
+                self._rounds = None
+            else:
+                for row in added:
+                    self._count_in_rounds(row[row != NO_CHOICE])
+        return len(rows)
+
+    def rounds(self):
+        """The instant-runoff rounds over every ballot so far."""
+        with self._lock:
+            if self._rounds is None:
+                self._rounds = self._run([])
+            return self._rounds
+
+    def _run(self, rounds):
+        """Count rounds after the given (already decided) ones until there is a winner."""
+        eliminated = np.zeros(self.option_count, dtype=bool)
+        for previous in rounds:
+            if previous.outcome == ELIMINATED:
+                eliminated[previous.position] = True
+        if rounds and rounds[-1].outcome != ELIMINATED:
+            return rounds
+
+        ballots = self.ballots
+        choices = current_choices(ballots, eliminated)
+        while True:
+            counted = choices[choices >= 0]
+            counts = np.bincount(counted, minlength=self.option_count).astype(np.int64)
+            outcome, position = decide(counts, eliminated, rounds)
+            rounds.append(Round(counts, len(choices) - len(counted), outcome, position))
+            if outcome != ELIMINATED:
+                return rounds
+            # Only ballots whose current choice was just eliminated move on to their next one
+            eliminated[position] = True
+            moved = np.flatnonzero(choices == position)
+            choices[moved] = current_choices(ballots[moved], eliminated)
+
+    def _count_in_rounds(self, positions):
+        eliminated = np.zeros(self.option_count, dtype=bool)
+        for index, current in enumerate(self._rounds):
+            choice = next((int(position) for position in positions if not eliminated[position]), None)
+            if choice is None:
+                current.exhausted += 1
+            else:
+                current.counts[choice] += 1
+            outcome = decide(current.counts, eliminated, self._rounds[:index])
+            if outcome != (current.outcome, current.position):
+                current.outcome, current.position = outcome
+                self._rounds = self._run(self._rounds[:index + 1])
+                return
+            if current.outcome == ELIMINATED:
+                eliminated[current.position] = True
+
+    def results(self, option_ids):
+        """The result fields of the poll body: total_votes (ballots) and, for ranked polls, rounds and winner."""
+        with self._lock:
+            return self._results(option_ids)
+
+    def _results(self, option_ids):
+        results = {'total_votes': self.size}
+        if self.method != RANKED:
+            return results
+
+        rounds = []
+        eliminated = np.zeros(self.option_count, dtype=bool)
+        winner = None
+        for current in self.rounds():
+            rounds.append({
+                'votes': [{'id': option_ids[position], 'votes': int(current.counts[position])}
+                          for position in np.flatnonzero(~eliminated)],
+                'exhausted': int(current.exhausted),
+                'eliminated': option_ids[current.position] if current.outcome == ELIMINATED else None
+            })
+            if current.outcome == ELIMINATED:
+                eliminated[current.position] = True
+            elif current.outcome == WINNER:
+                winner = option_ids[current.position]
+        results['rounds'] = rounds
+        results['winner'] = winner
+        return results
+
+
+class BallotTallyCache:
+    """LRU cache of BallotTally objects by poll id.
+
+    Tallies are extended with newer ballots on every read, so they stay
+    current; after ``max_age`` seconds a tally is dropped and rebuilt from
+    all of the poll's ballots, which also picks up a ballot whose insert
+    committed after a newer one was read.
+    """
+
+    def __init__(self, max_size=1000, max_age=300.0, clock=time.monotonic):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tallies = OrderedDict()
+
+    def get(self, poll_id, method, option_count):
+        """The cached tally of a poll, or a new empty one (cached) when missing, expired or stale."""
+        with self._lock:
+            tally = self._tallies.get(poll_id)
+            if (tally is None or self._clock() - tally.loaded_at >= self.max_age
+                    or (tally.method, tally.option_count) != (method, option_count)):
+                tally = BallotTally(method, option_count)
+                tally.loaded_at = self._clock()
+                self._tallies[poll_id] = tally
+            self._tallies.move_to_end(poll_id)
+            while len(self._tallies) > self.max_size:
+                self._tallies.popitem(last=False)
+            return tally
+
+    def discard(self, poll_id):
+        with self._lock:
+            self._tallies.pop(poll_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._tallies.clear()
+
+    def __len__(self):
+        return len(self._tallies)
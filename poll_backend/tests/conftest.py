@@ -11,11 +11,44 @@ os.environ['DB_USER'] = 'test_user'
 os.environ['DB_PASSWORD'] = 'test_password'
 os.environ['DB_NAME'] = 'test_poll_app'
 os.environ['JWT_SECRET_KEY'] = 'test_secret_key'
+# Run background jobs inline so tests see their effects
+os.environ['JOBS_EAGER'] = 'True'
 
 # Add parent directory to path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import app
+from sqlite_db import SQLiteDatabase
+from tracing import MemoryExporter
+
+@pytest.fixture(autouse=True)
+def reset_process_state():
+    """Forget what the worker remembers about polls, which tests reuse with different data.
+
+    Share token lookups, trending votes, audience sketches, fraud counters and
+    finished idempotent responses.
+    """
+    app.share_tokens.clear()
+    app.trending.clear()
+    app.poll_sketches.clear()
+    app.fraud_detector.clear()
+    app.idempotency_keys.clear()
+
+@pytest.fixture(autouse=True)
+def reset_profiler():
+    """Drop profiles collected by earlier tests and switch profiling back off."""
+    yield
+    app.request_profiler.configure()
+    app.request_profiler.profile.clear()
+    app.request_profiler.allocations.clear()
+
+@pytest.fixture
+def spans():
+    """Trace requests into an in-memory exporter and return its span list."""
+    exporter = MemoryExporter()
+    app.tracer.configure(exporter=exporter)
+    yield exporter.spans
+    app.tracer.configure()
 
 @pytest.fixture
 def client():
@@ -61,4 +94,40 @@ def mock_jwt_decode():
             'user_id': 1,
             'username': 'testuser'
         }
-        yield mock_decode 
\ No newline at end of file
+        yield mock_decode
+
+@pytest.fixture(scope='session')
+def sqlite_database():
+    """In-memory SQLite database with schema.sql and shared fixtures loaded once."""
+    database = SQLiteDatabase()
+    database.load_fixtures()
+    return database
+
+@pytest.fixture
+def db(sqlite_database, monkeypatch):
+    """Run app.py's real SQL against SQLite, rolled back after each test.
+
+    Testing mode is switched off so register, login and token_required go
+    through their real query paths, and query budgets raise instead of warn.
+    """
+    monkeypatch.setenv('TESTING', 'False')
+    monkeypatch.setattr(app.mysql.connector, 'connect', sqlite_database.connect)
+    monkeypatch.setattr(app.query_recorder, 'mode', 'raise')
+    app.results_snapshots.clear()
+    app.vote_frames.clear()
+    app.ballot_tallies.clear()
+    app.counter_slots.clear()
+    sqlite_database.begin()
+    yield sqlite_database
+    sqlite_database.rollback()
+    app.results_snapshots.clear()
+    app.vote_frames.clear()
+    app.ballot_tallies.clear()
+    app.counter_slots.clear()
+
+@pytest.fixture
+def auth_headers():
+    """Build real JWT Authorization headers for a fixture user."""
+    def make_headers(user_id, username):
+        return {'Authorization': f'Bearer {app.create_token(user_id, username)}'}
+    return make_headers
@@ -0,0 +1,239 @@
+"""SQLite stand-in for MySQL so tests can run app.py's real SQL.
+
+SQLiteDatabase keeps one in-memory database per test session. The schema is
+translated from schema.sql and fixtures are loaded once; each test then runs
+inside a transaction that is rolled back afterwards, so resetting between
+tests costs a single ROLLBACK. Connections returned by ``connect`` mimic the
+parts of mysql.connector used by app.py (``%s`` placeholders, dictionary
+cursors, lastrowid, errno 1062 on duplicates) and record every statement so
+tests can assert query counts.
+"""
+import datetime
+import os
+import re
+import sqlite3
+
+import mysql.connector
+from werkzeug.security import generate_password_hash
+
+from share_tokens import parse_share_token
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), '..', 'schema.sql')
+
+def _parse_datetime(value):
+    return datetime.datetime.fromisoformat(value.decode())
+
+sqlite3.register_adapter(datetime.datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(datetime.date, lambda value: value.isoformat())
+sqlite3.register_converter('DATETIME', _parse_datetime)
+sqlite3.register_converter('TIMESTAMP', _parse_datetime)
+sqlite3.register_converter('DATE', lambda value: datetime.date.fromisoformat(value.decode()))
+
+def mysql_schema_to_sqlite(schema):
+    """Translate the MySQL DDL in schema.sql into SQLite statements."""
+    statements = []
+    for statement in schema.split(';'):
+        statement = statement.strip()
+        if not statement or re.match(r'(CREATE DATABASE|USE)\b', statement, re.IGNORECASE):
+            continue
+        statement = re.sub(r'\bINT AUTO_INCREMENT PRIMARY KEY\b', 'INTEGER PRIMARY KEY AUTOINCREMENT',
+                           statement, flags=re.IGNORECASE)
+        statement = re.sub(r'\bUNIQUE KEY \w+ \(', 'UNIQUE (', statement, flags=re.IGNORECASE)
+        statements.append(statement)
+    return statements
+
+def mysql_query_to_sqlite(sql):
+    """Translate a query written for mysql.connector into SQLite syntax."""
+    sql = re.sub(r'\bINSERT IGNORE\b', 'INSERT OR IGNORE', sql, flags=re.IGNORECASE)
+    sql = re.sub(r'\bON DUPLICATE KEY UPDATE\b', 'ON CONFLICT DO UPDATE SET', sql, flags=re.IGNORECASE)
+    return sql.replace('%s', '?')
+
+class SQLiteCursor:
+    """Cursor with the mysql.connector interface used by app.py."""
+
+    def __init__(self, database, dictionary=False):
+        self._database = database
+        self._cursor = database.conn.cursor()
+        self._dictionary = dictionary
+
+    def _run(self, method, sql, params):
+        self._database.queries.append(sql)
+        try:
+            return method(mysql_query_to_sqlite(sql), params)
+        except sqlite3.IntegrityError as err:
+            errno = 1062 if 'UNIQUE' in str(err) else 1452
+            raise mysql.connector.IntegrityError(msg=str(err), errno=errno)
+        except sqlite3.Error as err:
+            raise mysql.connector.DatabaseError(msg=str(err))
+
+    def execute(self, sql, params=()):
+        self._run(self._cursor.execute, sql, params)
+
+    def executemany(self, sql, seq_params):
+        self._run(self._cursor.executemany, sql, seq_params)
+
+    def _convert(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return {column[0]: value for column, value in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        return self._convert(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._convert(row) for row in self._cursor.fetchall()]
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+class SQLiteConnection:
+    """Connection handed to app.py in place of a MySQL connection.
+
+    Every connection shares the session database, so data written by one
+    request is visible to the next. With autocommit (as in DB_CONFIG) commit
+    and rollback are no-ops outside ``start_transaction``; otherwise a
+    savepoint gives rollback() the MySQL transaction semantics.
+    """
+
+    def __init__(self, database, autocommit=True):
+        self._database = database
+        self.autocommit = autocommit
+        self._savepoint = None
+        if not autocommit:
+            self._savepoint = f'conn_{id(self)}'
+            database.conn.execute(f'SAVEPOINT {self._savepoint}')
+
+    def cursor(self, dictionary=False, **kwargs):
+        return SQLiteCursor(self._database, dictionary=dictionary)
+
+    @property
+    def in_transaction(self):
+        return self._savepoint is not None
+
+    def start_transaction(self):
+        """Like MySQL, hold the next statements of an autocommit connection until commit or rollback."""
+        if self._savepoint is None:
+            self._savepoint = f'conn_{id(self)}'
+            self._database.conn.execute(f'SAVEPOINT {self._savepoint}')
+
+    def _end_transaction(self):
+        if self.autocommit:
+            self._database.conn.execute(f'RELEASE SAVEPOINT {self._savepoint}')
+            self._savepoint = None
+        else:
+            self._database.conn.execute(f'RELEASE SAVEPOINT {self._savepoint}')
+            self._database.conn.execute(f'SAVEPOINT {self._savepoint}')
+
+    def commit(self):
+        if self._savepoint:
+            self._end_transaction()
+
+    def rollback(self):
+        if self._savepoint:
+            self._database.conn.execute(f'ROLLBACK TO SAVEPOINT {self._savepoint}')
+            self._end_transaction()
+
+    def close(self):
+        if self._savepoint:
+            self._database.conn.execute(f'ROLLBACK TO SAVEPOINT {self._savepoint}')
+            self._database.conn.execute(f'RELEASE SAVEPOINT {self._savepoint}')
+            self._savepoint = None
+
+    def is_connected(self):
+        return True
+
+class SQLiteDatabase:
+    """In-memory database with schema.sql applied and shared fixtures loaded."""
+
+    def __init__(self, schema_path=SCHEMA_PATH):
+        self.conn = sqlite3.connect(':memory:', detect_types=sqlite3.PARSE_DECLTYPES,
+                                    isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA foreign_keys = ON')
+        with open(schema_path) as schema_file:
+            for statement in mysql_schema_to_sqlite(schema_file.read()):
+                self.conn.execute(statement)
+        self.queries = []
+        self.fixtures = {}
+
+    def connect(self, **config):
+        """Drop-in replacement for mysql.connector.connect."""
+        return SQLiteConnection(self, autocommit=config.get('autocommit', False))
+
+    def begin(self):
+        self.conn.execute('BEGIN')
+        self.queries = []
+
+    def rollback(self):
+        self.conn.execute('ROLLBACK')
+
+    def reset_queries(self):
+        self.queries = []
+
+    def insert(self, sql, params=()):
+        cursor = self.conn.execute(mysql_query_to_sqlite(sql), params)
+        return cursor.lastrowid
+
+    def load_fixtures(self):
+        """Load the users, polls, options and votes shared by every test."""
+        today = datetime.date.today()
+        # A cheap hash keeps fixture loading fast; the method is stored in the hash
+        password_hash = generate_password_hash('password123', method='pbkdf2:sha256:1000')
+
+        alice = self.insert("INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s)",
+                            ('alice', 'alice@example.com', password_hash))
+        bob = self.insert("INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s)",
+                          ('bob', 'bob@example.com', password_hash))
+
+        open_poll = self.insert("""
+            INSERT INTO polls (title, question, user_id, share_token, end_date, show_results_to_voters)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, ('Lunch', 'What should we eat?', alice, parse_share_token('open-token'), today + datetime.timedelta(days=7), True))
+        closed_poll = self.insert("""
+            INSERT INTO polls (title, question, user_id, share_token, end_date, show_results_to_voters)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, ('Old', 'Last year?', alice, parse_share_token('closed-token'), today - datetime.timedelta(days=7), True))
+        bob_poll = self.insert("""
+            INSERT INTO polls (title, question, user_id, share_token, end_date, show_results_to_voters)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, ('Bob', 'Bob asks?', bob, parse_share_token('bob-token'), None, False))
+
+        options = {}
+        for poll_id, texts in ((open_poll, ('Pizza', 'Sushi', 'Tacos')),
+                               (closed_poll, ('Yes', 'No')),
+                               (bob_poll, ('A', 'B'))):
+            options[poll_id] = [
+                self.insert("INSERT INTO options (poll_id, option_text) VALUES (%s, %s)", (poll_id, text))
+                for text in texts
+            ]
+
+        ballots = [(open_poll, options[open_poll][0], 'v1@example.com'),
+                   (open_poll, options[open_poll][0], 'v2@example.com'),
+                   (open_poll, options[open_poll][1], 'v3@example.com'),
+                   (closed_poll, options[closed_poll][1], 'v1@example.com')]
+        for poll_id, option_id, email in ballots:
+            self.insert("""
+                INSERT INTO votes (poll_id, option_id, voter_name, voter_email, ip_address)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (poll_id, option_id, email.split('@')[0], email, '127.0.0.1'))
+            self.insert("UPDATE options SET votes = votes + 1 WHERE id = %s", (option_id,))
+
+        self.fixtures = {
+            'alice': alice,
+            'bob': bob,
+            'open_poll': open_poll,
+            'closed_poll': closed_poll,
+            'bob_poll': bob_poll,
+            'options': options
+        }
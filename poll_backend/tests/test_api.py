@@ -25,6 +25,7 @@ mock_token_decorator = lambda f: wraps(f)(lambda *args, **kwargs: f(1, *args, **
 
 # Mock the token_required decorator
 with patch('app.token_required', mock_token_decorator):
+    import app as app_module
     from app import app, generate_password_hash
 
 class TestPollAPI(unittest.TestCase):
@@ -41,6 +42,8 @@ class TestPollAPI(unittest.TestCase):
         # Mock cursor
         self.mock_cursor = self.mock_db.return_value.cursor.return_value
         self.mock_cursor.__enter__.return_value = self.mock_cursor
+        # Every write reports one affected row
+        self.mock_cursor.rowcount = 1
         
         # Setup token_required patch
         self.token_patcher = patch('app.token_required', mock_token_decorator)
@@ -262,7 +265,7 @@ class TestPollAPI(unittest.TestCase):
         # Third fetchone confirms option belongs to poll
         poll_end_date = datetime.datetime.now() + datetime.timedelta(days=1)  # Future date
         self.mock_cursor.fetchone.side_effect = [
-            (1, 'Test Poll', 'Question?', poll_end_date),  # Poll data from share_token
+            (1, 'Test Poll', 'Question?', poll_end_date, 'single'),  # Poll data from share_token
             None,  # No previous vote
             (1,)   # Option belongs to poll
         ]
@@ -305,7 +308,7 @@ class TestPollAPI(unittest.TestCase):
 
         # Test voting on active poll
         self.mock_cursor.fetchone.side_effect = [
-            (1, 'Test Poll', 'Test Question', future_time),  # Poll data
+            (1, 'Test Poll', 'Test Question', future_time, 'single'),  # Poll data
             None,  # No previous vote
             (1,),  # Valid option
         ]
@@ -322,9 +325,10 @@ class TestPollAPI(unittest.TestCase):
         
         self.assertEqual(response.status_code, 200)
         
-        # Test voting on ended poll
+        # Test voting on ended poll (end dates never change in place, so forget the cached token lookup)
+        app_module.share_tokens.clear()
         self.mock_cursor.fetchone.side_effect = [
-            (1, 'Test Poll', 'Test Question', past_time),  # Poll data with past end date
+            (1, 'Test Poll', 'Test Question', past_time, 'single'),  # Poll data with past end date
         ]
         
         response = self.app.post('/api/polls/test_token/vote',
@@ -372,32 +376,26 @@ class TestPollAPI(unittest.TestCase):
             # Setup poll data to be returned by first query
             poll_id = 1
             current_time = datetime.datetime.now()
-            poll_data = {
-                'id': poll_id,
-                'title': 'Test Poll',
-                'question': 'What is your favorite color?',
-                'user_id': 1,
-                'end_date': None,
-                'share_token': 'abc123',
-                'created_at': current_time,
-                'show_results_to_voters': True,
-                'creator_name': 'testuser'
-            }
+            # id, title, question, end_date, user_id, share_token, creator_name, created_at, show_results_to_voters,
+            # voting_method
+            poll_data = (poll_id, 'Test Poll', 'What is your favorite color?', None, 1, 'abc123',
+                         'testuser', current_time, True, 'single')
             
             # Setup options data to be returned by second query
             options_data = [
-                {'id': 1, 'option_text': 'Red', 'votes': 5},
-                {'id': 2, 'option_text': 'Blue', 'votes': 3},
-                {'id': 3, 'option_text': 'Green', 'votes': 2}
+                (1, 'Red', 5),
+                (2, 'Blue', 3),
+                (3, 'Green', 2)
             ]
             
-            # Configure mock to return dictionary cursor
-            dict_cursor_mock = MagicMock()
-            self.mock_db.return_value.cursor.return_value = dict_cursor_mock
+            # Configure mock cursor
+            cursor_mock = MagicMock()
+            self.mock_db.return_value.cursor.return_value = cursor_mock
             
-            # Configure mock fetchone and fetchall to return our test data
-            dict_cursor_mock.fetchone.return_value = poll_data
-            dict_cursor_mock.fetchall.return_value = options_data
+            # Configure mock fetchone and fetchall to return our test data (no audience sketches stored yet),
+            # then the flagged vote counts
+            cursor_mock.fetchone.side_effect = [poll_data, (2, 1, 1, 0, 1)]
+            cursor_mock.fetchall.side_effect = [options_data, []]
             
             # Make request with Authorization header
             response = self.app.get(f'/api/polls/{poll_id}/details',
@@ -408,11 +406,13 @@ class TestPollAPI(unittest.TestCase):
             data = json.loads(response.data)
             
             # Verify response structure and content
-            self.assertEqual(data['id'], poll_data['id'])
-            self.assertEqual(data['question'], poll_data['question'])
-            self.assertEqual(data['creator_name'], poll_data['creator_name'])
+            self.assertEqual(data['id'], poll_id)
+            self.assertEqual(data['question'], 'What is your favorite color?')
+            self.assertEqual(data['creator_name'], 'testuser')
             self.assertEqual(len(data['options']), len(options_data))
             self.assertEqual(data['total_votes'], 10)  # 5 + 3 + 2
+            self.assertEqual(data['flagged_votes'],
+                             {'flagged': 2, 'quarantined': 1, 'reasons': {'ip': 1, 'subnet': 0, 'domain': 1}})
 
 
 if __name__ == '__main__':
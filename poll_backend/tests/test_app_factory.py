@@ -0,0 +1,68 @@
+import json
+import os
+import subprocess
+import sys
+from unittest.mock import patch
+
+import app
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+def test_create_app_does_not_touch_database():
+    """Test building the app opens no database connection."""
+    with patch('app.mysql.connector.connect') as mock_connect:
+        test_app = app.create_app()
+        response = test_app.test_client().get('/healthz')
+
+    mock_connect.assert_not_called()
+    assert response.status_code == 200
+    assert json.loads(response.data)['status'] == 'ok'
+
+def test_apps_share_one_socketio_server():
+    """Test building another app keeps the Socket.IO server that broadcasts go to."""
+    default_app = app.get_app()
+    server = app.socketio.server
+
+    other_app = app.create_app()
+
+    assert app.socketio.server is server
+    assert other_app.extensions['socketio'] is app.socketio
+    assert default_app.extensions['socketio'] is app.socketio
+
+def test_background_work_starts_once_per_process(monkeypatch):
+    """Test create_app starts the job workers and queues poll scheduling once per process."""
+    monkeypatch.setattr(app.jobs, 'eager', False)
+    monkeypatch.setattr(app, '_background_pid', None)
+    with patch.object(app.jobs, 'start') as mock_start, patch.object(app.jobs, 'enqueue') as mock_enqueue:
+        app.create_app()
+        app.create_app()
+
+    mock_start.assert_called_once_with()
+    mock_enqueue.assert_called_once_with('schedule_open_polls')
+
+def test_readyz_reports_database_state(client, db):
+    """Test readiness succeeds when the database answers."""
+    response = client.get('/readyz')
+
+    assert response.status_code == 200
+    assert db.queries == ['SELECT 1']
+
+def test_readyz_unavailable_database(client):
+    """Test readiness fails with 503 when the database is unreachable."""
+    with patch('app.mysql.connector.connect', side_effect=app.mysql.connector.Error('down')):
+        response = client.get('/readyz')
+
+    assert response.status_code == 503
+    assert json.loads(response.data)['status'] == 'unavailable'
+
+def test_import_to_ready_is_fast_without_database():
+    """Test importing and building the app stays fast when the database host is unreachable."""
+    env = dict(os.environ, DB_HOST='10.255.255.1', JWT_SECRET_KEY='test_secret_key')
+    script = "import app; print(app.create_app().config['STARTUP_MS'])"
+
+    result = subprocess.run([sys.executable, '-c', script], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, timeout=30)
+
+    assert result.returncode == 0, result.stderr
+    startup_ms = float(result.stdout.strip().splitlines()[-1])
+    assert startup_ms < 2000
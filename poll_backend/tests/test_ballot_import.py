@@ -0,0 +1,175 @@
+import io
+import json
+
+import mysql.connector
+
+import app
+from ballot_import import BallotImport, ChunkWriter, import_format, parse_choices, read_rows
+from vote_shards import PollVotes
+
+class ListWriter:
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, chunk):
+        self.chunks.append(chunk)
+        return len(chunk)
+
+def test_formats_and_rows():
+    """Test CSV and NDJSON rows are read lazily, with unreadable NDJSON lines kept for reporting."""
+    assert import_format('text/csv') == 'csv'
+    assert import_format('Kiosk-2.NDJSON') == 'ndjson'
+    assert import_format('application/json') is None
+
+    csv_rows = list(read_rows(io.StringIO('voter_name,voter_email,ranking\nAnn,ann@x.org,3;1\n'), 'csv'))
+    assert csv_rows == [(2, {'voter_name': 'Ann', 'voter_email': 'ann@x.org', 'ranking': '3;1'})]
+    assert parse_choices(csv_rows[0][1]['ranking']) == [3, 1]
+    assert parse_choices('3;x') is None
+    assert parse_choices(4) == [4]
+
+    ndjson_rows = list(read_rows(io.StringIO('{"voter_name": "A"}\n\nnot json\n[1]\n'), 'ndjson'))
+    assert ndjson_rows == [(1, {'voter_name': 'A'}), (3, None), (4, None)]
+
+def test_rows_are_validated_and_deduplicated():
+    """Test invalid rows are reported and repeated emails, any case, are skipped."""
+    importer = BallotImport('approval', [10, 11, 12], existing_emails=['Old@x.org'], chunk_size=2)
+    rows = [(1, {'voter_name': 'A', 'voter_email': 'a@x.org', 'selected_options': [10, 12]}),
+            (2, {'voter_name': 'B', 'voter_email': 'old@X.org', 'selected_options': [10]}),
+            (3, {'voter_name': 'C', 'voter_email': 'A@x.org', 'selected_options': [11]}),
+            (4, {'voter_name': 'D', 'voter_email': 'd@x.org', 'selected_options': [13]}),
+            (5, {'voter_name': '', 'voter_email': 'e@x.org', 'selected_options': [10]}),
+            (6, {'voter_name': 'F', 'voter_email': 'f@x.org', 'selected_options': [11]}),
+            (7, {'voter_name': 'G', 'voter_email': 'g@x.org', 'selected_options': [12, 11]})]
+    writer = ListWriter()
+    stats = importer.run(rows, writer)
+
+    assert [[ballot.voter_email for ballot in chunk] for chunk in writer.chunks] == \
+        [['a@x.org', 'f@x.org'], ['g@x.org']]
+    assert writer.chunks[0][0].counted == [10, 12]
+    assert writer.chunks[0][0].ranking == b'\x00\x02'
+    assert (stats.rows, stats.imported, stats.duplicates, stats.invalid) == (7, 3, 2, 2)
+    assert [error['line'] for error in stats.errors] == [4, 5]
+
+def test_progress_is_reported_by_interval():
+    """Test progress is reported at most once per interval, and at the end."""
+    clock = [0.0]
+    reports = []
+    importer = BallotImport('single', [1], chunk_size=1, progress=lambda stats: reports.append(stats.rows),
+                            progress_interval=10, clock=lambda: clock[0])
+
+    def rows():
+        for index in range(5):
+            clock[0] += 4
+            yield index, {'voter_name': 'V', 'voter_email': f'{index}@x.org', 'selected_option': 1}
+
+    stats = importer.run(rows(), ListWriter())
+    assert reports == [3, 5]
+    assert stats.rows_per_second == 0.25
+
+def import_body(client, db, poll_id, body, content_type='text/csv', query=''):
+    headers = {'Authorization': f"Bearer {app.create_token(db.fixtures['alice'], 'alice')}"}
+    return client.post(f'/api/polls/{poll_id}/ballots/import{query}', data=body, content_type=content_type,
+                       headers=headers)
+
+def test_import_updates_counters_once_per_chunk(client, db):
+    """Test imported votes land in chunks, with the counters updated by one statement per chunk."""
+    poll_id = db.fixtures['open_poll']
+    pizza, sushi, tacos = db.fixtures['options'][poll_id]
+    body = 'voter_name,voter_email,selected_option\n' + ''.join(
+        f'Paper {index},paper{index}@example.com,{tacos if index % 2 else sushi}\n' for index in range(5))
+    body += f'Again,V1@example.com,{tacos}\nBad,bad@example.com,{pizza + 100}\n'
+
+    response = import_body(client, db, poll_id, body, query='?chunk_size=2')
+    report = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert (report['rows'], report['imported'], report['duplicates'], report['invalid']) == (7, 5, 1, 1)
+    assert report['errors'] == [{'line': 8, 'message': 'Invalid selected_option'}]
+    assert report['rows_per_second'] > 0
+    assert sum('UPDATE options' in sql for sql in db.queries) == 3
+    counts = json.loads(client.get('/api/polls/open-token').data)['options']
+    assert [option['votes'] for option in counts] == [2, 4, 2]
+
+    # Importing the same file again finds every email already voted
+    report = json.loads(import_body(client, db, poll_id, body).data)
+    assert (report['imported'], report['duplicates']) == (0, 6)
+
+def test_import_ranked_ballots(client, db, auth_headers):
+    """Test NDJSON rankings are stored as ballots and counted in the runoff."""
+    headers = auth_headers(db.fixtures['alice'], 'alice')
+    response = client.post('/api/polls', headers=headers, content_type='application/json',
+                           data=json.dumps({'title': 'T', 'question': 'Q?', 'options': ['A', 'B', 'C'],
+                                            'voting_method': 'ranked'}))
+    created = json.loads(response.data)
+    a, b, c = [row[0] for row in db.conn.execute('SELECT id FROM options WHERE poll_id = ? ORDER BY id',
+                                                 (created['poll_id'],))]
+    rankings = [[a, b]] * 4 + [[b, c]] * 3 + [[c, b]] * 2
+    body = ''.join(json.dumps({'voter_name': 'K', 'voter_email': f'k{index}@example.com', 'ranking': ranking}) + '\n'
+                   for index, ranking in enumerate(rankings))
+
+    report = json.loads(import_body(client, db, created['poll_id'], body, 'application/x-ndjson').data)
+
+    assert report['imported'] == 9
+    assert db.conn.execute('SELECT COUNT(*) FROM ballots WHERE poll_id = ?', (created['poll_id'],)).fetchone()[0] == 9
+    assert json.loads(client.get(f"/api/polls/{created['share_token']}").data)['winner'] == b
+
+def test_import_only_into_own_open_polls(client, db):
+    """Test imports need the owner, an open poll and a known format."""
+    body = 'voter_name,voter_email,selected_option\n'
+    assert import_body(client, db, db.fixtures['bob_poll'], body).status_code == 404
+    assert import_body(client, db, db.fixtures['closed_poll'], body).status_code == 400
+    assert import_body(client, db, db.fixtures['open_poll'], body, 'application/pdf').status_code == 415
+
+def test_concurrent_votes_are_dropped_from_the_chunk(db):
+    """Test an email that voted after the import started is skipped instead of failing its chunk."""
+    poll_id = db.fixtures['open_poll']
+    pizza = db.fixtures['options'][poll_id][0]
+    connection = db.connect()
+    cursor = connection.cursor()
+    writer = ChunkWriter(connection, cursor, PollVotes(cursor=cursor, connection=connection), poll_id)
+    importer = BallotImport('single', db.fixtures['options'][poll_id])
+
+    stats = importer.run([(1, {'voter_name': 'N', 'voter_email': 'new@example.com', 'selected_option': pizza}),
+                          (2, {'voter_name': 'V', 'voter_email': 'v1@example.com', 'selected_option': pizza})],
+                         writer)
+
+    assert (stats.imported, stats.duplicates) == (1, 1)
+    assert db.conn.execute('SELECT votes FROM options WHERE id = ?', (pizza,)).fetchone()[0] == 3
+
+def test_import_stops_once_results_are_frozen(client, db):
+    """Test a chunk that arrives after the poll was frozen is not counted."""
+    poll_id = db.fixtures['open_poll']
+    sushi = db.fixtures['options'][poll_id][1]
+    db.conn.execute("""
+        INSERT INTO poll_results (poll_id, share_token, total_votes, results)
+        SELECT id, share_token, 3, '{}' FROM polls WHERE id = ?
+    """, (poll_id,))
+
+    body = f'voter_name,voter_email,selected_option\nLate,late@example.com,{sushi}\n'
+    response = import_body(client, db, poll_id, body)
+
+    assert response.status_code == 400
+    assert json.loads(response.data)['message'] == 'This poll has ended'
+    assert db.conn.execute('SELECT votes FROM options WHERE id = ?', (sushi,)).fetchone()[0] == 1
+    assert db.conn.execute("SELECT COUNT(*) FROM votes WHERE voter_email = 'late@example.com'").fetchone()[0] == 0
+
+class FailingCursor:
+    def executemany(self, sql, seq_params):
+        raise mysql.connector.DatabaseError(msg='lost connection')
+
+def test_failed_chunk_leaves_counters_alone(client, db, monkeypatch):
+    """Test the counters of a chunk whose votes cannot be written are rolled back with it."""
+    poll_id = db.fixtures['open_poll']
+    sushi = db.fixtures['options'][poll_id][1]
+
+    def open_poll_votes(poll_id, cursor, connection=None):
+        votes = PollVotes(cursor=cursor, connection=connection)
+        votes.writes = [FailingCursor()]
+        return votes
+
+    monkeypatch.setattr(app, 'open_poll_votes', open_poll_votes)
+    body = f'voter_name,voter_email,selected_option\nN,n@example.com,{sushi}\n'
+    response = import_body(client, db, poll_id, body)
+
+    assert response.status_code == 500
+    assert db.conn.execute('SELECT votes FROM options WHERE id = ?', (sushi,)).fetchone()[0] == 1
@@ -0,0 +1,100 @@
+import json
+import random
+
+import app
+from counter_slots import CounterSlots, set_counter_slots
+
+def test_pick_slot_spreads_over_slots():
+    """Test votes go to the options row unless the poll has several slots."""
+    slots = CounterSlots(load=lambda: {7: 4}, rng=random.Random(1))
+
+    assert {slots.pick_slot(1) for _ in range(20)} == {0}
+    assert {slots.pick_slot(7) for _ in range(200)} == {0, 1, 2, 3}
+
+def test_slow_updates_double_the_slots():
+    """Test repeated slow counter updates ask for twice the slots, once, up to max_slots."""
+    clock = [0.0]
+    slots = CounterSlots(lock_wait_threshold=0.05, grow_after=3, window=10, max_slots=4,
+                         clock=lambda: clock[0])
+
+    assert slots.note_wait(1, 0.01) is None
+    assert [slots.note_wait(1, 0.1) for _ in range(3)] == [None, None, 2]
+    # Already growing: no second request until the new count is recorded
+    assert [slots.note_wait(1, 0.1) for _ in range(3)] == [None, None, None]
+
+    slots.set(1, 2)
+    assert [slots.note_wait(1, 0.1) for _ in range(3)] == [None, None, 4]
+    slots.set(1, 4)
+    assert [slots.note_wait(1, 0.1) for _ in range(3)] == [None, None, None]
+
+def test_slow_updates_outside_window_are_forgotten():
+    """Test only slow updates within the window count towards growing."""
+    clock = [0.0]
+    slots = CounterSlots(grow_after=2, window=10, clock=lambda: clock[0])
+
+    slots.note_wait(1, 1.0)
+    clock[0] = 20
+    assert slots.note_wait(1, 1.0) is None
+    assert slots.note_wait(1, 1.0) == 2
+
+def vote(client, email, option_id):
+    return client.post('/api/polls/open-token/vote', data=json.dumps({
+        'voter_name': email.split('@')[0], 'voter_email': email, 'selected_option': option_id
+    }), content_type='application/json')
+
+def test_reads_add_up_every_slot(client, db, auth_headers, monkeypatch):
+    """Test votes spread over slot rows are counted on every read path."""
+    poll_id = db.fixtures['open_poll']
+    pizza, sushi, tacos = db.fixtures['options'][poll_id]
+    connection = db.connect()
+    set_counter_slots(connection.cursor(), poll_id, 4)
+    app.counter_slots.set(poll_id, 4)
+    monkeypatch.setattr(app.counter_slots, '_rng', random.Random(3))
+
+    for index in range(8):
+        assert vote(client, f'slot{index}@example.com', tacos).status_code == 200
+
+    spread = db.conn.execute('SELECT COUNT(*) FROM option_vote_slots WHERE option_id = ? AND votes > 0',
+                             (tacos,)).fetchone()[0]
+    assert spread > 1
+
+    data = json.loads(client.get('/api/polls/open-token').data)
+    assert [option['votes'] for option in data['options']] == [2, 1, 8]
+    assert data['total_votes'] == 11
+
+    headers = auth_headers(db.fixtures['alice'], 'alice')
+    details = json.loads(client.get(f'/api/polls/{poll_id}/details', headers=headers).data)
+    assert details['total_votes'] == 11
+    polls = json.loads(client.get('/api/polls', headers=headers).data)['polls']
+    assert [poll['total_votes'] for poll in polls if poll['id'] == poll_id] == [11]
+    batch = json.loads(client.get('/api/polls/batch?tokens=open-token').data)
+    assert batch['polls']['open-token']['total_votes'] == 11
+
+def test_slow_votes_grow_slots(client, db, monkeypatch):
+    """Test a poll whose counter updates are slow gets slot rows in the background."""
+    poll_id = db.fixtures['open_poll']
+    monkeypatch.setattr(app.counter_slots, 'lock_wait_threshold', 0)
+    monkeypatch.setattr(app.counter_slots, 'grow_after', 2)
+    # The eager grow job runs inside the vote request here, so its statements would count against the vote
+    monkeypatch.setattr(app.query_recorder, 'mode', 'off')
+
+    vote(client, 'grow1@example.com', db.fixtures['options'][poll_id][0])
+    vote(client, 'grow2@example.com', db.fixtures['options'][poll_id][0])
+
+    assert db.conn.execute('SELECT slots FROM poll_counter_slots WHERE poll_id = ?', (poll_id,)).fetchone()[0] == 2
+    assert db.conn.execute('SELECT COUNT(*) FROM option_vote_slots').fetchone()[0] == 3
+    assert app.counter_slots.slots(poll_id) == 2
+
+def test_create_poll_with_counter_slots(client, db, auth_headers):
+    """Test a poll can start with several counter slots, within max_slots."""
+    headers = auth_headers(db.fixtures['alice'], 'alice')
+    body = {'title': 'Hot', 'question': 'Which?', 'options': ['X', 'Y'], 'counter_slots': 8}
+
+    response = client.post('/api/polls', data=json.dumps(body), content_type='application/json', headers=headers)
+
+    assert response.status_code == 201
+    assert db.conn.execute('SELECT COUNT(*) FROM option_vote_slots').fetchone()[0] == 14
+
+    body['counter_slots'] = 1000
+    response = client.post('/api/polls', data=json.dumps(body), content_type='application/json', headers=headers)
+    assert response.status_code == 400
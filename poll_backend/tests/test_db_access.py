@@ -0,0 +1,107 @@
+import json
+
+import mysql.connector
+import pytest
+from mysql.connector.errors import PoolError
+
+import app
+from db_access import DatabaseDriver, PreparedStatements, pool_name, use_pure
+
+class FakeCursor:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class FakeConnection:
+    def __init__(self, connection_id=1):
+        self.connection_id = connection_id
+        self.prepared = []
+
+    def cursor(self, prepared=False):
+        cursor = FakeCursor()
+        if prepared:
+            self.prepared.append(cursor)
+        return cursor
+
+def test_driver_modes(monkeypatch):
+    """Test 'auto' uses the C extension only when it is installed."""
+    monkeypatch.setattr(mysql.connector, 'HAVE_CEXT', True)
+    assert use_pure('auto') is False
+    assert use_pure('pure') is True
+    monkeypatch.setattr(mysql.connector, 'HAVE_CEXT', False)
+    assert use_pure('auto') is True
+    with pytest.raises(RuntimeError):
+        use_pure('c')
+    with pytest.raises(ValueError):
+        use_pure('fast')
+
+def test_prepared_statements_reused_per_connection():
+    """Test each statement is prepared once per connection and the least recently used is closed."""
+    connection = FakeConnection()
+    statements = PreparedStatements(connection, max_size=2)
+    first, second, third = 'SELECT 1', 'SELECT 2', 'SELECT 3'
+
+    assert statements.cursor(first) is statements.cursor(first)
+    statements.cursor(second)
+    statements.cursor(first)
+    statements.cursor(third)
+
+    assert len(connection.prepared) == 3
+    assert [cursor.closed for cursor in connection.prepared] == [False, True, False]
+
+def test_statement_cache_follows_reconnects():
+    """Test a reconnected connection starts with an empty statement cache."""
+    driver = DatabaseDriver(pool_size=2)
+    connection = FakeConnection()
+
+    statements = driver.statements(connection)
+    assert driver.statements(connection) is statements
+    connection.connection_id = 2
+    assert driver.statements(connection) is not statements
+
+def test_pooled_connect_falls_back_when_exhausted(monkeypatch):
+    """Test an exhausted pool still yields a connection, just not a pooled one."""
+    calls = []
+
+    def connect(**config):
+        calls.append(config)
+        if 'pool_name' in config:
+            raise PoolError("Failed getting connection; pool exhausted")
+        return 'connection'
+
+    monkeypatch.setattr(mysql.connector, 'connect', connect)
+    driver = DatabaseDriver(pool_size=4)
+
+    assert driver.connect({'host': 'db'}) == 'connection'
+    assert calls[0]['pool_name'] == pool_name({'host': 'db'})
+    assert calls[0]['pool_reset_session'] is False
+    assert calls[1] == {'host': 'db'}
+    assert pool_name({'host': 'db'}) != pool_name({'host': 'replica'})
+
+def test_hot_routes_with_prepared_statements(client, db, auth_headers, monkeypatch):
+    """Test votes and poll reads give the same results, in the same statements, when prepared."""
+    monkeypatch.setattr(app.db_driver, 'pool_size', 4)
+    prepared = []
+    cursor = PreparedStatements.cursor
+    monkeypatch.setattr(PreparedStatements, 'cursor', lambda self, sql: prepared.append(sql) or cursor(self, sql))
+    poll_id = db.fixtures['open_poll']
+
+    response = client.post('/api/polls/open-token/vote', data=json.dumps({
+        'voter_name': 'Prep', 'voter_email': 'prep@example.com',
+        'selected_option': db.fixtures['options'][poll_id][2]
+    }), content_type='application/json')
+    assert response.status_code == 200
+    assert len(db.queries) == 6
+    assert prepared == [app.VOTE_POLL_SQL, app.VOTER_EXISTS_SQL, app.OPTION_IN_POLL_SQL,
+                        app.INCREMENT_OPTION_SQL, app.POLL_OPTIONS_SQL]
+
+    db.reset_queries()
+    data = json.loads(client.get('/api/polls/open-token').data)
+    assert [option['votes'] for option in data['options']] == [2, 1, 1]
+    assert len(db.queries) == 2
+
+    headers = auth_headers(db.fixtures['alice'], 'alice')
+    polls = json.loads(client.get('/api/polls', headers=headers).data)['polls']
+    assert [poll['total_votes'] for poll in polls if poll['id'] == poll_id] == [4]
@@ -0,0 +1,199 @@
+import json
+import threading
+
+import pytest
+from unittest.mock import MagicMock
+
+import app
+from db_router import READ_PRIMARY_COOKIE, READ_PRIMARY_HEADER, ReplicaRouter, parse_replica_hosts
+from share_tokens import parse_share_token
+from sqlite_db import SQLiteDatabase
+
+PRIMARY = {'host': 'primary', 'database': 'poll_app'}
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def make_router(lags, **kwargs):
+    """Router over replicas whose lag is looked up by host in ``lags``."""
+    def connect(**config):
+        connection = MagicMock()
+        connection.host = config['host']
+        return connection
+
+    def probe(connection):
+        lag = lags[connection.host]
+        if isinstance(lag, Exception):
+            raise lag
+        return lag
+
+    replicas = [dict(PRIMARY, host=host) for host in lags]
+    router = ReplicaRouter(connect, {'api.read'}, replicas, lag_probe=probe, background=False, **kwargs)
+    router.probe_all()
+    return router
+
+def test_parse_replica_hosts():
+    """Test replica configs inherit the primary settings."""
+    replicas = parse_replica_hosts('r1, r2:3307', PRIMARY)
+
+    assert replicas == [{'host': 'r1', 'database': 'poll_app'},
+                        {'host': 'r2', 'database': 'poll_app', 'port': 3307}]
+    assert parse_replica_hosts(None, PRIMARY) == []
+
+def test_reads_round_robin_over_replicas():
+    """Test read routes spread over replicas and other routes use the primary."""
+    router = make_router({'r1': 0, 'r2': 1})
+
+    hosts = [router.choose(PRIMARY, 'api.read')['host'] for _ in range(4)]
+
+    assert hosts == ['r1', 'r2', 'r1', 'r2']
+    assert router.choose(PRIMARY, 'api.write') is PRIMARY
+    assert router.choose(PRIMARY, None) is PRIMARY
+
+def test_lagging_or_broken_replicas_fall_back_to_primary():
+    """Test replicas above the lag threshold or unreachable are skipped."""
+    lags = {'r1': 30, 'r2': ConnectionError('down')}
+    router = make_router(lags, max_lag=5)
+
+    assert router.choose(PRIMARY, 'api.read') is PRIMARY
+
+    lags['r1'] = None  # replication stopped
+    router = make_router(lags, max_lag=5)
+    assert router.choose(PRIMARY, 'api.read') is PRIMARY
+
+def test_lag_is_only_probed_off_the_request_path():
+    """Test choosing a replica uses the last probe and never probes itself."""
+    lags = {'r1': 0}
+    router = make_router(lags)
+
+    assert router.choose(PRIMARY, 'api.read')['host'] == 'r1'
+    lags['r1'] = 60
+    assert router.choose(PRIMARY, 'api.read')['host'] == 'r1'
+
+    router.probe_all()
+    assert router.choose(PRIMARY, 'api.read') is PRIMARY
+
+def test_unprobed_replicas_are_not_used():
+    """Test replicas are skipped until their first lag probe."""
+    router = ReplicaRouter(MagicMock(), {'api.read'}, [dict(PRIMARY, host='r1')], background=False)
+
+    assert router.choose(PRIMARY, 'api.read') is PRIMARY
+
+def test_probe_failures_are_logged_once(capsys):
+    """Test a failing probe (such as a missing REPLICATION CLIENT grant) is logged, not repeated."""
+    lags = {'r1': PermissionError('Access denied; you need the REPLICATION CLIENT privilege')}
+    router = make_router(lags)
+    router.probe_all()
+
+    assert capsys.readouterr().out.count('REPLICATION CLIENT') == 1
+    assert router.choose(PRIMARY, 'api.read') is PRIMARY
+
+    lags['r1'] = 0
+    router.probe_all()
+    assert 'recovered' in capsys.readouterr().out
+    assert router.choose(PRIMARY, 'api.read')['host'] == 'r1'
+
+def test_background_thread_probes_replicas():
+    """Test configuring replicas starts the probe thread."""
+    probed = threading.Event()
+
+    def probe(connection):
+        probed.set()
+        return 0
+
+    router = ReplicaRouter(MagicMock(), {'api.read'}, lag_probe=probe)
+    router.configure([dict(PRIMARY, host='r1')])
+
+    assert probed.wait(2)
+
+def test_read_your_writes_window():
+    """Test a client holding a write marker reads from the primary until the window passes."""
+    clock = FakeClock()
+    router = make_router({'r1': 0}, read_your_writes_window=10, clock=clock)
+
+    marker = router.write_marker()
+
+    assert router.choose(PRIMARY, 'api.read', marker) is PRIMARY
+    assert router.choose(PRIMARY, 'api.read', str(marker)) is PRIMARY
+    assert router.choose(PRIMARY, 'api.read', None)['host'] == 'r1'
+    assert router.choose(PRIMARY, 'api.read', 'garbage')['host'] == 'r1'
+    clock.now += 11
+    assert router.choose(PRIMARY, 'api.read', marker)['host'] == 'r1'
+
+@pytest.fixture
+def replica(db, monkeypatch):
+    """A second SQLite database acting as a replica of the test database."""
+    replica_db = SQLiteDatabase()
+    replica_db.load_fixtures()
+    replica_db.conn.execute("UPDATE polls SET title = 'From replica' WHERE share_token = ?",
+                            (parse_share_token('open-token'),))
+
+    def connect(**config):
+        return (replica_db if config['host'] == 'replica' else db).connect(**config)
+
+    monkeypatch.setattr(app.mysql.connector, 'connect', connect)
+    monkeypatch.setattr(app.db_router, 'lag_probe', lambda connection: replica_db.lag)
+    monkeypatch.setattr(app.db_router, 'background', False)
+    replica_db.lag = 0
+    app.db_router.configure([dict(app.DB_CONFIG, host='replica')])
+    app.db_router.probe_all()
+    yield replica_db
+    app.db_router.configure([])
+
+def test_public_reads_use_replica(client, db, replica):
+    """Test the share-token view is read from the replica until it lags."""
+    response = client.get('/api/polls/open-token')
+    assert json.loads(response.data)['poll']['title'] == 'From replica'
+
+    replica.lag = 60
+    app.db_router.probe_all()
+    response = client.get('/api/polls/open-token')
+    assert json.loads(response.data)['poll']['title'] == 'Lunch'
+
+def test_writes_go_to_primary(client, db, replica, auth_headers):
+    """Test votes are written to the primary, and new polls are found there."""
+    option = db.fixtures['options'][db.fixtures['open_poll']][2]
+    vote = {'voter_name': 'P', 'voter_email': 'p@example.com', 'selected_option': option}
+
+    response = client.post('/api/polls/open-token/vote', data=json.dumps(vote), content_type='application/json')
+
+    assert response.status_code == 200
+    assert db.conn.execute("SELECT COUNT(*) FROM votes WHERE voter_email = 'p@example.com'").fetchone()[0] == 1
+    assert replica.conn.execute("SELECT COUNT(*) FROM votes WHERE voter_email = 'p@example.com'").fetchone()[0] == 0
+
+    # A poll that has not replicated yet is read from the primary
+    headers = auth_headers(db.fixtures['bob'], 'bob')
+    response = client.post('/api/polls', headers=headers, content_type='application/json',
+                           data=json.dumps({'title': 'New', 'question': 'Q?', 'options': ['A', 'B']}))
+    share_token = json.loads(response.data)['share_token']
+    assert client.get(f'/api/polls/{share_token}').status_code == 200
+
+def test_owner_reads_own_writes(client, db, replica, auth_headers):
+    """Test an owner's dashboard comes from the primary right after they create a poll."""
+    headers = auth_headers(db.fixtures['alice'], 'alice')
+    titles = {poll['title'] for poll in json.loads(client.get('/api/polls', headers=headers).data)['polls']}
+    assert 'From replica' in titles
+
+    client.post('/api/polls', headers=headers, content_type='application/json',
+                data=json.dumps({'title': 'Fresh', 'question': 'Q?', 'options': ['A', 'B']}))
+
+    titles = {poll['title'] for poll in json.loads(client.get('/api/polls', headers=headers).data)['polls']}
+    assert {'Fresh', 'Lunch'} <= titles
+
+def test_write_marker_reaches_other_workers(client, db, replica, auth_headers):
+    """Test the read-your-writes marker is handed to the client rather than kept in the worker."""
+    headers = auth_headers(db.fixtures['alice'], 'alice')
+    response = client.post('/api/polls', headers=headers, content_type='application/json',
+                           data=json.dumps({'title': 'Fresh', 'question': 'Q?', 'options': ['A', 'B']}))
+    marker = response.headers[READ_PRIMARY_HEADER]
+
+    # Without the cookie (another browser, or an API client) the header carries the marker
+    client.delete_cookie(READ_PRIMARY_COOKIE)
+    polls = json.loads(client.get('/api/polls', headers=headers).data)['polls']
+    assert 'Fresh' not in {poll['title'] for poll in polls}
+    polls = json.loads(client.get('/api/polls', headers={**headers, READ_PRIMARY_HEADER: marker}).data)['polls']
+    assert 'Fresh' in {poll['title'] for poll in polls}
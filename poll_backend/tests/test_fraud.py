@@ -0,0 +1,86 @@
+import json
+
+import app
+from fraud import DOMAIN, IP, QUARANTINE, SUBNET, FraudDetector, WindowedCountMin, vote_keys
+
+def test_vote_keys():
+    """Test votes count by address, network and email domain, skipping what cannot be read or is ignored."""
+    assert vote_keys('203.0.113.9', 'Ann@Example.ORG') == \
+        [(IP, '203.0.113.9'), (SUBNET, '203.0.113.0/24'), (DOMAIN, 'example.org')]
+    assert vote_keys('2001:db8::1', 'a@gmail.com', ignored_domains={'gmail.com'}) == \
+        [(IP, '2001:db8::1'), (SUBNET, '2001:db8::/48')]
+    assert vote_keys('unknown', '') == []
+
+def test_counts_slide_out_of_the_window():
+    """Test a key's count covers only the live buckets, and other keys barely disturb it."""
+    counters = WindowedCountMin(buckets=3, width=64, depth=4)
+    assert [counters.add('a', 0) for _ in range(3)] == [1, 2, 3]
+    for index in range(40):
+        counters.add(f'other{index}', 1)
+    assert counters.add('a', 2) == 4
+    assert counters.add('a', 3) == 2
+    assert counters.add('a', 6) == 1
+
+def test_detector_flags_bursts_per_poll():
+    """Test reasons are reported once a key passes its threshold within the window, per poll."""
+    clock = [0.0]
+    detector = FraudDetector({IP: 2, SUBNET: 3, DOMAIN: 0}, window=60, clock=lambda: clock[0])
+    checks = [detector.check(1, f'198.51.100.{index % 2}', f'v{index}@spam.test') for index in range(4)]
+
+    assert checks == [[], [], [], [SUBNET]]
+    assert detector.check(1, '198.51.100.1', 'x@spam.test') == [IP, SUBNET]
+    assert detector.check(2, '198.51.100.1', 'x@spam.test') == []
+    clock[0] = 61
+    assert detector.check(1, '198.51.100.1', 'x@spam.test') == []
+    assert not FraudDetector({IP: 0}).enabled
+
+def vote(client, db, email):
+    pizza = db.fixtures['options'][db.fixtures['open_poll']][0]
+    return client.post('/api/polls/open-token/vote', content_type='application/json',
+                       data=json.dumps({'voter_name': 'S', 'voter_email': email, 'selected_option': pizza}))
+
+def flagged_votes(client, db, auth_headers):
+    details = client.get(f"/api/polls/{db.fixtures['open_poll']}/details",
+                         headers=auth_headers(db.fixtures['alice'], 'alice'))
+    return json.loads(details.data)['flagged_votes']
+
+def test_suspicious_votes_are_quarantined(client, db, auth_headers, monkeypatch):
+    """Test votes past a threshold are held back uncounted and reported in the details view."""
+    monkeypatch.setattr(app.fraud_detector, 'thresholds', {IP: 2})
+    monkeypatch.setattr(app, 'FRAUD_ACTION', QUARANTINE)
+    assert [vote(client, db, f's{index}@example.com').status_code for index in range(3)] == [200, 200, 202]
+
+    pizza = db.fixtures['options'][db.fixtures['open_poll']][0]
+    assert db.conn.execute('SELECT votes FROM options WHERE id = ?', (pizza,)).fetchone()[0] == 4
+    assert db.conn.execute('SELECT voter_email, reasons FROM quarantined_votes').fetchall() == \
+        [('s2@example.com', IP)]
+    assert flagged_votes(client, db, auth_headers) == \
+        {'flagged': 1, 'quarantined': 1, 'reasons': {IP: 1, SUBNET: 0, DOMAIN: 0}}
+
+def test_flagged_votes_still_count(client, db, auth_headers, monkeypatch):
+    """Test the default action counts a suspicious vote and only reports it."""
+    monkeypatch.setattr(app.fraud_detector, 'thresholds', {IP: 1, DOMAIN: 1})
+    assert flagged_votes(client, db, auth_headers)['flagged'] == 0
+    assert vote(client, db, 'f1@burst.test').status_code == 200
+    assert vote(client, db, 'f2@burst.test').status_code == 200
+
+    assert flagged_votes(client, db, auth_headers) == \
+        {'flagged': 1, 'quarantined': 0, 'reasons': {IP: 1, SUBNET: 0, DOMAIN: 1}}
+    assert db.conn.execute('SELECT COUNT(*) FROM quarantined_votes').fetchone()[0] == 0
+
+def test_closed_poll_details_report_flagged_votes(client, db, auth_headers):
+    """Test the details of a closed poll, served from its frozen results, still carry the flagged votes."""
+    poll_id = db.fixtures['closed_poll']
+    db.conn.execute('INSERT INTO vote_flags (poll_id, flagged, ip) VALUES (?, 1, 1)', (poll_id,))
+
+    response = client.get(f'/api/polls/{poll_id}/details', headers=auth_headers(db.fixtures['alice'], 'alice'))
+    assert response.status_code == 200
+    assert 'immutable' not in response.headers['Cache-Control']
+    assert json.loads(response.data)['flagged_votes'] == \
+        {'flagged': 1, 'quarantined': 0, 'reasons': {IP: 1, SUBNET: 0, DOMAIN: 0}}
+
+    # Served again from the snapshot cache, still with the counts
+    db.reset_queries()
+    response = client.get(f'/api/polls/{poll_id}/details', headers=auth_headers(db.fixtures['alice'], 'alice'))
+    assert json.loads(response.data)['flagged_votes']['flagged'] == 1
+    assert len(db.queries) == 2
@@ -0,0 +1,113 @@
+import json
+
+import app
+from idempotency import IdempotencyStore
+
+def test_store_ttl_and_pending_claims(db):
+    """Test stored responses expire after the TTL and abandoned claims can be taken over."""
+    clock = [0.0]
+    store = IdempotencyStore(connect=db.connect, ttl=10, pending_ttl=5, clock=lambda: clock[0])
+
+    assert store.begin('a', 'f') == ('new', None)
+    assert store.begin('a', 'f') == ('pending', None)
+    store.finish('a', 'f', 201, b'{}', 'application/json')
+    state, stored = store.begin('a', 'f')
+    assert (state, stored.status, stored.body) == ('replay', 201, b'{}')
+    assert store.begin('a', 'other') == ('mismatch', None)
+
+    clock[0] = 10
+    assert store.begin('a', 'f') == ('new', None)
+    clock[0] = 15
+    assert store.begin('a', 'f') == ('new', None)
+    assert store.purge() == 0
+    clock[0] = 20
+    assert store.purge() == 1
+    assert db.conn.execute('SELECT COUNT(*) FROM idempotency_keys').fetchone()[0] == 0
+
+def test_keys_are_shared_between_workers(db):
+    """Test a retry that reaches another worker's store is replayed from the shared table."""
+    first = IdempotencyStore(connect=db.connect)
+    second = IdempotencyStore(connect=db.connect)
+
+    assert first.begin('k', 'f') == ('new', None)
+    assert second.begin('k', 'f') == ('pending', None)
+    first.finish('k', 'f', 200, b'ok', 'text/plain')
+    assert second.begin('k', 'f')[0] == 'replay'
+
+def test_finished_responses_are_replayed_from_memory(db):
+    """Test replays after the first are answered from the in-process cache until they expire."""
+    clock = [0.0]
+    first = IdempotencyStore(connect=db.connect, ttl=10, clock=lambda: clock[0])
+    second = IdempotencyStore(connect=db.connect, ttl=10, clock=lambda: clock[0])
+    first.begin('k', 'f')
+    first.finish('k', 'f', 200, b'ok', 'text/plain')
+
+    db.reset_queries()
+    assert first.begin('k', 'f')[0] == 'replay'
+    assert first.begin('k', 'other') == ('mismatch', None)
+    assert db.queries == []
+
+    # Another worker reads the table once, then remembers the response
+    assert second.begin('k', 'f')[0] == 'replay'
+    queries = len(db.queries)
+    assert second.begin('k', 'f')[0] == 'replay'
+    assert len(db.queries) == queries
+
+    clock[0] = 10
+    assert first.begin('k', 'f') == ('new', None)
+
+def test_retried_poll_creation_replays(client, db, auth_headers):
+    """Test a retried poll creation returns the first poll instead of creating another."""
+    headers = dict(auth_headers(db.fixtures['alice'], 'alice'), **{'Idempotency-Key': 'create-1'})
+    poll = json.dumps({'title': 'T', 'question': 'Q?', 'options': ['A', 'B']})
+
+    first = client.post('/api/polls', data=poll, content_type='application/json', headers=headers)
+    db.reset_queries()
+    retry = client.post('/api/polls', data=poll, content_type='application/json', headers=headers)
+
+    assert retry.status_code == 201
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert json.loads(retry.data)['share_token'] == json.loads(first.data)['share_token']
+    # Replayed from this worker's memory
+    assert db.queries == []
+    assert db.conn.execute("SELECT COUNT(*) FROM polls WHERE title = 'T'").fetchone()[0] == 1
+
+    other = json.dumps({'title': 'Other', 'question': 'Q?', 'options': ['A', 'B']})
+    assert client.post('/api/polls', data=other, content_type='application/json', headers=headers).status_code == 422
+
+def test_keys_are_scoped_per_user(client, db, auth_headers):
+    """Test two users sending the same key both get their own poll."""
+    poll = json.dumps({'title': 'Shared key', 'question': 'Q?', 'options': ['A', 'B']})
+    for user in ('alice', 'bob'):
+        headers = dict(auth_headers(db.fixtures[user], user), **{'Idempotency-Key': 'same'})
+        assert client.post('/api/polls', data=poll, content_type='application/json', headers=headers).status_code == 201
+
+    assert db.conn.execute("SELECT COUNT(*) FROM polls WHERE title = 'Shared key'").fetchone()[0] == 2
+
+def test_retried_vote_replays(client, db):
+    """Test a retried vote replays the recorded response without voting again."""
+    option = db.fixtures['options'][db.fixtures['open_poll']][2]
+    vote = json.dumps({'voter_name': 'R', 'voter_email': 'retry@example.com', 'selected_option': option})
+    headers = {'Idempotency-Key': 'vote-1'}
+
+    first = client.post('/api/polls/open-token/vote', data=vote, content_type='application/json', headers=headers)
+    db.reset_queries()
+    retry = client.post('/api/polls/open-token/vote', data=vote, content_type='application/json', headers=headers)
+
+    assert retry.status_code == 200
+    assert retry.data == first.data
+    assert db.queries == []
+    assert db.conn.execute("SELECT COUNT(*) FROM votes WHERE voter_email = 'retry@example.com'").fetchone()[0] == 1
+
+def test_server_errors_are_not_stored(client, db, monkeypatch):
+    """Test a failed request can be retried with the same key."""
+    option = db.fixtures['options'][db.fixtures['open_poll']][2]
+    vote = json.dumps({'voter_name': 'E', 'voter_email': 'error@example.com', 'selected_option': option})
+    headers = {'Idempotency-Key': 'vote-error'}
+
+    with monkeypatch.context() as patch:
+        patch.setattr(app.vote_frames, 'discard', lambda poll_id: 1 / 0)
+        assert client.post('/api/polls/open-token/vote', data=vote, content_type='application/json',
+                           headers=headers).status_code == 500
+
+    assert db.conn.execute('SELECT COUNT(*) FROM idempotency_keys').fetchone()[0] == 0
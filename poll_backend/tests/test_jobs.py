@@ -0,0 +1,155 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from jobs import Job, JobRunner
+
+def test_jobs_run_in_background():
+    """Test enqueued jobs run on worker threads and show up in the stats."""
+    runner = JobRunner(workers=2)
+    done = []
+    runner.register('record', done.append)
+
+    for value in range(5):
+        runner.enqueue('record', value)
+
+    assert runner.drain()
+    assert sorted(done) == [0, 1, 2, 3, 4]
+    stats = runner.stats()
+    assert stats['queued'] == 0
+    assert stats['jobs']['record']['completed'] == 5
+    assert stats['jobs']['record']['avg_wait_ms'] is not None
+    runner.stop()
+
+def test_failed_jobs_retry_with_backoff():
+    """Test a failing job is retried until it succeeds or runs out of attempts."""
+    runner = JobRunner(workers=1)
+    attempts = []
+
+    def flaky(limit):
+        attempts.append(time.monotonic())
+        if len(attempts) < limit:
+            raise RuntimeError('not yet')
+
+    runner.register('flaky', flaky, max_attempts=3, backoff=0.05)
+    runner.enqueue('flaky', 3)
+    assert runner.drain()
+
+    assert len(attempts) == 3
+    assert attempts[2] - attempts[1] >= 0.09
+    stats = runner.stats()['jobs']['flaky']
+    assert (stats['retried'], stats['completed'], stats['failed']) == (2, 1, 0)
+
+    attempts.clear()
+    runner.enqueue('flaky', 10)
+    assert runner.drain()
+    assert len(attempts) == 3
+    assert runner.stats()['jobs']['flaky']['failed'] == 1
+    runner.stop()
+
+def test_concurrency_limit_per_job_type():
+    """Test a job type never runs more often at once than its limit."""
+    runner = JobRunner(workers=4)
+    lock = threading.Lock()
+    running = [0, 0]
+
+    def slow():
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    runner.register('slow', slow, concurrency=2)
+    for _ in range(6):
+        runner.enqueue('slow')
+
+    assert runner.drain()
+    assert running[1] == 2
+    runner.stop()
+
+def test_journal_requeues_unfinished_jobs(tmp_path):
+    """Test jobs still queued when the process stopped run after a restart."""
+    path = str(tmp_path / 'jobs.log')
+    stopped = JobRunner(workers=0, queue_path=path)
+    stopped.register('record', lambda value: None)
+    stopped.enqueue('record', 'first')
+    stopped.enqueue('record', 'second')
+
+    done = []
+    restarted = JobRunner(workers=1, queue_path=path)
+    restarted.register('record', done.append)
+    restarted.start()
+
+    assert restarted.drain()
+    assert done == ['first', 'second']
+    restarted.stop()
+    assert JobRunner(queue_path=path)._recover() == []
+
+def test_journals_of_running_workers_are_left_alone(tmp_path):
+    """Test a worker adopts the journals of stopped workers but not those of running ones."""
+    path = str(tmp_path / 'jobs.log')
+    finished = subprocess.Popen([sys.executable, '-c', 'pass'])
+    finished.wait()
+    for pid, value in ((finished.pid, 'orphaned'), (os.getppid(), 'running')):
+        job = Job('record', [value])
+        with open(f'{path}.{pid}', 'w') as journal:
+            journal.write(json.dumps({'op': 'add', 'job': job.to_record()}) + '\n')
+
+    done = []
+    runner = JobRunner(workers=1, queue_path=path)
+    runner.register('record', done.append)
+    runner.start()
+
+    assert runner.drain()
+    assert done == ['orphaned']
+    runner.stop()
+    assert not os.path.exists(f'{path}.{finished.pid}')
+    assert os.path.exists(f'{path}.{os.getppid()}')
+
+def test_journal_is_compacted_as_jobs_finish(tmp_path):
+    """Test the journal is rewritten with only the pending jobs once enough jobs have finished."""
+    path = str(tmp_path / 'jobs.log')
+    release = threading.Event()
+    runner = JobRunner(workers=1, queue_path=path, compact_after=3)
+    runner.register('record', lambda value: None)
+    runner.register('blocked', lambda: release.wait(5))
+
+    def journal():
+        with open(f'{path}.{os.getpid()}') as entries:
+            return [json.loads(line) for line in entries]
+
+    for value in range(7):
+        runner.enqueue('record', value)
+        assert runner.drain()
+    # The first six jobs were compacted away; only the seventh's add and done remain
+    assert [entry['op'] for entry in journal()] == ['add', 'done']
+
+    runner.enqueue('blocked')
+    runner.enqueue('record', 'pending')
+    assert JobRunner(queue_path=path)._recover()[-1].args == ['pending']
+    release.set()
+    assert runner.drain()
+    runner.stop()
+
+def test_process_pool_jobs():
+    """Test job types marked process=True run in the process pool."""
+    runner = JobRunner(workers=1, process_workers=1)
+    runner.register('power', pow, process=True)
+
+    runner.enqueue('power', 2, 10)
+
+    assert runner.drain(timeout=30)
+    assert runner.stats()['jobs']['power']['completed'] == 1
+    runner.stop()
+
+def test_job_metrics_endpoint(client):
+    """Test the job stats are served for monitoring."""
+    response = client.get('/metrics/jobs')
+
+    assert response.status_code == 200
+    assert 'emit_vote_update' in json.loads(response.data)['jobs']
@@ -0,0 +1,121 @@
+import unittest
+import os
+import sys
+import time
+import datetime
+import threading
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from lifecycle import PollLifecycle, close_timestamp
+
+class FakeClock:
+    """A clock that only moves when a test advances it."""
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+class TestPollLifecycle(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock(datetime.datetime(2024, 6, 1, 12, tzinfo=datetime.timezone.utc).timestamp())
+
+    def test_close_timestamp_end_of_day(self):
+        """Test that polls close at the end of their end date, in UTC."""
+        expected = datetime.datetime(2024, 12, 31, 23, 59, 59, tzinfo=datetime.timezone.utc).timestamp()
+
+        self.assertEqual(close_timestamp(datetime.date(2024, 12, 31)), expected)
+        self.assertEqual(close_timestamp(datetime.datetime(2024, 12, 31, 8, 30)), expected)
+        self.assertEqual(close_timestamp('2024-12-31'), expected)
+        self.assertIsNone(close_timestamp(None))
+
+    def test_track_open_and_closed_polls(self):
+        """Test the cached open flag for tracked polls."""
+        lifecycle = PollLifecycle(clock=self.clock, background=False)
+        today = datetime.date(2024, 6, 1)
+
+        lifecycle.track(1, today + datetime.timedelta(days=1))
+        lifecycle.track(2, today - datetime.timedelta(days=1))
+        lifecycle.track(3, None)
+
+        self.assertTrue(lifecycle.is_open(1))
+        self.assertFalse(lifecycle.is_open(2))
+        self.assertTrue(lifecycle.is_open(3))
+        self.assertIsNone(lifecycle.is_open(4))
+
+    def test_track_reschedules_changed_end_date(self):
+        """Test that a changed end date reopens or closes the poll."""
+        lifecycle = PollLifecycle(clock=self.clock, background=False)
+        today = datetime.date(2024, 6, 1)
+
+        lifecycle.track(1, today - datetime.timedelta(days=1))
+        self.assertFalse(lifecycle.is_open(1))
+
+        lifecycle.track(1, today + datetime.timedelta(days=1))
+        self.assertTrue(lifecycle.is_open(1))
+
+        lifecycle.track(1, today - datetime.timedelta(days=1))
+        self.assertFalse(lifecycle.is_open(1))
+
+    def test_scheduled_close_calls_on_close(self):
+        """Test that a poll closes and fires on_close once its close time passes."""
+        closed = []
+        lifecycle = PollLifecycle(on_close=closed.append, clock=self.clock, background=False)
+        lifecycle.schedule(1, self.clock() + 10)
+        lifecycle.schedule(2, self.clock() + 60)
+
+        self.assertEqual(lifecycle.close_due(), [])
+        self.assertTrue(lifecycle.is_open(1))
+
+        self.clock.now += 10
+        self.assertEqual(lifecycle.close_due(), [1])
+        self.assertEqual(closed, [1])
+        self.assertFalse(lifecycle.is_open(1))
+        self.assertTrue(lifecycle.is_open(2))
+
+        self.clock.now += 100
+        self.assertEqual(lifecycle.close_due(), [2])
+        self.assertEqual(lifecycle.close_due(), [])
+        self.assertEqual(closed, [1, 2])
+
+    def test_closed_polls_are_not_kept(self):
+        """Test that closed polls are dropped rather than kept forever."""
+        lifecycle = PollLifecycle(clock=self.clock, background=False)
+        for poll_id in range(100):
+            lifecycle.schedule(poll_id, self.clock() + poll_id + 1)
+        lifecycle.schedule(100, self.clock() - 1)
+
+        self.clock.now += 1000
+        lifecycle.close_due()
+        self.assertEqual(lifecycle._polls, {})
+        self.assertEqual(lifecycle._heap, [])
+
+    def test_forgotten_poll_does_not_close(self):
+        """Test that deleted polls are dropped from the schedule."""
+        closed = []
+        lifecycle = PollLifecycle(on_close=closed.append, clock=self.clock, background=False)
+        lifecycle.schedule(1, self.clock() + 5)
+        lifecycle.forget(1)
+        lifecycle.schedule(2, self.clock() + 10)
+
+        self.clock.now += 30
+        lifecycle.close_due()
+        self.assertEqual(closed, [2])
+        self.assertIsNone(lifecycle.is_open(1))
+
+    def test_background_thread_closes_polls(self):
+        """Test that the scheduler thread closes a poll without close_due being called."""
+        done = threading.Event()
+        lifecycle = PollLifecycle(on_close=lambda poll_id: done.set())
+        lifecycle.schedule(1, time.time() + 0.05)
+
+        self.assertTrue(done.wait(2))
+        self.assertIsNone(lifecycle.is_open(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
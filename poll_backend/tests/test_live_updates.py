@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+import app
+from live_updates import UpdateBroker, sse_frame
+
+def test_broker_history_and_resume():
+    """Test events are buffered per channel and resumes detect dropped events."""
+    broker = UpdateBroker(history=2)
+    for number in range(3):
+        broker.publish('poll', 'vote_update', {'n': number})
+
+    assert broker.last_id('poll') == 3
+    assert broker.since('poll', 2) == ([(3, 'vote_update', {'n': 2})], True)
+    assert broker.since('poll', 1)[1] is True
+    assert broker.since('poll', 0)[1] is False
+    assert broker.since('poll', 7)[1] is False
+    assert broker.wait('poll', 3, timeout=0.01) == []
+
+def test_broker_drops_idle_channels():
+    """Test channels beyond max_channels are dropped oldest first."""
+    broker = UpdateBroker(max_channels=2)
+    for key in ('a', 'b', 'c'):
+        broker.publish(key, 'vote_update', {})
+
+    assert len(broker) == 2
+    assert broker.last_id('a') == 0
+
+def test_sse_frame():
+    assert sse_frame('vote_update', {'a': 1}, 4) == 'id: 4\nevent: vote_update\ndata: {"a": 1}\n\n'
+
+@pytest.fixture
+def broker(monkeypatch):
+    broker = UpdateBroker()
+    monkeypatch.setattr(app, 'live_updates', broker)
+    monkeypatch.setattr(app, 'SSE_HEARTBEAT_SECONDS', 0.01)
+    return broker
+
+def open_stream(client, token, headers=None):
+    response = client.get(f'/api/polls/{token}/events', headers=headers, buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    frames = response.iter_encoded()
+    assert next(frames).startswith(b'retry: ')
+    return frames
+
+def parse(frame):
+    fields = dict(line.split(': ', 1) for line in frame.decode().strip().split('\n'))
+    return fields.get('id'), fields['event'], json.loads(fields['data'])
+
+def vote(client, db, email):
+    option = db.fixtures['options'][db.fixtures['open_poll']][0]
+    client.post('/api/polls/open-token/vote', content_type='application/json',
+                data=json.dumps({'voter_name': 'S', 'voter_email': email, 'selected_option': option}))
+
+def test_stream_sends_snapshot_then_updates(client, db, broker):
+    """Test a stream starts with the current tally, then follows votes with heartbeats in between."""
+    frames = open_stream(client, 'open-token')
+
+    event_id, event, payload = parse(next(frames))
+    assert (event_id, event, payload['total_votes']) == ('0', 'snapshot', 3)
+    assert next(frames) == b': heartbeat\n\n'
+
+    vote(client, db, 'sse@example.com')
+    assert parse(next(frames))[:2] == ('1', 'vote_update')
+
+def test_stream_resumes_from_last_event_id(client, db, broker):
+    """Test a reconnecting client gets only what it missed, without touching the database."""
+    vote(client, db, 'first@example.com')
+    vote(client, db, 'second@example.com')
+    db.reset_queries()
+
+    frames = open_stream(client, 'open-token', headers={'Last-Event-ID': '1'})
+
+    event_id, event, update = parse(next(frames))
+    assert (event_id, event, update['total_votes']) == ('2', 'vote_update', 5)
+    assert db.queries == []
+
+def test_stream_of_closed_poll_ends(client, db, broker):
+    """Test a closed poll's stream sends the final results and ends."""
+    frames = open_stream(client, 'closed-token')
+
+    assert parse(next(frames))[1] == 'snapshot'
+    assert parse(next(frames))[1] == 'poll_closed'
+    with pytest.raises(StopIteration):
+        next(frames)
+
+def test_stream_of_missing_poll(client, db, broker):
+    assert client.get('/api/polls/missing-token/events').status_code == 404
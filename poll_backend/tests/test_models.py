@@ -0,0 +1,48 @@
+import datetime
+from decimal import Decimal
+
+from bench_models import as_dict, as_model, bytes_per_poll
+from models import OptionCounts, Poll, PollSummary
+
+ROW = (3, 'Lunch', 'What should we eat?', datetime.datetime(2024, 5, 1, 23, 59, 59), 1, 'tok',
+       'alice', datetime.datetime(2024, 4, 1, 12), 1)
+
+def test_poll_payload():
+    """Test the public body matches the format clients already read."""
+    poll = Poll.from_row(ROW, [(1, 'Pizza', 2), (2, 'Sushi', 1)])
+
+    assert poll.payload() == {
+        'poll': {'id': 3, 'title': 'Lunch', 'question': 'What should we eat?', 'end_date': '2024-05-01 23:59:59',
+                 'user_id': 1, 'share_token': 'tok', 'creator_name': 'alice',
+                 'created_at': '2024-04-01T12:00:00', 'show_results_to_voters': True,
+                 'voting_method': 'single'},
+        'options': [{'id': 1, 'option_text': 'Pizza', 'votes': 2, 'percentage': 66.7},
+                    {'id': 2, 'option_text': 'Sushi', 'votes': 1, 'percentage': 33.3}],
+        'total_votes': 3
+    }
+    assert poll.details()['options'][0] == {'id': 1, 'option_text': 'Pizza', 'votes': 2}
+
+def test_option_counts():
+    """Test counts are read into the array, with missing counts as zero."""
+    counts = OptionCounts.from_rows([(1, 'A', None), (2, 'B', 1)])
+
+    assert list(counts.votes) == [0, 1]
+    assert counts.to_list()[1]['percentage'] == 100.0
+    assert OptionCounts().to_list() == []
+
+def test_option_counts_from_decimal_rows():
+    """Test counts MySQL returns as DECIMAL (summed counter slots) load as integers."""
+    counts = OptionCounts.from_rows([(1, 'A', Decimal('12')), (2, 'B', Decimal('0'))])
+
+    assert list(counts.votes) == [12, 0]
+    assert counts.to_list()[0] == {'id': 1, 'option_text': 'A', 'votes': 12, 'percentage': 100.0}
+
+def test_models_have_no_instance_dict():
+    """Test the records are slotted."""
+    for record in (Poll.from_row(ROW), OptionCounts(), next(iter(OptionCounts([1], ['A'], [0]))),
+                   PollSummary(1, 'T', 'Q', None, 'tok', None, 2, None)):
+        assert not hasattr(record, '__dict__')
+
+def test_models_use_less_memory_than_dicts():
+    """Test a cached Poll model is smaller than the dict payload it replaces."""
+    assert bytes_per_poll(as_model, polls=500) < bytes_per_poll(as_dict, polls=500) * 0.75
@@ -0,0 +1,58 @@
+import json
+
+import app
+from share_tokens import canonical_share_token
+
+def test_batch_reads_polls_in_two_queries(client, db):
+    """Test many polls are resolved with one polls query and one options query."""
+    response = client.get('/api/polls/batch?tokens=open-token,bob-token,missing-token,open-token')
+
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert sorted(data['polls']) == ['bob-token', 'open-token']
+    assert data['missing'] == ['missing-token']
+    assert [option['votes'] for option in data['polls']['open-token']['options']] == [2, 1, 0]
+    assert data['polls']['bob-token']['poll']['creator_name'] == 'bob'
+    assert len(db.queries) == 2
+
+def test_batch_serves_closed_polls_from_snapshots(client, db):
+    """Test frozen closed polls are answered without queries."""
+    client.get('/api/polls/closed-token')
+    db.reset_queries()
+
+    response = client.get('/api/polls/batch?tokens=closed-token')
+
+    assert json.loads(response.data)['polls']['closed-token']['total_votes'] == 1
+    assert db.queries == []
+
+def test_batch_limits(client, db, monkeypatch):
+    """Test empty and oversized batches are rejected."""
+    monkeypatch.setattr(app, 'MAX_BATCH_TOKENS', 2)
+
+    assert client.get('/api/polls/batch').status_code == 400
+    assert client.get('/api/polls/batch?tokens=a,b,c').status_code == 400
+
+def test_socket_subscribes_to_many_polls(client, db):
+    """Test one socket receives updates for exactly the polls it subscribed to."""
+    socket = app.socketio.test_client(app.app, namespace=app.POLLS_NAMESPACE)
+    ack = socket.emit('subscribe', {'share_tokens': ['open-token', 'bob-token']},
+                      namespace=app.POLLS_NAMESPACE, callback=True)
+    assert ack == {'success': True, 'subscribed': ['open-token', 'bob-token']}
+
+    for token, poll in (('open-token', 'open_poll'), ('closed-token', 'closed_poll')):
+        client.post(f'/api/polls/{token}/vote', content_type='application/json',
+                    data=json.dumps({'voter_name': 'S', 'voter_email': 'socket@example.com',
+                                     'selected_option': db.fixtures['options'][db.fixtures[poll]][0]}))
+
+    events = socket.get_received(app.POLLS_NAMESPACE)
+    # Events carry the canonical form of the token the poll was found by
+    assert [(event['name'], event['args'][0]['share_token']) for event in events] == [
+        ('vote_update', canonical_share_token('open-token'))]
+    assert events[0]['args'][0]['total_votes'] == 4
+
+    socket.emit('unsubscribe', {'share_tokens': ['open-token']}, namespace=app.POLLS_NAMESPACE)
+    client.post('/api/polls/open-token/vote', content_type='application/json',
+                data=json.dumps({'voter_name': 'S', 'voter_email': 'again@example.com',
+                                 'selected_option': db.fixtures['options'][db.fixtures['open_poll']][0]}))
+    assert socket.get_received(app.POLLS_NAMESPACE) == []
+    socket.disconnect(namespace=app.POLLS_NAMESPACE)
@@ -0,0 +1,112 @@
+import json
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+
+import app
+from profiler import RollingProfile, StackSampler, collapse
+
+def profiled(client, path, token='secret'):
+    return client.get(path, headers={'X-Profile-Token': token})
+
+def test_collapse_runs_from_outermost_frame():
+    """Test a collapsed stack lists module:function names outermost first."""
+    def inner():
+        return collapse(sys._getframe())
+
+    stack = inner()
+    assert stack.endswith('test_profiler:test_collapse_runs_from_outermost_frame;test_profiler:inner')
+    assert stack.count(';') >= 2
+
+def test_sampler_counts_registered_threads_only():
+    """Test sampling counts the stacks of started threads and stop returns them."""
+    sampler = StackSampler(interval=60)
+    other = threading.Event()
+    thread = threading.Thread(target=other.wait)
+    thread.start()
+    try:
+        sampler.start()
+        sampler.sample()
+        sampler.sample()
+        stacks = sampler.stop()
+    finally:
+        other.set()
+        thread.join()
+
+    assert sum(stacks.values()) == 2
+    assert all(stack.endswith('profiler:sample') for stack in stacks)
+    assert not any('Event:wait' in stack or 'threading:wait' in stack for stack in stacks)
+    assert sampler.stop() == Counter()
+
+def test_rolling_profile_drops_old_slices():
+    """Test stacks older than the window leave the folded output."""
+    clock = [0.0]
+    profile = RollingProfile(window=100, buckets=4, clock=lambda: clock[0])
+    profile.add('api.a', Counter({'x;y': 2}))
+    clock[0] = 30
+    profile.add('api.a', Counter({'x;y': 1, 'x;z': 5}))
+    profile.add('api.b', Counter({'w': 1}))
+
+    assert profile.folded() == 'api.a;x;z 5\napi.a;x;y 3\napi.b;w 1\n'
+    assert profile.folded('api.b') == 'api.b;w 1\n'
+    assert profile.requests() == {'api.a': 2, 'api.b': 1}
+
+    clock[0] = 110
+    assert profile.folded() == 'api.a;x;z 5\napi.a;x;y 1\napi.b;w 1\n'
+    clock[0] = 140
+    assert profile.folded() == ''
+
+def test_requests_are_profiled_by_token_or_sample_rate(client):
+    """Test only requests with the token, or picked by the sample rate, are profiled."""
+    app.request_profiler.configure(token='secret')
+
+    client.get('/healthz')
+    profiled(client, '/healthz', token='wrong')
+    assert app.request_profiler.profile.requests() == {}
+
+    profiled(client, '/healthz')
+    assert app.request_profiler.profile.requests() == {'api.healthz': 1}
+
+    app.request_profiler.configure(token='secret', sample_rate=1.0)
+    client.get('/healthz')
+    assert app.request_profiler.profile.requests() == {'api.healthz': 2}
+
+def test_profile_download_needs_token(client):
+    """Test the folded stacks download is hidden without the token and filters by route."""
+    app.request_profiler.profile.add('api.submit_vote', Counter({'app:submit_vote;app:load_poll': 4}))
+    app.request_profiler.profile.add('api.healthz', Counter({'app:healthz': 1}))
+
+    assert client.get('/debug/profile').status_code == 404
+    assert profiled(client, '/debug/profile').status_code == 404
+
+    app.request_profiler.configure(token='secret')
+    assert client.get('/debug/profile').status_code == 404
+    response = profiled(client, '/debug/profile?route=api.submit_vote')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert response.get_data(as_text=True) == 'api.submit_vote;app:submit_vote;app:load_poll 4\n'
+
+def test_non_ascii_token_is_refused(client):
+    """Test a token header with non-ASCII characters is refused instead of failing the request."""
+    app.request_profiler.configure(token='secret')
+
+    assert not app.request_profiler.authorized('s\u00e9cret')
+    assert profiled(client, '/healthz', token='s\u00e9cret').status_code == 200
+    assert profiled(client, '/debug/profile', token='s\u00e9cret').status_code == 404
+    assert app.request_profiler.profile.requests() == {}
+
+def test_allocations_are_reported_per_route(client):
+    """Test tracemalloc mode reports the bytes allocated by profiled requests."""
+    app.request_profiler.configure(token='secret', trace_allocations=True)
+    try:
+        profiled(client, '/healthz')
+        data = json.loads(profiled(client, '/debug/profile/allocations').data)
+    finally:
+        app.request_profiler.configure()
+
+    assert data['tracing'] is True
+    assert data['requests']['api.healthz'] == 1
+    assert data['allocations']['api.healthz']['requests'] == 1
+    assert data['allocations']['api.healthz']['allocated_bytes'] >= 0
+    assert not tracemalloc.is_tracing()
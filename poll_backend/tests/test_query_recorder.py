@@ -0,0 +1,89 @@
+import pytest
+from unittest.mock import MagicMock
+from flask import Flask
+
+import app
+from query_recorder import QueryRecorder, QueryBudgetExceeded, statement_shape
+
+def make_app(recorder, statements):
+    """Build a small app whose route runs the given statements."""
+    test_app = Flask(__name__)
+    test_app.config['TESTING'] = True
+    recorder.init_app(test_app)
+    connection = MagicMock()
+    connection.cursor.return_value.fetchall.return_value = [(1,), (2,)]
+
+    @test_app.route('/run')
+    def run():
+        cursor = recorder.wrap(connection).cursor()
+        for sql in statements:
+            cursor.execute(sql, (1,))
+        cursor.fetchall()
+        return 'ok'
+
+    return test_app
+
+def test_statement_shape():
+    """Test statements differing only in literals share a shape."""
+    assert statement_shape("SELECT * FROM polls WHERE id = 1") == statement_shape("SELECT *  FROM polls\n WHERE id = 42")
+    assert statement_shape("SELECT 'a' FROM t WHERE id IN (%s, %s, %s)") == "SELECT ? FROM t WHERE id IN (...)"
+
+def test_stats_reported_in_server_timing():
+    """Test the recorder reports statement and row counts per request."""
+    recorder = QueryRecorder({'run': 2}, mode='raise')
+    client = make_app(recorder, ['SELECT 1', 'SELECT 2']).test_client()
+
+    response = client.get('/run')
+
+    assert response.status_code == 200
+    assert '2 queries, 2 rows' in response.headers['Server-Timing']
+
+def test_over_budget_raises():
+    """Test exceeding a route's statement budget fails in raise mode."""
+    recorder = QueryRecorder({'run': 1}, mode='raise')
+    client = make_app(recorder, ['SELECT a FROM t', 'SELECT b FROM t']).test_client()
+
+    with pytest.raises(QueryBudgetExceeded, match='budget 1'):
+        client.get('/run')
+
+def test_allowed_and_unbudgeted_statements():
+    """Test statements an optional step allows, or that run unbudgeted, do not break the budget."""
+    recorder = QueryRecorder({'allowed': 1, 'unbudgeted': 1}, mode='raise')
+    test_app = Flask(__name__)
+    recorder.init_app(test_app)
+    connection = MagicMock()
+
+    @test_app.route('/allowed')
+    def allowed():
+        recorder.allow(1)
+        recorder.wrap(connection).cursor().execute('SELECT a FROM t')
+        recorder.wrap(connection).cursor().execute('SELECT b FROM t')
+        return 'ok'
+
+    @test_app.route('/unbudgeted')
+    def unbudgeted():
+        recorder.wrap(connection).cursor().execute('SELECT a FROM t')
+        recorder.wrap(connection, budgeted=False).cursor().execute('SELECT b FROM t')
+        return 'ok'
+
+    client = test_app.test_client()
+    assert client.get('/allowed').status_code == 200
+    response = client.get('/unbudgeted')
+    assert '2 queries' in response.headers['Server-Timing']
+
+def test_repeated_statement_detected(capsys):
+    """Test a statement run in a loop is reported as an N+1 pattern."""
+    recorder = QueryRecorder(mode='warn')
+    client = make_app(recorder, ['INSERT INTO options (poll_id) VALUES (%s)'] * 3).test_client()
+
+    response = client.get('/run')
+
+    assert response.status_code == 200
+    assert 'same statement 3 times' in capsys.readouterr().out
+
+def test_app_routes_enforce_budgets(client, db, auth_headers, monkeypatch):
+    """Test the app's own routes are checked against QUERY_BUDGETS."""
+    monkeypatch.setitem(app.query_recorder.budgets, 'api.get_polls', 0)
+
+    with pytest.raises(QueryBudgetExceeded, match='api.get_polls'):
+        client.get('/api/polls', headers=auth_headers(db.fixtures['alice'], 'alice'))
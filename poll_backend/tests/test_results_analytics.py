@@ -0,0 +1,101 @@
+import datetime
+import json
+
+import pytest
+
+from results_analytics import VoteFrame, VoteFrameCache, ip_prefix
+from vote_archive import read_archive, write_archive
+
+ROWS = [(1, 'a@Example.com', '10.0.0.7', datetime.datetime(2024, 5, 1, 9, 10)),
+        (1, 'b@example.com', '10.0.0.9', datetime.datetime(2024, 5, 1, 9, 50)),
+        (2, 'c@other.org', '2001:db8::1', datetime.datetime(2024, 5, 1, 10, 5)),
+        (2, 'd@example.com', None, datetime.datetime(2024, 5, 2, 8))]
+
+def test_ip_prefix():
+    """Test addresses are grouped by /24 (IPv4) and /48 (IPv6) networks."""
+    assert ip_prefix('10.0.0.7') == '10.0.0.0/24'
+    assert ip_prefix('2001:db8::1') == '2001:db8::/48'
+    assert ip_prefix(None) == ''
+
+def test_crosstab():
+    """Test votes are counted per combination of dimensions."""
+    frame = VoteFrame.from_rows(ROWS)
+
+    assert frame.crosstab(['option']) == [[1, 2], [2, 2]]
+    assert frame.crosstab(['option', 'hour']) == [[1, '2024-05-01T09:00:00', 2],
+                                                  [2, '2024-05-01T10:00:00', 1],
+                                                  [2, '2024-05-02T08:00:00', 1]]
+    assert frame.crosstab(['domain']) == [['example.com', 3], ['other.org', 1]]
+    assert frame.crosstab(['ip_prefix', 'day'])[0] == ['', '2024-05-02T00:00:00', 1]
+    assert VoteFrame.from_rows([]).crosstab(['option', 'domain']) == []
+    with pytest.raises(ValueError):
+        frame.crosstab(['country'])
+
+def test_frame_from_archive(tmp_path):
+    """Test an archived poll gives the same crosstabs as its live rows."""
+    path = str(tmp_path / 'poll_1.npz')
+    write_archive(path, [(index, row[0], 'Voter', row[1], row[2], row[3]) for index, row in enumerate(ROWS)])
+
+    frame = VoteFrame.from_archive(read_archive(path))
+
+    live = VoteFrame.from_rows(ROWS)
+    for dimensions in (['option', 'hour'], ['domain'], ['ip_prefix']):
+        assert frame.crosstab(dimensions) == live.crosstab(dimensions)
+
+def test_frame_from_empty_archive(tmp_path):
+    """Test a poll archived without votes gives an empty frame."""
+    path = str(tmp_path / 'poll_2.npz')
+    write_archive(path, [])
+
+    frame = VoteFrame.from_archive(read_archive(path))
+
+    assert frame.size == 0
+    assert frame.crosstab(['option', 'domain']) == []
+
+def test_frame_cache_lru_and_age():
+    """Test frames are evicted least recently used first and expire after max_age."""
+    clock = [0.0]
+    cache = VoteFrameCache(max_size=2, max_age=10, clock=lambda: clock[0])
+    for poll_id in (1, 2):
+        cache.put(poll_id, VoteFrame.from_rows(ROWS))
+    cache.get(1)
+    cache.put(3, VoteFrame.from_rows(ROWS))
+
+    assert cache.get(2) is None
+    assert cache.get(1) is not None
+    clock[0] = 10
+    assert cache.get(1) is None
+
+def test_crosstab_route(client, db, auth_headers):
+    """Test the crosstab route loads a poll's votes once and serves repeats from memory."""
+    headers = auth_headers(db.fixtures['alice'], 'alice')
+    poll_id = db.fixtures['open_poll']
+    pizza, sushi, _ = db.fixtures['options'][poll_id]
+
+    response = client.get(f'/api/polls/{poll_id}/crosstab?by=option,domain', headers=headers)
+
+    assert response.status_code == 200
+    assert json.loads(response.data)['rows'] == [[pizza, 'example.com', 2], [sushi, 'example.com', 1]]
+    assert len(db.queries) == 2
+
+    db.reset_queries()
+    response = client.get(f'/api/polls/{poll_id}/crosstab?by=ip_prefix', headers=headers)
+    assert json.loads(response.data)['rows'] == [['127.0.0.0/24', 3]]
+    assert db.queries == []
+
+    assert client.get(f'/api/polls/{poll_id}/crosstab?by=nope', headers=headers).status_code == 400
+    bob = auth_headers(db.fixtures['bob'], 'bob')
+    assert client.get(f'/api/polls/{poll_id}/crosstab', headers=bob).status_code == 404
+
+def test_vote_refreshes_crosstab(client, db, auth_headers):
+    """Test a new vote discards the poll's cached frame."""
+    headers = auth_headers(db.fixtures['alice'], 'alice')
+    poll_id = db.fixtures['open_poll']
+    client.get(f'/api/polls/{poll_id}/crosstab', headers=headers)
+
+    client.post('/api/polls/open-token/vote', content_type='application/json',
+                data=json.dumps({'voter_name': 'N', 'voter_email': 'new@example.com',
+                                 'selected_option': db.fixtures['options'][poll_id][2]}))
+
+    response = client.get(f'/api/polls/{poll_id}/crosstab', headers=headers)
+    assert json.loads(response.data)['total_votes'] == 4
@@ -0,0 +1,92 @@
+import json
+import secrets
+
+import app
+from migrate_share_tokens import migrate_results_payloads
+from share_tokens import (ShareTokenMap, canonical_share_token, format_share_token, new_share_token,
+                          parse_share_token)
+
+def test_url_safe_tokens_round_trip():
+    """Test tokens from token_urlsafe(16), old and new, are exactly the URL form of their key."""
+    key = new_share_token()
+    assert len(key) == 16
+    assert parse_share_token(format_share_token(key)) == key
+    assert format_share_token(bytearray(key)) == format_share_token(key)
+
+    old_token = secrets.token_urlsafe(16)
+    assert len(old_token) == 22
+    assert format_share_token(parse_share_token(old_token)) == old_token
+
+def test_other_tokens_map_to_a_stable_hash():
+    """Test tokens that are not 16 encoded bytes still resolve, always to the same key."""
+    key = parse_share_token('open-token')
+    assert len(key) == 16
+    assert parse_share_token('open-token') == key
+    assert parse_share_token('open-tokem') != key
+    # 22 URL-safe characters whose final character has stray low bits are not a canonical encoding
+    assert canonical_share_token('A' * 21 + 'B') != 'A' * 21 + 'B'
+    assert parse_share_token('') is None
+    assert parse_share_token('x' * 256) is None
+
+def test_token_map_expires_and_forgets_deleted_polls():
+    """Test cached lookups expire after max_age and are dropped with their poll."""
+    clock = [0.0]
+    tokens = ShareTokenMap(max_size=2, max_age=10, clock=lambda: clock[0])
+    tokens.put(b'a', 1)
+    tokens.put(b'b', 2, 'ranked')
+
+    assert tokens.get(b'a') == (1, 'single')
+    assert tokens.get(b'b') == (2, 'ranked')
+    tokens.discard_poll(2)
+    assert tokens.get(b'b') is None
+    clock[0] = 11
+    assert tokens.get(b'a') is None
+
+    tokens.put(b'c', 3)
+    tokens.put(b'd', 4)
+    tokens.put(b'e', 5)
+    assert len(tokens) == 2 and tokens.get(b'c') is None
+
+def test_created_poll_token_is_stored_as_bytes(client, db, auth_headers):
+    """Test new polls get a 22 character token backed by a 16 byte key."""
+    response = client.post('/api/polls', content_type='application/json',
+                           headers=auth_headers(db.fixtures['alice'], 'alice'),
+                           data=json.dumps({'title': 'T', 'question': 'Q?', 'options': ['A', 'B']}))
+    body = json.loads(response.data)
+
+    stored = db.conn.execute('SELECT share_token FROM polls WHERE id = ?', (body['poll_id'],)).fetchone()[0]
+    assert stored == parse_share_token(body['share_token'])
+    assert json.loads(client.get(f"/api/polls/{body['share_token']}").data)['poll']['share_token'] == \
+        body['share_token']
+
+def test_repeat_votes_skip_the_token_lookup(client, db):
+    """Test a worker that has seen a poll's token resolves it again without a query."""
+    poll_id = db.fixtures['open_poll']
+    options = db.fixtures['options'][poll_id]
+
+    def vote(email):
+        db.reset_queries()
+        response = client.post('/api/polls/open-token/vote', content_type='application/json',
+                               data=json.dumps({'voter_name': 'T', 'voter_email': email,
+                                                'selected_option': options[1]}))
+        assert response.status_code == 200
+        return db.queries
+
+    assert app.VOTE_POLL_SQL in vote('first@example.com')
+    repeat = vote('second@example.com')
+    assert app.VOTE_POLL_SQL not in repeat
+    assert len(repeat) == 5
+
+def test_migration_rewrites_frozen_results(db):
+    """Test the migration gives stored results payloads the URL form of their share token."""
+    poll_id = db.fixtures['closed_poll']
+    payload = {'poll': {'id': poll_id, 'share_token': 'closed-token'}, 'options': [], 'total_votes': 1}
+    db.conn.execute("""
+        INSERT INTO poll_results (poll_id, share_token, total_votes, results)
+        SELECT id, share_token, 1, ? FROM polls WHERE id = ?
+    """, (json.dumps(payload), poll_id))
+
+    assert migrate_results_payloads(db.connect(), batch_size=1) == 1
+    stored = json.loads(db.conn.execute('SELECT results FROM poll_results WHERE poll_id = ?', (poll_id,)).fetchone()[0])
+    assert stored['poll']['share_token'] == canonical_share_token('closed-token')
+    assert migrate_results_payloads(db.connect()) == 0
@@ -0,0 +1,110 @@
+import json
+import random
+
+import pytest
+
+import app
+from sketches import VIEWERS, VOTER_IPS, HyperLogLog, PollSketches, merge_stored_sketch
+
+def filled(values, precision=12):
+    sketch = HyperLogLog(precision)
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+def test_estimates_stay_within_error_bounds():
+    """Test estimates of small and large cardinalities fall inside the reported interval."""
+    rng = random.Random(3)
+    for count in (0, 1, 50, 2000, 20000):
+        values = [f'10.{rng.getrandbits(32)}' for _ in range(count)]
+        # Repeats do not count
+        bounds = filled(values + values[:count // 2]).bounds()
+        assert bounds['low'] <= len(set(values)) <= bounds['high']
+    assert bounds['standard_error'] == pytest.approx(0.0163, abs=1e-4)
+
+def test_merged_sketches_count_the_union():
+    """Test merging two workers' sketches equals one sketch of every value, and survives storage."""
+    first = filled(f'a{index}' for index in range(3000))
+    second = filled(f'a{index}' for index in range(2000, 5000))
+    first.merge(second)
+
+    assert first.registers == filled(f'a{index}' for index in range(5000)).registers
+    stored = first.to_bytes()
+    assert len(filled(['one']).to_bytes()) < 64
+    assert HyperLogLog.from_bytes(stored).registers == first.registers
+    with pytest.raises(ValueError):
+        first.merge(HyperLogLog(10))
+
+def test_pending_sketches_flush_when_due():
+    """Test pending sketches are flushed after the interval and put back when a flush fails."""
+    clock = [0.0]
+    sketches = PollSketches(clock=lambda: clock[0])
+    assert not sketches.flush_due(10)
+    sketches.add(1, VIEWERS, 'x')
+    assert not sketches.flush_due(10)
+    assert sketches.flush_due(10, max_pending=1)
+
+    pending = sketches.take()
+    sketches.add(1, VIEWERS, 'y')
+    sketches.put_back(pending)
+    assert len(sketches) == 1
+    assert sketches.estimates(1, [])[VIEWERS]['estimate'] == 2
+
+def test_stored_sketches_merge_by_version(db):
+    """Test flushes from two workers merge into one row instead of overwriting it."""
+    poll_id = db.fixtures['open_poll']
+    connection = db.connect()
+    cursor = connection.cursor()
+
+    assert merge_stored_sketch(cursor, poll_id, VOTER_IPS, filled(['1.1.1.1', '2.2.2.2']))
+    assert merge_stored_sketch(cursor, poll_id, VOTER_IPS, filled(['2.2.2.2', '3.3.3.3']))
+
+    rows = db.conn.execute('SELECT kind, registers, version FROM poll_sketches WHERE poll_id = ?',
+                           (poll_id,)).fetchall()
+    assert [(kind, version) for kind, _, version in rows] == [(VOTER_IPS, 1)]
+    assert HyperLogLog.from_bytes(rows[0][1]).bounds()['estimate'] == 3
+
+def test_sketches_of_deleted_polls_are_dropped(db):
+    """Test a pending sketch of a poll deleted by another worker is dropped instead of queued forever."""
+    poll_id = db.fixtures['open_poll']
+    missing = db.fixtures['bob_poll'] + 1000
+    cursor = db.connect().cursor()
+    assert merge_stored_sketch(cursor, missing, VIEWERS, filled(['a'])) is None
+
+    app.poll_sketches.add(missing, VIEWERS, 'a')
+    app.poll_sketches.add(poll_id, VIEWERS, 'b')
+    app.flush_poll_sketches()
+
+    assert len(app.poll_sketches) == 0
+    assert db.conn.execute('SELECT poll_id FROM poll_sketches').fetchall() == [(poll_id,)]
+
+def test_details_report_viewers_and_voter_ips(client, db, auth_headers):
+    """Test views and votes show up as distinct audience counts in the owner details view."""
+    pizza = db.fixtures['options'][db.fixtures['open_poll']][0]
+    for agent in ('Firefox', 'Safari', 'Firefox'):
+        client.get('/api/polls/open-token', headers={'User-Agent': agent})
+    client.post('/api/polls/open-token/vote', content_type='application/json',
+                data=json.dumps({'voter_name': 'S', 'voter_email': 's@example.com', 'selected_option': pizza}))
+
+    # Half the counts reach the table through a flush, the rest are still pending in this worker
+    app.flush_poll_sketches()
+    client.get('/api/polls/open-token', headers={'User-Agent': 'Chrome'})
+
+    details = json.loads(client.get(f"/api/polls/{db.fixtures['open_poll']}/details",
+                                    headers=auth_headers(db.fixtures['alice'], 'alice')).data)
+    assert details['audience'][VIEWERS]['estimate'] == 3
+    assert details['audience'][VOTER_IPS]['estimate'] == 1
+    assert details['audience'][VOTER_IPS]['low'] <= 1 <= details['audience'][VOTER_IPS]['high']
+
+def test_closed_poll_details_report_audience(client, db, auth_headers):
+    """Test the details of a closed poll, served from its frozen results, still carry the audience."""
+    for agent in ('Firefox', 'Safari'):
+        assert client.get('/api/polls/closed-token', headers={'User-Agent': agent}).status_code == 200
+
+    response = client.get(f"/api/polls/{db.fixtures['closed_poll']}/details",
+                          headers=auth_headers(db.fixtures['alice'], 'alice'))
+
+    assert response.status_code == 200
+    details = json.loads(response.data)
+    assert details['total_votes'] == 1
+    assert details['audience'][VIEWERS]['estimate'] == 2
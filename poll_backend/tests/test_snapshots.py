@@ -0,0 +1,165 @@
+import unittest
+import json
+import os
+import sys
+import datetime
+from unittest.mock import patch
+
+# Set testing environment before importing app
+os.environ['FLASK_ENV'] = 'testing'
+os.environ['TESTING'] = 'True'
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app
+from share_tokens import canonical_share_token, parse_share_token
+from snapshots import SnapshotCache
+
+def make_payload(poll_id, share_token):
+    return {
+        'poll': {
+            'id': poll_id,
+            'title': 'Closed Poll',
+            'question': 'Question?',
+            'end_date': '2024-01-01 00:00:00',
+            'user_id': 1,
+            'share_token': share_token,
+            'creator_name': 'testuser',
+            'created_at': '2023-12-01T10:00:00',
+            'show_results_to_voters': True
+        },
+        'options': [
+            {'id': 1, 'option_text': 'Yes', 'votes': 3, 'percentage': 75.0},
+            {'id': 2, 'option_text': 'No', 'votes': 1, 'percentage': 25.0}
+        ],
+        'total_votes': 4
+    }
+
+class TestSnapshotCache(unittest.TestCase):
+
+    def test_lookup_by_token_and_poll_id(self):
+        """Test that snapshots can be found by share token and poll id."""
+        cache = SnapshotCache()
+        snapshot = cache.put(make_payload(1, 'tok1'))
+
+        self.assertIs(cache.get('tok1'), snapshot)
+        self.assertIs(cache.get_by_poll_id(1), snapshot)
+        self.assertEqual(json.loads(snapshot.body)['total_votes'], 4)
+        self.assertNotIn('percentage', json.loads(snapshot.details_body)['options'][0])
+
+        cache.discard(1)
+        self.assertIsNone(cache.get('tok1'))
+        self.assertIsNone(cache.get_by_poll_id(1))
+
+    def test_lru_eviction(self):
+        """Test that the least recently used snapshot is evicted first."""
+        cache = SnapshotCache(max_size=2)
+        cache.put(make_payload(1, 'tok1'))
+        cache.put(make_payload(2, 'tok2'))
+        cache.get('tok1')
+        cache.put(make_payload(3, 'tok3'))
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNotNone(cache.get('tok1'))
+        self.assertIsNone(cache.get('tok2'))
+        self.assertIsNone(cache.get_by_poll_id(2))
+
+    def test_snapshots_expire(self):
+        """Test that a snapshot older than max_age is dropped, so a poll deleted elsewhere is noticed."""
+        clock = [0.0]
+        cache = SnapshotCache(max_age=60, clock=lambda: clock[0])
+        cache.put(make_payload(1, 'tok1'))
+
+        clock[0] = 60
+        self.assertIsNotNone(cache.get('tok1'))
+        clock[0] = 61
+        self.assertIsNone(cache.get_by_poll_id(1))
+        self.assertIsNone(cache.get('tok1'))
+        self.assertEqual(len(cache), 0)
+
+class TestFrozenResults(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test client and a mocked database."""
+        self.app = app.app.test_client()
+        self.app.testing = True
+        app.results_snapshots.clear()
+
+        self.patcher = patch('app.get_db_connection')
+        self.mock_get_db = self.patcher.start()
+        self.mock_cursor = self.mock_get_db.return_value.cursor.return_value
+
+    def tearDown(self):
+        self.patcher.stop()
+        app.results_snapshots.clear()
+
+    def test_closed_poll_served_from_snapshot(self):
+        """Test that closed polls skip live tally queries and are cached."""
+        past = datetime.datetime.now() - datetime.timedelta(days=2)
+        self.mock_cursor.fetchone.side_effect = [
+            (7, 'Closed Poll', 'Question?', past, 1, parse_share_token('closed_token'),
+             'testuser', datetime.datetime.now(), True),  # Poll data
+            (json.dumps(make_payload(7, canonical_share_token('closed_token'))),)  # Stored snapshot
+        ]
+
+        response = self.app.get('/api/polls/closed_token')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Cache-Control'], f'public, max-age={app.RESULTS_MAX_AGE}')
+        data = json.loads(response.data)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['total_votes'], 4)
+        executed = [call[0][0] for call in self.mock_cursor.execute.call_args_list]
+        self.assertFalse(any('FROM options' in sql for sql in executed))
+
+        # Later requests are answered from memory without a database connection
+        self.mock_get_db.reset_mock()
+        response = self.app.get('/api/polls/closed_token')
+        self.assertEqual(response.status_code, 200)
+        self.mock_get_db.assert_not_called()
+
+        response = self.app.get('/api/polls/closed_token',
+                                headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_closed_poll_details_from_snapshot(self):
+        """Test that the owner details view uses the frozen results, with the current audience and flags."""
+        app.results_snapshots.put(make_payload(7, 'closed_token'))
+        self.mock_cursor.fetchall.return_value = []
+        self.mock_cursor.fetchone.return_value = None
+
+        with patch('app.PyJWT.decode') as mock_decode:
+            mock_decode.return_value = {'user_id': 1, 'username': 'testuser'}
+            response = self.app.get('/api/polls/7/details',
+                                    headers={'Authorization': 'Bearer fake_token'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers['Cache-Control'].startswith('private'))
+        data = json.loads(response.data)
+        self.assertEqual(data['total_votes'], 4)
+        self.assertEqual(len(data['options']), 2)
+        self.assertEqual(data['flagged_votes']['flagged'], 0)
+        executed = [call[0][0] for call in self.mock_cursor.execute.call_args_list]
+        self.assertFalse(any('FROM polls' in sql for sql in executed))
+
+    def test_missing_snapshot_is_frozen_on_read(self):
+        """Test that a closed poll without a stored snapshot gets one on first read."""
+        past = datetime.datetime.now() - datetime.timedelta(days=2)
+        poll_row = (8, 'Closed Poll', 'Question?', past, 1, parse_share_token('late_token'),
+                    'testuser', datetime.datetime.now(), False)
+        self.mock_cursor.fetchone.side_effect = [poll_row, None, poll_row]
+        self.mock_cursor.fetchall.return_value = [(1, 'Yes', 2), (2, 'No', 2)]
+
+        response = self.app.get('/api/polls/late_token')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['options'][0]['percentage'], 50.0)
+        executed = [call[0][0] for call in self.mock_cursor.execute.call_args_list]
+        self.assertTrue(any('INSERT IGNORE INTO poll_results' in sql for sql in executed))
+        self.assertTrue(any('UPDATE poll_results' in sql for sql in executed))
+        self.assertIsNotNone(app.results_snapshots.get(canonical_share_token('late_token')))
+
+
+if __name__ == '__main__':
+    unittest.main()
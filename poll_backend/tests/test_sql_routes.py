@@ -0,0 +1,241 @@
+"""Route tests that run app.py's real SQL against the SQLite test database.
+
+Each test also asserts how many statements the route ran, so an N+1 query
+pattern shows up as a failing count.
+"""
+import json
+
+import pytest
+
+import app
+from share_tokens import canonical_share_token
+
+def test_register_and_duplicate(client, db):
+    """Test registration inserts the user and rejects duplicates."""
+    user = {'username': 'carol', 'email': 'carol@example.com', 'password': 'secret'}
+
+    response = client.post('/api/register', data=json.dumps(user), content_type='application/json')
+
+    assert response.status_code == 201
+    data = json.loads(response.data)
+    assert data['username'] == 'carol'
+    assert data['user_id'] > db.fixtures['bob']
+    assert len(db.queries) == 2
+
+    response = client.post('/api/register', data=json.dumps(user), content_type='application/json')
+    assert response.status_code == 400
+    assert 'already exists' in json.loads(response.data)['message']
+
+def test_login(client, db):
+    """Test login checks the stored password hash."""
+    response = client.post('/api/login', data=json.dumps({'username': 'alice', 'password': 'password123'}),
+                           content_type='application/json')
+
+    assert response.status_code == 200
+    assert json.loads(response.data)['user_id'] == db.fixtures['alice']
+    assert len(db.queries) == 1
+
+    response = client.post('/api/login', data=json.dumps({'username': 'alice', 'password': 'wrong'}),
+                           content_type='application/json')
+    assert response.status_code == 401
+
+def test_token_required(client, db):
+    """Test protected routes reject requests without a valid token."""
+    assert client.get('/api/polls').status_code == 401
+    assert client.get('/api/polls', headers={'Authorization': 'Bearer bogus'}).status_code == 401
+    assert db.queries == []
+
+def test_get_polls(client, db, auth_headers):
+    """Test the dashboard listing returns the user's polls with totals."""
+    response = client.get('/api/polls', headers=auth_headers(db.fixtures['alice'], 'alice'))
+
+    assert response.status_code == 200
+    polls = {poll['share_token']: poll for poll in json.loads(response.data)['polls']}
+    open_token = canonical_share_token('open-token')
+    assert set(polls) == {open_token, canonical_share_token('closed-token')}
+    assert polls[open_token]['option_count'] == 3
+    assert polls[open_token]['total_votes'] == 3
+    assert len(db.queries) == 1
+
+def test_create_poll_queries_do_not_grow_with_options(client, db, auth_headers):
+    """Test poll creation uses the same number of statements for any option count."""
+    headers = auth_headers(db.fixtures['bob'], 'bob')
+    counts = []
+    for options in (['A', 'B'], ['A', 'B', 'C', 'D', 'E', 'F']):
+        db.reset_queries()
+        response = client.post('/api/polls', headers=headers, content_type='application/json',
+                               data=json.dumps({'title': 'T', 'question': 'Q?', 'options': options}))
+        assert response.status_code == 201
+        counts.append(len(db.queries))
+
+    assert counts == [2, 2]
+    share_token = json.loads(response.data)['share_token']
+    data = json.loads(client.get(f'/api/polls/{share_token}').data)
+    assert [option['option_text'] for option in data['options']] == ['A', 'B', 'C', 'D', 'E', 'F']
+
+def test_submit_vote(client, db):
+    """Test voting records the vote, updates tallies and rejects repeat voters."""
+    pizza = db.fixtures['options'][db.fixtures['open_poll']][0]
+    vote = {'voter_name': 'New', 'voter_email': 'new@example.com', 'selected_option': pizza}
+
+    response = client.post('/api/polls/open-token/vote', data=json.dumps(vote), content_type='application/json')
+
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['total_votes'] == 4
+    assert data['options'][0]['votes'] == 3
+    assert len(db.queries) == 6
+
+    response = client.post('/api/polls/open-token/vote', data=json.dumps(vote), content_type='application/json')
+    assert response.status_code == 400
+    assert 'already voted' in json.loads(response.data)['message']
+
+def test_failed_vote_is_not_counted(client, db, monkeypatch):
+    """Test the option counter is rolled back when the vote itself cannot be stored."""
+    pizza = db.fixtures['options'][db.fixtures['open_poll']][0]
+    vote = {'voter_name': 'New', 'voter_email': 'new@example.com', 'selected_option': pizza}
+    monkeypatch.setattr(app, 'INSERT_VOTE_SQL', 'INSERT INTO missing_votes VALUES (%s, %s, %s, %s, %s)')
+
+    response = client.post('/api/polls/open-token/vote', data=json.dumps(vote), content_type='application/json')
+
+    assert response.status_code == 500
+    assert db.conn.execute('SELECT votes FROM options WHERE id = ?', (pizza,)).fetchone()[0] == 2
+
+def test_vote_rejected_on_closed_poll(client, db):
+    """Test votes on a poll past its end date are refused."""
+    option = db.fixtures['options'][db.fixtures['closed_poll']][0]
+    vote = {'voter_name': 'Late', 'voter_email': 'late@example.com', 'selected_option': option}
+
+    response = client.post('/api/polls/closed-token/vote', data=json.dumps(vote), content_type='application/json')
+
+    assert response.status_code == 400
+    assert json.loads(response.data)['message'] == 'This poll has ended'
+    assert len(db.queries) == 1
+
+def test_vote_refused_once_results_are_frozen(client, db):
+    """Test a vote is refused once another worker froze the poll, even if this worker still thinks it open."""
+    poll_id = db.fixtures['open_poll']
+    pizza = db.fixtures['options'][poll_id][0]
+    db.conn.execute("""
+        INSERT INTO poll_results (poll_id, share_token, total_votes, results)
+        SELECT id, share_token, 3, '{}' FROM polls WHERE id = ?
+    """, (poll_id,))
+    vote = {'voter_name': 'Late', 'voter_email': 'late@example.com', 'selected_option': pizza}
+
+    response = client.post('/api/polls/open-token/vote', data=json.dumps(vote), content_type='application/json')
+
+    assert response.status_code == 400
+    assert json.loads(response.data)['message'] == 'This poll has ended'
+    assert db.conn.execute("SELECT COUNT(*) FROM votes WHERE voter_email = 'late@example.com'").fetchone()[0] == 0
+    assert db.conn.execute('SELECT votes FROM options WHERE id = ?', (pizza,)).fetchone()[0] == 2
+
+def test_close_poll_announced_once(client, db, monkeypatch):
+    """Test a poll every worker schedules to close is frozen and announced only once."""
+    announced = []
+    monkeypatch.setattr(app, 'broadcast', lambda event, update: announced.append(update['total_votes']))
+    poll_id = db.fixtures['closed_poll']
+
+    app.close_poll(poll_id)
+    app.results_snapshots.clear()
+    app.close_poll(poll_id)
+
+    assert announced == [1]
+    assert db.conn.execute('SELECT total_votes FROM poll_results WHERE poll_id = ?', (poll_id,)).fetchone()[0] == 1
+
+def test_failed_freeze_leaves_no_claim(client, db, monkeypatch):
+    """Test a freeze that fails after claiming the poll leaves no empty poll_results row behind."""
+    poll_id = db.fixtures['closed_poll']
+
+    def fail(*args):
+        raise RuntimeError('lost connection')
+
+    monkeypatch.setattr(app, 'build_poll_payload', fail)
+    with pytest.raises(RuntimeError):
+        app.close_poll(poll_id)
+    assert db.conn.execute('SELECT COUNT(*) FROM poll_results WHERE poll_id = ?', (poll_id,)).fetchone()[0] == 0
+
+def test_vote_rejects_option_from_other_poll(client, db):
+    """Test an option id that belongs to another poll is refused."""
+    option = db.fixtures['options'][db.fixtures['bob_poll']][0]
+    vote = {'voter_name': 'X', 'voter_email': 'x@example.com', 'selected_option': option}
+
+    response = client.post('/api/polls/open-token/vote', data=json.dumps(vote), content_type='application/json')
+
+    assert response.status_code == 400
+    assert json.loads(response.data)['message'] == 'Invalid option selected'
+
+def test_get_poll_by_share_token(client, db):
+    """Test the public poll view."""
+    response = client.get('/api/polls/open-token')
+
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['poll']['creator_name'] == 'alice'
+    assert data['poll']['show_results_to_voters'] is True
+    assert [option['votes'] for option in data['options']] == [2, 1, 0]
+    assert data['options'][0]['percentage'] == 66.7
+    assert len(db.queries) == 2
+
+    assert client.get('/api/polls/missing-token').status_code == 404
+
+def test_closed_poll_frozen_after_first_read(client, db):
+    """Test closed polls are frozen once and then served without queries."""
+    response = client.get('/api/polls/closed-token')
+
+    assert response.status_code == 200
+    assert json.loads(response.data)['total_votes'] == 1
+    assert response.headers['Cache-Control'] == f'public, max-age={app.RESULTS_MAX_AGE}'
+
+    db.reset_queries()
+    response = client.get('/api/polls/closed-token')
+    assert response.status_code == 200
+    assert db.queries == []
+
+def test_get_poll_details(client, db, auth_headers):
+    """Test the owner details view counts votes per option."""
+    poll_id = db.fixtures['open_poll']
+
+    response = client.get(f'/api/polls/{poll_id}/details', headers=auth_headers(db.fixtures['alice'], 'alice'))
+
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['creator_name'] == 'alice'
+    assert data['total_votes'] == 3
+    # Poll, options, the audience sketches and the flagged vote counts
+    assert len(db.queries) == 4
+
+    response = client.get(f'/api/polls/{poll_id}/details', headers=auth_headers(db.fixtures['bob'], 'bob'))
+    assert response.status_code == 404
+
+def test_delete_poll(client, db, auth_headers):
+    """Test deleting a poll removes its options and votes."""
+    poll_id = db.fixtures['open_poll']
+
+    response = client.delete(f'/api/polls/{poll_id}', headers=auth_headers(db.fixtures['bob'], 'bob'))
+    assert response.status_code == 403
+
+    db.reset_queries()
+    response = client.delete(f'/api/polls/{poll_id}', headers=auth_headers(db.fixtures['alice'], 'alice'))
+
+    assert response.status_code == 200
+    assert len(db.queries) == 6
+    assert db.conn.execute('SELECT COUNT(*) FROM votes WHERE poll_id = ?', (poll_id,)).fetchone()[0] == 0
+    assert client.get('/api/polls/open-token').status_code == 404
+
+def test_failed_delete_is_reported(client, db, auth_headers, monkeypatch):
+    """Test a deletion that fails returns an error and leaves the poll in place."""
+    poll_id = db.fixtures['open_poll']
+
+    def fail(poll_id):
+        raise RuntimeError('lost connection')
+
+    monkeypatch.setattr(app, 'delete_poll_data', fail)
+    response = client.delete(f'/api/polls/{poll_id}', headers=auth_headers(db.fixtures['alice'], 'alice'))
+
+    assert response.status_code == 500
+    assert client.get('/api/polls/open-token').status_code == 200
+
+def test_changes_are_rolled_back_between_tests(client, db):
+    """Test each test starts from the shared fixtures."""
+    assert db.conn.execute('SELECT COUNT(*) FROM polls').fetchone()[0] == 3
+    assert db.conn.execute('SELECT COUNT(*) FROM users').fetchone()[0] == 2
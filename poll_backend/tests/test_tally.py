@@ -0,0 +1,184 @@
+import json
+import random
+
+import numpy as np
+import pytest
+
+import app
+from tally import (ELIMINATED, NO_CHOICE, WINNER, BallotTally, BallotTallyCache, ballot_positions,
+                   current_choices, decode_ballot, encode_ballot)
+
+def ranked(*ballots, option_count=3):
+    tally = BallotTally('ranked', option_count)
+    tally.extend([(index + 1, encode_ballot(ballot)) for index, ballot in enumerate(ballots)])
+    return tally
+
+def outcomes(tally):
+    return [(current.outcome, current.position) for current in tally.rounds()]
+
+def test_ballots_are_option_positions():
+    """Test ballots store one byte per chosen option and reject unknown or repeated options."""
+    assert encode_ballot([2, 0]) == b'\x02\x00'
+    assert decode_ballot(bytearray(b'\x02\x00')) == [2, 0]
+    assert ballot_positions([10, 11, 12], [12, 10]) == [2, 0]
+    assert ballot_positions([10, 11, 12], [12, 12]) is None
+    assert ballot_positions([10, 11, 12], [13]) is None
+    assert ballot_positions([10, 11, 12], []) is None
+
+def test_current_choices_skip_eliminated_options():
+    """Test each ballot counts for its first option still running, or -1 once exhausted."""
+    ballots = np.array([[0, 1, NO_CHOICE], [2, NO_CHOICE, NO_CHOICE], [1, 2, 0]], dtype=np.uint8)
+    eliminated = np.array([True, False, True])
+
+    assert list(current_choices(ballots, eliminated)) == [1, -1, 1]
+
+def test_instant_runoff_transfers_eliminated_votes():
+    """Test the last option's ballots move to their next choice until one has a majority."""
+    tally = ranked(*[[0, 1]] * 4, *[[1, 2]] * 3, *[[2, 1]] * 2)
+
+    assert outcomes(tally) == [(ELIMINATED, 2), (WINNER, 1)]
+    assert list(tally.rounds()[0].counts) == [4, 3, 2]
+    assert list(tally.rounds()[1].counts) == [4, 5, 0]
+
+    results = tally.results([10, 11, 12])
+    assert results['winner'] == 11
+    assert results['rounds'][1] == {'votes': [{'id': 10, 'votes': 4}, {'id': 11, 'votes': 5}],
+                                    'exhausted': 0, 'eliminated': None}
+
+def test_ties_break_on_earlier_rounds_then_position():
+    """Test a tie for last eliminates the option weaker in the previous round, else the last listed."""
+    assert outcomes(ranked([0], [1], option_count=2))[0] == (ELIMINATED, 1)
+
+    # B and C tie at 2 in round two; C had fewer first preferences, so it goes
+    tally = ranked(*[[0]] * 4, *[[1]] * 2, [2], [3, 2], option_count=4)
+    assert outcomes(tally)[:2] == [(ELIMINATED, 3), (ELIMINATED, 2)]
+
+def test_new_ballots_update_cached_rounds():
+    """Test ballots added one by one give the same rounds as counting them all at once."""
+    rng = random.Random(7)
+    ballots = [rng.sample(range(5), rng.randint(1, 5)) for _ in range(400)]
+    incremental = BallotTally('ranked', 5)
+    incremental.rounds()
+
+    for index, ballot in enumerate(ballots):
+        incremental.extend([(index + 1, encode_ballot(ballot))])
+        if index % 50 == 0:
+            fresh = ranked(*ballots[:index + 1], option_count=5)
+            assert outcomes(incremental) == outcomes(fresh)
+            assert [list(current.counts) for current in incremental.rounds()] == \
+                [list(current.counts) for current in fresh.rounds()]
+
+    assert outcomes(incremental) == outcomes(ranked(*ballots, option_count=5))
+
+def test_ballots_are_counted_once():
+    """Test ballots at or before last_id, fetched again by another reader, are skipped."""
+    tally = BallotTally('approval', 3)
+    assert tally.extend([(1, b'\x00\x02'), (2, b'\x01')]) == 2
+    assert tally.extend([(2, b'\x01'), (3, b'\x02')]) == 1
+
+    assert (tally.size, tally.last_id) == (3, 3)
+    assert list(tally.approvals) == [1, 1, 2]
+    with pytest.raises(ValueError):
+        tally.extend([(4, b'\x05')])
+
+def test_cache_rebuilds_expired_tallies():
+    """Test a cached tally is reused until max_age, then started over."""
+    clock = [0.0]
+    cache = BallotTallyCache(max_age=10, clock=lambda: clock[0])
+    tally = cache.get(1, 'ranked', 3)
+
+    assert cache.get(1, 'ranked', 3) is tally
+    assert cache.get(1, 'ranked', 4) is not tally
+    clock[0] = 11
+    assert cache.get(1, 'ranked', 4).size == 0
+
+def create_poll(client, headers, voting_method, options=('A', 'B', 'C')):
+    response = client.post('/api/polls', headers=headers, content_type='application/json',
+                           data=json.dumps({'title': 'T', 'question': 'Q?', 'options': list(options),
+                                            'voting_method': voting_method}))
+    assert response.status_code == 201
+    body = json.loads(response.data)
+    return body['poll_id'], body['share_token']
+
+def vote(client, share_token, email, **choice):
+    return client.post(f'/api/polls/{share_token}/vote', content_type='application/json',
+                       data=json.dumps({'voter_name': 'V', 'voter_email': email, **choice}))
+
+def test_ranked_poll_results(client, db, auth_headers):
+    """Test ranked votes count first preferences and the public view shows the runoff."""
+    headers = auth_headers(db.fixtures['alice'], 'alice')
+    poll_id, share_token = create_poll(client, headers, 'ranked')
+    a, b, c = [row[0] for row in db.conn.execute('SELECT id FROM options WHERE poll_id = ? ORDER BY id',
+                                                 (poll_id,))]
+
+    rankings = [[a, b]] * 4 + [[b, c]] * 3 + [[c, b]] * 2
+    for index, ranking in enumerate(rankings):
+        response = vote(client, share_token, f'r{index}@example.com', ranking=ranking)
+        assert response.status_code == 200
+    assert json.loads(response.data)['winner'] == b
+
+    stored = db.conn.execute('SELECT ranking FROM ballots WHERE poll_id = ? ORDER BY id', (poll_id,)).fetchone()[0]
+    assert stored == b'\x00\x01'
+
+    db.reset_queries()
+    data = json.loads(client.get(f'/api/polls/{share_token}').data)
+    assert data['poll']['voting_method'] == 'ranked'
+    assert [option['votes'] for option in data['options']] == [4, 3, 2]
+    assert data['total_votes'] == 9
+    assert [round_['eliminated'] for round_ in data['rounds']] == [c, None]
+    assert data['winner'] == b
+    # Every ballot was already in this worker's tally: the ballot read returns nothing new
+    assert len(db.queries) == 3
+
+    batch = json.loads(client.get(f'/api/polls/batch?tokens={share_token}').data)
+    assert batch['polls'][share_token]['winner'] == b
+
+def test_approval_poll_counts_voters(client, db, auth_headers):
+    """Test approval votes count for every chosen option and percentages are of voters."""
+    headers = auth_headers(db.fixtures['alice'], 'alice')
+    poll_id, share_token = create_poll(client, headers, 'approval')
+    a, b, c = [row[0] for row in db.conn.execute('SELECT id FROM options WHERE poll_id = ? ORDER BY id',
+                                                 (poll_id,))]
+
+    assert vote(client, share_token, 'x@example.com', selected_options=[a, b]).status_code == 200
+    response = vote(client, share_token, 'y@example.com', selected_options=[b])
+    data = json.loads(response.data)
+
+    assert [option['votes'] for option in data['options']] == [1, 2, 0]
+    assert [option['percentage'] for option in data['options']] == [50.0, 100.0, 0.0]
+    assert data['total_votes'] == 2
+    assert 'rounds' not in data
+
+    polls = json.loads(client.get('/api/polls', headers=headers).data)['polls']
+    assert [poll['total_votes'] for poll in polls if poll['id'] == poll_id] == [2]
+
+def test_invalid_ballots_are_rejected(client, db, auth_headers):
+    """Test ballots must use the poll's field, its own options and each option once."""
+    headers = auth_headers(db.fixtures['alice'], 'alice')
+    poll_id, share_token = create_poll(client, headers, 'ranked')
+    a, b, _ = [row[0] for row in db.conn.execute('SELECT id FROM options WHERE poll_id = ? ORDER BY id', (poll_id,))]
+    other = db.fixtures['options'][db.fixtures['open_poll']][0]
+
+    assert vote(client, share_token, 'a@example.com', selected_option=a).status_code == 400
+    assert vote(client, share_token, 'b@example.com', ranking=[a, a]).status_code == 400
+    assert vote(client, share_token, 'c@example.com', ranking=[a, other]).status_code == 400
+    assert vote(client, 'open-token', 'd@example.com', ranking=[other]).status_code == 400
+    assert db.conn.execute('SELECT COUNT(*) FROM ballots WHERE poll_id = ?', (poll_id,)).fetchone()[0] == 0
+
+    response = client.post('/api/polls', headers=headers, content_type='application/json',
+                           data=json.dumps({'title': 'T', 'question': 'Q?', 'options': ['A', 'B'],
+                                            'voting_method': 'borda'}))
+    assert response.status_code == 400
+
+def test_closed_ranked_poll_freezes_rounds(client, db, auth_headers):
+    """Test the frozen results of a ranked poll keep its runoff rounds."""
+    headers = auth_headers(db.fixtures['alice'], 'alice')
+    poll_id, share_token = create_poll(client, headers, 'ranked', options=('A', 'B'))
+    a, b = [row[0] for row in db.conn.execute('SELECT id FROM options WHERE poll_id = ? ORDER BY id', (poll_id,))]
+    vote(client, share_token, 'a@example.com', ranking=[b, a])
+    db.conn.execute("UPDATE polls SET end_date = '2000-01-01 00:00:00' WHERE id = ?", (poll_id,))
+    app.poll_lifecycle.forget(poll_id)
+
+    data = json.loads(client.get(f'/api/polls/{share_token}').data)
+    assert data['winner'] == b
+    assert json.loads(app.results_snapshots.get_by_poll_id(poll_id).details_body)['winner'] == b
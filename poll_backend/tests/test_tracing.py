@@ -0,0 +1,114 @@
+import json
+
+import pytest
+
+import app
+from tracing import (CLIENT, PRODUCER, SERVER, STATUS_ERROR, FileExporter, MemoryExporter, Tracer, format_traceparent,
+                     load_exporter, parse_traceparent)
+
+TRACE_ID = '4bf92f3577b34da6a3ce929d0e0e4736'
+PARENT_ID = '00f067aa0ba902b7'
+
+def by_name(spans, name):
+    return [span for span in spans if span.name == name]
+
+def test_traceparent_round_trip():
+    """Test traceparent headers parse to their ids and flags and reject invalid values."""
+    assert parse_traceparent(f'00-{TRACE_ID}-{PARENT_ID}-01') == (TRACE_ID, PARENT_ID, True)
+    assert parse_traceparent(f'00-{TRACE_ID.upper()}-{PARENT_ID}-00') == (TRACE_ID, PARENT_ID, False)
+    assert parse_traceparent(f'00-{"0" * 32}-{PARENT_ID}-01') is None
+    assert parse_traceparent(f'01-{TRACE_ID}-{PARENT_ID}-01') is None
+    assert parse_traceparent(None) is None
+    assert format_traceparent(TRACE_ID, PARENT_ID) == f'00-{TRACE_ID}-{PARENT_ID}-01'
+
+def test_spans_nest_and_record_errors():
+    """Test child spans share the trace, nest under the open span and mark exceptions."""
+    exporter = MemoryExporter()
+    tracer = Tracer(exporter=exporter)
+    with tracer.span('unused') as span:
+        assert span is None
+
+    with tracer.resume(format_traceparent(TRACE_ID, PARENT_ID), 'job'):
+        with tracer.span('outer'):
+            with pytest.raises(ValueError):
+                with tracer.span('inner'):
+                    raise ValueError('boom')
+
+    inner, outer, root = finished = exporter.spans
+    assert (root.trace_id, root.parent_id) == (TRACE_ID, PARENT_ID)
+    assert outer.parent_id == root.span_id and inner.parent_id == outer.span_id
+    assert {span.trace_id for span in finished} == {TRACE_ID}
+    assert (inner.status, inner.message) == (STATUS_ERROR, 'boom')
+    assert not tracer.active
+
+def test_vote_is_traced_end_to_end(client, db, spans):
+    """Test a vote yields a root span with query, commit and emit spans in one trace."""
+    pizza = db.fixtures['options'][db.fixtures['open_poll']][0]
+    response = client.post('/api/polls/open-token/vote', content_type='application/json',
+                           data=json.dumps({'voter_name': 'T', 'voter_email': 'trace@example.com',
+                                            'selected_option': pizza}))
+    assert response.status_code == 200
+    assert 'traceresponse' not in response.headers
+
+    root, = by_name(spans, 'POST /api/polls/<string:share_token>/vote')
+    assert root.kind == SERVER
+    assert root.attributes['http.response.status_code'] == 200
+    assert {span.trace_id for span in spans} == {root.trace_id}
+
+    queries = by_name(spans, 'db.query')
+    assert queries and all(span.kind == CLIENT for span in queries)
+    assert all(span.parent_id == root.span_id for span in queries)
+    statements = [span.attributes['db.statement'] for span in queries]
+    assert any(statement.startswith('INSERT INTO votes') for statement in statements)
+    assert not any('trace@example.com' in statement or str(pizza) in statement for statement in statements)
+    assert by_name(spans, 'db.commit') and by_name(spans, 'db.connect')
+
+    job, = by_name(spans, 'job emit_vote_update')
+    assert job.parent_id == root.span_id
+    emits = by_name(spans, 'socketio.emit')
+    destinations = [span.attributes['messaging.destination'] for span in emits]
+    assert destinations[0] == '/' and destinations[1].startswith('poll:')
+    assert all(span.kind == PRODUCER and span.parent_id == job.span_id for span in emits)
+
+def test_auth_check_spans(client, db, spans, auth_headers):
+    """Test token checks are spans recording whether the token was valid."""
+    client.get('/api/polls', headers=auth_headers(db.fixtures['alice'], 'alice'))
+    client.get('/api/polls', headers={'Authorization': 'Bearer nonsense'})
+
+    assert [span.attributes['auth.valid'] for span in by_name(spans, 'auth.check')] == [True, False]
+
+def test_traceparent_propagation(client, spans):
+    """Test an incoming traceparent is only continued with propagation on, and unsampled ones are skipped."""
+    header = {'traceparent': format_traceparent(TRACE_ID, PARENT_ID)}
+    client.get('/healthz', headers=header)
+    assert spans[-1].trace_id != TRACE_ID and spans[-1].parent_id is None
+
+    app.tracer.propagate = True
+    response = client.get('/healthz', headers=header)
+    root = spans[-1]
+    assert (root.trace_id, root.parent_id) == (TRACE_ID, PARENT_ID)
+    assert response.headers['traceresponse'] == root.traceparent
+
+    count = len(spans)
+    client.get('/healthz', headers={'traceparent': format_traceparent(TRACE_ID, PARENT_ID, sampled=False)})
+    assert len(spans) == count
+
+def test_file_exporter_writes_otlp_json(client, tmp_path):
+    """Test the file exporter writes one OTLP/JSON export request per trace."""
+    path = tmp_path / 'traces.jsonl'
+    app.tracer.configure(exporter=load_exporter(f'file:{path}'), service_name='polls-test')
+    assert isinstance(app.tracer.exporter, FileExporter)
+    try:
+        client.get('/healthz')
+        client.get('/healthz')
+    finally:
+        app.tracer.configure()
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(lines) == 2
+    resource = lines[0]['resourceSpans'][0]
+    assert resource['resource']['attributes'] == [{'key': 'service.name', 'value': {'stringValue': 'polls-test'}}]
+    span, = resource['scopeSpans'][0]['spans']
+    assert span['name'] == 'GET /healthz'
+    assert span['kind'] == SERVER
+    assert {'key': 'http.response.status_code', 'value': {'intValue': '200'}} in span['attributes']
@@ -0,0 +1,100 @@
+import json
+import os
+import subprocess
+import sys
+
+from trending import TrendingPolls
+
+
+def clocked(**options):
+    clock = [1000.0 * 60]
+    return TrendingPolls(windows=(300, 3600), bucket_seconds=60, refresh=0, clock=lambda: clock[0], **options), clock
+
+
+def test_windows_slide_by_bucket():
+    """Test votes count in every window until their bucket falls out of it."""
+    trending, clock = clocked()
+    trending.record(1, 5)
+    clock[0] += 120
+    trending.record(2, 3)
+    trending.record(1)
+
+    assert trending.top(300) == [(1, 6), (2, 3)]
+    clock[0] += 240
+    assert trending.top(300) == [(2, 3), (1, 1)]
+    assert trending.top(3600) == [(1, 6), (2, 3)]
+    clock[0] += 3600
+    assert trending.top(300) == [] and trending.top(3600) == []
+
+
+def test_top_is_cut_to_k_and_cached():
+    """Test the leaderboard keeps max_k polls and is recomputed only after refresh seconds."""
+    clock = [0.0]
+    trending = TrendingPolls(windows=(300,), max_k=2, refresh=10, clock=lambda: clock[0])
+    for poll_id, votes in ((1, 1), (2, 4), (3, 4)):
+        trending.record(poll_id, votes)
+
+    # Ties go to the older poll
+    assert trending.top(300, 5) == [(2, 4), (3, 4)]
+    trending.record(1, 10)
+    assert trending.top(300, 1) == [(2, 4)]
+    clock[0] = 10
+    assert trending.top(300, 1) == [(1, 11)]
+
+
+def test_counts_survive_a_restart(tmp_path):
+    """Test saved counts restore into the windows they still belong to."""
+    trending, clock = clocked()
+    trending.record(1, 2)
+    clock[0] += 600
+    trending.record(2, 1)
+    path = str(tmp_path / 'trending.json')
+    trending.save(path)
+
+    restarted, restarted_clock = clocked()
+    restarted_clock[0] = clock[0] + 30
+    restarted.restore(path)
+    assert restarted.top(300) == [(2, 1)]
+    assert restarted.top(3600) == [(1, 2), (2, 1)]
+
+    restarted.restore(str(tmp_path / 'missing.json'))
+    assert restarted.top(3600) == [(1, 2), (2, 1)]
+
+
+def test_each_worker_restores_only_stopped_workers(tmp_path):
+    """Test the counts of stopped workers are summed once and those of running workers are left alone."""
+    path = str(tmp_path / 'trending.json')
+    stopped = []
+    for _ in range(2):
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        stopped.append(process.pid)
+    for pid, poll_id in ((stopped[0], 1), (stopped[1], 1), (os.getppid(), 2)):
+        worker, _ = clocked()
+        worker.record(poll_id, 3)
+        with open(f'{path}.{pid}', 'w') as saved:
+            json.dump(worker.to_dict(), saved)
+
+    restarted, _ = clocked()
+    restarted.restore(path)
+    assert restarted.top(300) == [(1, 6)]
+    assert sorted(os.listdir(tmp_path)) == sorted(['trending.json.lock', f'trending.json.{os.getpid()}',
+                                                   f'trending.json.{os.getppid()}'])
+
+
+def test_trending_endpoint(client, db):
+    """Test votes put a poll on the trending leaderboard, served with one lookup query."""
+    pizza = db.fixtures['options'][db.fixtures['open_poll']][0]
+    response = client.post('/api/polls/open-token/vote', content_type='application/json',
+                           data=json.dumps({'voter_name': 'T', 'voter_email': 't@example.com',
+                                            'selected_option': pizza}))
+    assert response.status_code == 200
+
+    db.reset_queries()
+    data = json.loads(client.get('/api/polls/trending?window=60').data)
+    assert data['window_minutes'] == 60
+    assert [(poll['title'], poll['votes']) for poll in data['polls']] == [('Lunch', 1)]
+    assert len(db.queries) == 1
+
+    assert client.get('/api/polls/trending?window=7').status_code == 400
+    assert client.get('/api/polls/trending?limit=0').status_code == 400
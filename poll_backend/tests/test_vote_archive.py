@@ -0,0 +1,114 @@
+import csv
+import datetime
+import io
+import json
+import os
+
+from vote_archive import archive_closed_polls, iter_archive_rows, reorganize_partition_ddl, write_archive
+
+
+def test_archive_round_trip(tmp_path):
+    """Test archived votes read back as the rows that were written."""
+    rows = [(1, 10, 'Ann', 'ann@example.com', '10.0.0.1', datetime.datetime(2024, 1, 2, 3, 4, 5)),
+            (2, 11, 'Bo', 'bo@example.com', None, datetime.datetime(2024, 1, 3))]
+    path = str(tmp_path / 'poll_1.npz')
+
+    write_archive(path, rows)
+
+    assert list(iter_archive_rows(path)) == rows
+    assert not os.path.exists(path + '.tmp')
+
+
+def test_partition_ddl():
+    """Test partitions are added only when new polls approach p_max."""
+    assert 'PARTITION p1 VALUES LESS THAN (200000)' in reorganize_partition_ddl(100000, 150000)
+    assert reorganize_partition_ddl(200000, 150000) is None
+
+    ddl = reorganize_partition_ddl(200000, 195000)
+    assert ddl.startswith('ALTER TABLE votes REORGANIZE PARTITION p_max INTO')
+    assert 'PARTITION p2 VALUES LESS THAN (300000)' in ddl
+
+
+def export(client, headers, poll_id):
+    response = client.get(f'/api/polls/{poll_id}/votes/export', headers=headers)
+    assert response.status_code == 200
+    return list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+
+
+def test_archive_closed_polls(client, db, auth_headers, tmp_path, monkeypatch):
+    """Test closed polls' votes move to archive files while tallies and exports keep working."""
+    monkeypatch.setenv('VOTE_ARCHIVE_DIR', str(tmp_path))
+    headers = auth_headers(db.fixtures['alice'], 'alice')
+    closed_poll = db.fixtures['closed_poll']
+    live_rows = export(client, headers, closed_poll)
+
+    archived = archive_closed_polls(db.connect(autocommit=True), lambda poll_id: db.connect(autocommit=True),
+                                    str(tmp_path), retention_days=1)
+
+    assert archived == {closed_poll: 1}
+    assert db.conn.execute('SELECT COUNT(*) FROM votes WHERE poll_id = ?', (closed_poll,)).fetchone()[0] == 0
+    assert db.conn.execute('SELECT path FROM vote_archives WHERE poll_id = ?', (closed_poll,)).fetchone() == \
+        (f'poll_{closed_poll}.npz',)
+
+    response = client.get('/api/polls/closed-token')
+    assert json.loads(response.data)['total_votes'] == 1
+
+    db.reset_queries()
+    assert export(client, headers, closed_poll) == live_rows
+    assert len(db.queries) == 1
+    assert live_rows[1][3] == 'v1@example.com'
+
+    # Archived polls are not archived again
+    assert archive_closed_polls(db.connect(autocommit=True), lambda poll_id: db.connect(autocommit=True),
+                                str(tmp_path), retention_days=1) == {}
+
+
+def test_export_live_votes(client, db, auth_headers):
+    """Test exports of unarchived polls read the votes table, and only for the owner."""
+    poll_id = db.fixtures['open_poll']
+
+    rows = export(client, auth_headers(db.fixtures['alice'], 'alice'), poll_id)
+
+    assert rows[0] == ['id', 'option_id', 'voter_name', 'voter_email', 'ip_address', 'voted_at']
+    assert [row[3] for row in rows[1:]] == ['v1@example.com', 'v2@example.com', 'v3@example.com']
+    response = client.get(f'/api/polls/{poll_id}/votes/export', headers=auth_headers(db.fixtures['bob'], 'bob'))
+    assert response.status_code == 404
+
+
+def test_delete_poll_removes_archive(client, db, auth_headers, tmp_path, monkeypatch):
+    """Test deleting an archived poll deletes its archive file."""
+    monkeypatch.setenv('VOTE_ARCHIVE_DIR', str(tmp_path))
+    closed_poll = db.fixtures['closed_poll']
+    archive_closed_polls(db.connect(autocommit=True), lambda poll_id: db.connect(autocommit=True),
+                         str(tmp_path), retention_days=1)
+
+    response = client.delete(f'/api/polls/{closed_poll}', headers=auth_headers(db.fixtures['alice'], 'alice'))
+
+    assert response.status_code == 200
+    assert not os.path.exists(tmp_path / f'poll_{closed_poll}.npz')
+
+
+def test_delete_archived_poll_without_cascade(client, db, auth_headers, tmp_path, monkeypatch):
+    """Test an archived poll is deleted on databases whose vote_archives key has no ON DELETE CASCADE."""
+    monkeypatch.setenv('VOTE_ARCHIVE_DIR', str(tmp_path))
+    closed_poll = db.fixtures['closed_poll']
+    # vote_archives as older setup_db.py versions created it
+    db.conn.execute('DROP TABLE vote_archives')
+    db.conn.execute("""
+        CREATE TABLE vote_archives (
+          poll_id INT PRIMARY KEY,
+          path VARCHAR(255) NOT NULL,
+          vote_count INT NOT NULL,
+          archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+          FOREIGN KEY (poll_id) REFERENCES polls(id)
+        )
+    """)
+    archive_closed_polls(db.connect(autocommit=True), lambda poll_id: db.connect(autocommit=True),
+                         str(tmp_path), retention_days=1)
+
+    response = client.delete(f'/api/polls/{closed_poll}', headers=auth_headers(db.fixtures['alice'], 'alice'))
+
+    assert response.status_code == 200
+    assert db.conn.execute('SELECT COUNT(*) FROM polls WHERE id = ?', (closed_poll,)).fetchone()[0] == 0
+    assert db.conn.execute('SELECT COUNT(*) FROM vote_archives').fetchone()[0] == 0
+    assert not os.path.exists(tmp_path / f'poll_{closed_poll}.npz')
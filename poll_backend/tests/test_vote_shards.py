@@ -0,0 +1,203 @@
+import json
+import os
+import pytest
+
+import app
+from sqlite_db import SQLiteDatabase
+from vote_shards import ShardRoutingUnavailable, VoteShardMap, move_poll_votes, parse_shard_dsns, pin_default_placements
+
+SHARD_SCHEMA = os.path.join(os.path.dirname(__file__), '..', 'vote_shard_schema.sql')
+
+
+def test_parse_shard_dsns():
+    """Test shard configs inherit the main settings."""
+    shards = parse_shard_dsns('s0/votes_0, s1:3307', {'host': 'main', 'database': 'poll_app'})
+
+    assert shards == [{'host': 's0', 'database': 'votes_0'},
+                      {'host': 's1', 'database': 'poll_app', 'port': 3307}]
+
+
+def test_default_and_routed_placement():
+    """Test polls use poll_id % shards unless the routing table says otherwise."""
+    routes = {4: (0, None), 6: (0, 1)}
+    shard_map = VoteShardMap(load=lambda: routes, shards=[{}, {}])
+
+    assert shard_map.placement(3) == (1, None)
+    assert shard_map.placement(4) == (0, None)
+    assert shard_map.write_shards(6) == [0, 1]
+
+
+def test_routing_table_cached_for_ttl():
+    """Test the routing table is reloaded only after the TTL expires."""
+    clock = [0.0]
+    loads = []
+
+    def load():
+        loads.append(clock[0])
+        return {}
+
+    shard_map = VoteShardMap(load=load, shards=[{}], ttl=5, clock=lambda: clock[0])
+    shard_map.placement(1)
+    shard_map.placement(2)
+    clock[0] = 6
+    shard_map.placement(3)
+
+    assert loads == [0.0, 6]
+
+
+def test_failed_reload_keeps_previous_routes(capsys):
+    """Test a failing routing table reload keeps the last copy, and fails clearly without one."""
+    clock = [0.0]
+    routes = {4: (1, None)}
+
+    def load():
+        if routes is None:
+            raise ConnectionError('main database down')
+        return routes
+
+    shard_map = VoteShardMap(load=load, shards=[{}, {}], ttl=5, clock=lambda: clock[0])
+    assert shard_map.placement(4) == (1, None)
+
+    routes = None
+    clock[0] = 6
+    assert shard_map.placement(4) == (1, None)
+    assert 'using the previous copy' in capsys.readouterr().out
+
+    with pytest.raises(ShardRoutingUnavailable):
+        VoteShardMap(load=load, shards=[{}]).placement(4)
+
+
+@pytest.fixture
+def shards(db, monkeypatch):
+    """Two SQLite vote shards next to the main test database."""
+    shard_dbs = {'shard0': SQLiteDatabase(SHARD_SCHEMA), 'shard1': SQLiteDatabase(SHARD_SCHEMA)}
+
+    def connect(**config):
+        return shard_dbs.get(config['host'], db).connect(**config)
+
+    monkeypatch.setattr(app.mysql.connector, 'connect', connect)
+    monkeypatch.setattr(app.vote_shard_map, 'ttl', 0)
+    app.vote_shard_map.configure([dict(app.DB_CONFIG, host=host) for host in shard_dbs])
+    yield [shard_dbs['shard0'], shard_dbs['shard1']]
+    app.vote_shard_map.configure([])
+
+
+def count_votes(database, poll_id):
+    return database.conn.execute('SELECT COUNT(*) FROM votes WHERE poll_id = ?', (poll_id,)).fetchone()[0]
+
+
+def vote(client, db, email):
+    option = db.fixtures['options'][db.fixtures['open_poll']][0]
+    return client.post('/api/polls/open-token/vote', content_type='application/json',
+                       data=json.dumps({'voter_name': 'S', 'voter_email': email, 'selected_option': option}))
+
+
+def test_votes_stored_on_owning_shard(client, db, shards):
+    """Test votes land on the poll's shard and duplicates are checked there."""
+    poll_id = db.fixtures['open_poll']
+    owner, other = shards[poll_id % 2], shards[1 - poll_id % 2]
+
+    response = vote(client, db, 'sharded@example.com')
+
+    assert response.status_code == 200
+    assert json.loads(response.data)['total_votes'] == 4
+    assert count_votes(owner, poll_id) == 1
+    assert count_votes(other, poll_id) == 0
+    assert vote(client, db, 'sharded@example.com').status_code == 400
+
+
+def test_delete_poll_removes_shard_votes(client, db, shards, auth_headers):
+    """Test deleting a poll deletes its votes on the owning shard."""
+    poll_id = db.fixtures['open_poll']
+    vote(client, db, 'gone@example.com')
+
+    response = client.delete(f'/api/polls/{poll_id}', headers=auth_headers(db.fixtures['alice'], 'alice'))
+
+    assert response.status_code == 200
+    assert count_votes(shards[poll_id % 2], poll_id) == 0
+
+
+def test_move_poll_votes_online(client, db, shards):
+    """Test a poll's votes move between shards while votes keep arriving."""
+    poll_id = db.fixtures['open_poll']
+    source, target = poll_id % 2, 1 - poll_id % 2
+    for index in range(3):
+        vote(client, db, f'before{index}@example.com')
+
+    def during_move(seconds):
+        # Votes cast while the poll is moving are written to both shards
+        if app.vote_shard_map.placement(poll_id)[1] is not None:
+            assert vote(client, db, 'during@example.com').status_code == 200
+
+    copied = move_poll_votes(poll_id, target, db.connect(autocommit=True), lambda shard: shards[shard].connect(),
+                             app.vote_shard_map, batch_size=2, settle_seconds=0, sleep=during_move)
+
+    assert copied == 4
+    assert count_votes(shards[source], poll_id) == 0
+    assert count_votes(shards[target], poll_id) == 4
+    placement = db.conn.execute('SELECT shard, moving_to FROM vote_shards WHERE poll_id = ?', (poll_id,)).fetchone()
+    assert placement == (target, None)
+
+    assert vote(client, db, 'after@example.com').status_code == 200
+    assert vote(client, db, 'before0@example.com').status_code == 400
+    assert count_votes(shards[target], poll_id) == 5
+
+
+def test_new_polls_keep_their_shard(client, db, shards, auth_headers):
+    """Test a poll's shard is stored at creation, so adding a shard does not move its votes."""
+    headers = auth_headers(db.fixtures['alice'], 'alice')
+    response = client.post('/api/polls', headers=headers, content_type='application/json',
+                           data=json.dumps({'title': 'Sharded', 'question': 'Q?', 'options': ['A', 'B']}))
+    poll_id = json.loads(response.data)['poll_id']
+
+    assert db.conn.execute('SELECT shard FROM vote_shards WHERE poll_id = ?', (poll_id,)).fetchone() == (poll_id % 2,)
+    app.vote_shard_map.configure(app.vote_shard_map.shards + [dict(app.DB_CONFIG, host='shard2')])
+    assert app.vote_shard_map.placement(poll_id) == (poll_id % 2, None)
+
+
+def test_pin_default_placements(db, shards):
+    """Test polls from before sharding get a vote_shards row for their current shard."""
+    poll_id = db.fixtures['open_poll']
+    pinned = pin_default_placements(db.connect(), 2)
+
+    assert pinned == db.conn.execute('SELECT COUNT(*) FROM polls').fetchone()[0]
+    assert db.conn.execute('SELECT shard FROM vote_shards WHERE poll_id = ?', (poll_id,)).fetchone() == (poll_id % 2,)
+    assert pin_default_placements(db.connect(), 3) == 0
+
+
+def test_uncounted_vote_is_removed_from_shard(client, db, shards, monkeypatch):
+    """Test a vote whose count fails to commit is taken back off its shard, so the voter can retry."""
+    poll_id = db.fixtures['open_poll']
+    get_db_connection = app.get_db_connection
+
+    class CommitFails:
+        def __init__(self, connection):
+            self._connection = connection
+
+        def __getattr__(self, name):
+            return getattr(self._connection, name)
+
+        def commit(self):
+            raise app.mysql.connector.DatabaseError(msg='Lost connection to MySQL server')
+
+    monkeypatch.setattr(app, 'get_db_connection', lambda primary=False: CommitFails(get_db_connection(primary)))
+    assert vote(client, db, 'retry@example.com').status_code == 500
+    assert count_votes(shards[poll_id % 2], poll_id) == 0
+
+    monkeypatch.setattr(app, 'get_db_connection', get_db_connection)
+    assert vote(client, db, 'retry@example.com').status_code == 200
+    assert count_votes(shards[poll_id % 2], poll_id) == 1
+
+
+def test_unavailable_routing_table_returns_503(client, db, shards, monkeypatch):
+    """Test votes get a retryable 503 when the routing table cannot be loaded."""
+    def load():
+        raise app.mysql.connector.DatabaseError(msg='down')
+
+    monkeypatch.setattr(app.vote_shard_map, 'load', load)
+    monkeypatch.setattr(app.vote_shard_map, '_routes', None)
+
+    response = vote(client, db, 'later@example.com')
+
+    assert response.status_code == 503
+    assert 'retry' in json.loads(response.data)['message']
@@ -0,0 +1,341 @@
+import importlib
+import json
+import os
+import queue
+import re
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import g, request
+
+# W3C trace context: version-trace id-parent span id-flags
+TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+# OTLP span kinds and status codes
+INTERNAL = 1
+SERVER = 2
+CLIENT = 3
+PRODUCER = 4
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current = ContextVar('current_span', default=None)
+
+
+def new_trace_id():
+    return os.urandom(16).hex()
+
+
+def new_span_id():
+    return os.urandom(8).hex()
+
+
+def parse_traceparent(value):
+    """(trace id, parent span id, sampled) of a traceparent header, or None when malformed."""
+    match = TRACEPARENT.match((value or '').strip().lower())
+    if not match:
+        return None
+    trace_id, parent_id, flags = match.groups()
+    if trace_id == '0' * 32 or parent_id == '0' * 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+def format_traceparent(trace_id, span_id, sampled=True):
+    return f"00-{trace_id}-{span_id}-{'01' if sampled else '00'}"
+
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+class Span:
+    """One timed operation of a trace.
+
+    Spans started in one process for the same request (or job) share a
+    ``finished`` list; the exporter gets it when that local root ends.
+    """
+
+    __slots__ = ('name', 'kind', 'trace_id', 'span_id', 'parent_id', 'attributes', 'status', 'message',
+                 'start_ns', 'end_ns', 'finished')
+
+    def __init__(self, name, kind, trace_id, parent_id=None, attributes=None, finished=None):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.status = 0
+        self.message = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.finished = [] if finished is None else finished
+
+    @property
+    def traceparent(self):
+        return format_traceparent(self.trace_id, self.span_id)
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def fail(self, error):
+        self.status = STATUS_ERROR
+        self.message = str(error)
+
+    def to_otlp(self):
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [{'key': key, 'value': otlp_value(value)} for key, value in self.attributes.items()],
+            'status': {'code': self.status}
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        if self.message:
+            span['status']['message'] = self.message
+        return span
+
+
+def otlp_request(spans, service_name):
+    """An OTLP/JSON ExportTraceServiceRequest body for a list of finished spans."""
+    return {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': service_name}}]},
+        'scopeSpans': [{'scope': {'name': 'poll_backend'}, 'spans': [span.to_otlp() for span in spans]}]
+    }]}
+
+
+class MemoryExporter:
+    """Keeps exported spans in a list (for tests)."""
+
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans, service_name):
+        self.spans.extend(spans)
+
+    def clear(self):
+        self.spans.clear()
+
+
+class FileExporter:
+    """Appends each exported trace to a file as one OTLP/JSON line."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans, service_name):
+        line = json.dumps(otlp_request(spans, service_name), separators=(',', ':')) + '\n'
+        with self._lock:
+            with open(self.path, 'a') as out:
+                out.write(line)
+
+
+class OTLPHttpExporter:
+    """Posts spans as OTLP/JSON to a collector (``http://host:4318/v1/traces``).
+
+    Spans are queued and sent in batches by a daemon thread, so requests
+    never wait on the collector; when the queue is full new spans are dropped.
+    """
+
+    def __init__(self, endpoint, max_queue=10000, batch_size=512, interval=2.0, timeout=5.0):
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.interval = interval
+        self.timeout = timeout
+        self.dropped = 0
+        self._queue = queue.Queue(max_queue)
+        self._service_name = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def export(self, spans, service_name):
+        self._service_name = service_name
+        for span in spans:
+            try:
+                self._queue.put_nowait(span)
+            except queue.Full:
+                self.dropped += 1
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='otlp-exporter', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            body = json.dumps(otlp_request(batch, self._service_name)).encode()
+            post = urllib.request.Request(self.endpoint, data=body, headers={'Content-Type': 'application/json'})
+            try:
+                urllib.request.urlopen(post, timeout=self.timeout).close()
+            except OSError as e:
+                print(f"Trace export to {self.endpoint} failed, dropped {len(batch)} spans: {e}")
+
+
+def load_exporter(spec):
+    """The exporter named by TRACE_EXPORTER: 'file:<path>', 'otlp:<url>' or '<module>:<factory>'."""
+    if not spec:
+        return None
+    kind, _, target = spec.partition(':')
+    if kind == 'file':
+        return FileExporter(target)
+    if kind == 'otlp':
+        return OTLPHttpExporter(target)
+    return getattr(importlib.import_module(kind), target)()
+
+
+class Tracer:
+    """Request tracing: a root span per Flask request and child spans inside it.
+
+    Nothing is recorded without an ``exporter``. Code adds child spans
+    with ``span()``, which does nothing outside a traced request, so the
+    instrumented paths cost one context lookup when tracing is off. With
+    ``propagate`` an incoming W3C traceparent header becomes the root's
+    parent (a request its caller did not sample is not traced) and the
+    response carries the root in a traceresponse header. ``resume()``
+    continues a trace elsewhere, such as in a background job.
+    """
+
+    def __init__(self, exporter=None, propagate=False, service_name='poll-backend'):
+        self.exporter = exporter
+        self.propagate = propagate
+        self.service_name = service_name
+
+    def configure(self, exporter=None, propagate=False, service_name='poll-backend'):
+        self.exporter = exporter
+        self.propagate = propagate
+        self.service_name = service_name
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    @property
+    def active(self):
+        """Whether a span is open in the current context."""
+        return _current.get() is not None
+
+    def traceparent(self):
+        """The traceparent of the open span, or None."""
+        span = _current.get()
+        return span.traceparent if span is not None else None
+
+    def start(self, name, kind=INTERNAL, parent=None, attributes=None):
+        """Open a span under ``parent`` (the open span by default) and make it current.
+
+        Returns the span and the token ``finish`` needs to restore the previous one.
+        """
+        parent = parent if parent is not None else _current.get()
+        if parent is None:
+            span = Span(name, kind, new_trace_id(), attributes=attributes)
+        else:
+            span = Span(name, kind, parent.trace_id, parent.span_id, attributes, parent.finished)
+        return span, _current.set(span)
+
+    def finish(self, span, token, error=None):
+        if error is not None:
+            span.fail(error)
+        span.end_ns = time.time_ns()
+        span.finished.append(span)
+        _current.reset(token)
+
+    def export(self, spans):
+        try:
+            self.exporter.export(spans, self.service_name)
+        except Exception as e:
+            print(f"Trace export failed: {e}")
+
+    @contextmanager
+    def span(self, name, kind=INTERNAL, **attributes):
+        """Time a block as a child of the open span; yields None when not tracing."""
+        if _current.get() is None:
+            yield None
+            return
+        span, token = self.start(name, kind, attributes=attributes)
+        try:
+            yield span
+        except BaseException as e:
+            self.finish(span, token, e)
+            raise
+        self.finish(span, token)
+
+    @contextmanager
+    def resume(self, traceparent, name, kind=INTERNAL, **attributes):
+        """Time a block as a new local root continuing ``traceparent``, exported when it ends."""
+        parent = parse_traceparent(traceparent) if self.exporter is not None else None
+        if parent is None:
+            yield None
+            return
+        trace_id, parent_id, _ = parent
+        span = Span(name, kind, trace_id, parent_id, attributes)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            self.finish(span, token, e)
+            raise
+        else:
+            self.finish(span, token)
+        finally:
+            self.export(span.finished)
+
+    def _before_request(self):
+        if self.exporter is None:
+            return
+        trace_id, parent_id = new_trace_id(), None
+        if self.propagate:
+            parent = parse_traceparent(request.headers.get('traceparent'))
+            if parent is not None:
+                trace_id, parent_id, sampled = parent
+                if not sampled:
+                    return
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        span = Span(f"{request.method} {route}", SERVER, trace_id, parent_id, {
+            'http.request.method': request.method,
+            'http.route': route,
+            'flask.endpoint': request.endpoint or ''
+        })
+        g._trace_span = span
+        g._trace_token = _current.set(span)
+
+    def _after_request(self, response):
+        span = g.get('_trace_span')
+        if span is not None:
+            span.set('http.response.status_code', response.status_code)
+            if response.status_code >= 500:
+                span.status = STATUS_ERROR
+            if self.propagate:
+                response.headers['traceresponse'] = span.traceparent
+        return response
+
+    def _teardown_request(self, exc):
+        span = g.pop('_trace_span', None)
+        if span is None:
+            return
+        self.finish(span, g.pop('_trace_token'), exc)
+        self.export(span.finished)
@@ -0,0 +1,179 @@
+import fcntl
+import heapq
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+from jobs import stopped_process_files
+
+
+class TrendingPolls:
+    """Votes per poll over sliding windows, for a "trending now" leaderboard.
+
+    Votes land in ``bucket_seconds`` time buckets. Each window (in seconds)
+    keeps a running total per poll: a vote adds to every window, and a
+    bucket is subtracted from a window's totals once it falls out of it, so
+    recording a vote is O(windows) and memory holds only the buckets of the
+    longest window. The top ``max_k`` polls of each window are picked with
+    a heap at most every ``refresh`` seconds; ``top`` serves them from that
+    list, O(K) per request.
+    """
+
+    def __init__(self, windows=(300, 3600), bucket_seconds=60, max_k=100, refresh=1.0, clock=time.time):
+        self.bucket_seconds = bucket_seconds
+        self.max_k = max_k
+        self.refresh = refresh
+        self._clock = clock
+        self._lock = threading.Lock()
+        # window seconds -> number of buckets it spans
+        self._spans = {window: max(1, int(window // bucket_seconds)) for window in windows}
+        self._longest = max(self._spans.values())
+        # bucket number -> Counter of votes per poll id
+        self._buckets = {}
+        self._bucket = None
+        self._totals = {window: Counter() for window in windows}
+        # window -> (computed at, [(poll_id, votes)])
+        self._leaders = {}
+        self._saved_at = clock()
+
+    @property
+    def windows(self):
+        return sorted(self._spans)
+
+    def _advance(self, bucket):
+        """Move to ``bucket``, subtracting the buckets that left each window."""
+        if self._bucket is not None and bucket <= self._bucket:
+            return
+        previous = bucket - self._longest if self._bucket is None else self._bucket
+        for window, span in self._spans.items():
+            totals = self._totals[window]
+            for number, counts in self._buckets.items():
+                if previous - span < number <= bucket - span:
+                    for poll_id, votes in counts.items():
+                        left = totals[poll_id] - votes
+                        if left > 0:
+                            totals[poll_id] = left
+                        else:
+                            del totals[poll_id]
+        for number in [number for number in self._buckets if number <= bucket - self._longest]:
+            del self._buckets[number]
+        self._bucket = bucket
+
+    def record(self, poll_id, votes=1):
+        """Count ``votes`` new votes on a poll now."""
+        bucket = int(self._clock() // self.bucket_seconds)
+        with self._lock:
+            self._advance(bucket)
+            # A clock step back counts into the current bucket, which every window still holds
+            counts = self._buckets.get(self._bucket)
+            if counts is None:
+                counts = self._buckets[self._bucket] = Counter()
+            counts[poll_id] += votes
+            for totals in self._totals.values():
+                totals[poll_id] += votes
+
+    def top(self, window, k=10):
+        """The ``k`` polls with most votes in ``window`` seconds, as (poll_id, votes), most first."""
+        now = self._clock()
+        with self._lock:
+            computed = self._leaders.get(window)
+            if computed is None or now - computed[0] >= self.refresh:
+                self._advance(int(now // self.bucket_seconds))
+                # Ties go to the older poll
+                leaders = heapq.nlargest(self.max_k, self._totals[window].items(),
+                                         key=lambda item: (item[1], -item[0]))
+                computed = self._leaders[window] = (now, leaders)
+        return computed[1][:k]
+
+    def discard(self, poll_id):
+        """Forget a poll's votes (when it is deleted)."""
+        with self._lock:
+            for counts in list(self._buckets.values()) + list(self._totals.values()):
+                counts.pop(poll_id, None)
+            self._leaders.clear()
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self._leaders.clear()
+            for totals in self._totals.values():
+                totals.clear()
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'bucket_seconds': self.bucket_seconds,
+                'buckets': {str(number): {str(poll_id): votes for poll_id, votes in counts.items()}
+                            for number, counts in self._buckets.items()}
+            }
+
+    def load(self, state):
+        """Replace the counts with a ``to_dict`` state, rebuilding the window totals."""
+        if state.get('bucket_seconds') != self.bucket_seconds:
+            return
+        now_bucket = int(self._clock() // self.bucket_seconds)
+        with self._lock:
+            self._buckets = {int(number): Counter({int(poll_id): votes for poll_id, votes in counts.items()})
+                             for number, counts in state.get('buckets', {}).items()
+                             if now_bucket - self._longest < int(number) <= now_bucket}
+            self._bucket = now_bucket
+            self._leaders.clear()
+            for window, span in self._spans.items():
+                totals = self._totals[window] = Counter()
+                for number, counts in self._buckets.items():
+                    if number > now_bucket - span:
+                        totals.update(counts)
+
+    def save(self, path):
+        """Write the counts to this process's ``<path>.<pid>`` file (replaced atomically)."""
+        own_path = f"{path}.{os.getpid()}"
+        temp_path = own_path + '.tmp'
+        with open(temp_path, 'w') as out:
+            json.dump(self.to_dict(), out)
+        os.replace(temp_path, own_path)
+
+    def restore(self, path):
+        """Load the counts saved by this process and by workers that have stopped.
+
+        Every worker saves its own file, so workers sharing ``path`` never
+        overwrite each other. The files of stopped workers are taken over
+        under an exclusive lock and removed once their counts are saved to
+        this worker's file, so each worker's votes are restored only once.
+        """
+        buckets = defaultdict(Counter)
+        with open(path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                adopted = []
+                for saved_path in stopped_process_files(path):
+                    try:
+                        with open(saved_path) as saved:
+                            state = json.load(saved)
+                    except (OSError, ValueError) as e:
+                        print(f"Could not restore trending counts from {saved_path}: {e}")
+                        continue
+                    adopted.append(saved_path)
+                    if state.get('bucket_seconds') == self.bucket_seconds:
+                        for number, counts in state.get('buckets', {}).items():
+                            buckets[number].update(counts)
+                if not adopted:
+                    return
+                self.load({'bucket_seconds': self.bucket_seconds, 'buckets': buckets})
+                self.save(path)
+                own_path = f"{path}.{os.getpid()}"
+                for saved_path in adopted:
+                    if saved_path != own_path:
+                        os.remove(saved_path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def save_due(self, interval):
+        """Whether ``interval`` seconds have passed since the last save (claiming the save if so)."""
+        with self._lock:
+            now = self._clock()
+            if now - self._saved_at < interval:
+                return False
+            self._saved_at = now
+            return True
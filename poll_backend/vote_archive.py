@@ -0,0 +1,153 @@
+import datetime
+import os
+
+import numpy as np
+
+# Columns stored per archived vote, in export order
+COLUMNS = ('id', 'option_id', 'voter_name', 'voter_email', 'ip_address', 'voted_at')
+
+
+def archive_path(directory, poll_id):
+    return os.path.join(directory, f'poll_{poll_id}.npz')
+
+
+def write_archive(path, rows):
+    """Write vote rows (in COLUMNS order) to a compressed columnar .npz file.
+
+    Each column is stored as its own compact array (integers, fixed-width
+    strings, datetime64 seconds) and deflate-compressed. The file is written
+    to a temporary name first so a crash never leaves a half-written archive.
+    """
+    columns = list(zip(*rows)) if rows else [()] * len(COLUMNS)
+    arrays = {
+        'id': np.array(columns[0], dtype=np.int64),
+        'option_id': np.array(columns[1], dtype=np.int32),
+        'voter_name': np.array([value or '' for value in columns[2]], dtype=str),
+        'voter_email': np.array([value or '' for value in columns[3]], dtype=str),
+        'ip_address': np.array([value or '' for value in columns[4]], dtype=str),
+        'voted_at': np.array(columns[5], dtype='datetime64[s]')
+    }
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as archive_file:
+        np.savez_compressed(archive_file, **arrays)
+    os.replace(temp_path, path)
+
+
+def read_archive(path):
+    """Rehydrate an archive into a dict of column arrays."""
+    with np.load(path) as archive:
+        return {name: archive[name] for name in COLUMNS}
+
+
+def iter_archive_rows(path):
+    """Yield archived votes as tuples in COLUMNS order, like rows from the votes table."""
+    columns = read_archive(path)
+    voted_at = columns['voted_at'].astype(object)
+    for index in range(len(columns['id'])):
+        yield (int(columns['id'][index]), int(columns['option_id'][index]), str(columns['voter_name'][index]),
+               str(columns['voter_email'][index]), str(columns['ip_address'][index]) or None, voted_at[index])
+
+
+def archive_poll_votes(poll_id, votes_cursor, directory, batch_size=5000):
+    """Copy one poll's raw votes into an archive file and return the archived vote ids.
+
+    ``votes_cursor`` is a cursor on the database (or vote shard) holding the
+    poll's votes. The votes are not deleted here; see delete_votes.
+    """
+    rows = []
+    last_id = 0
+    while True:
+        votes_cursor.execute("""
+            SELECT id, option_id, voter_name, voter_email, ip_address, voted_at
+            FROM votes
+            WHERE poll_id = %s AND id > %s
+            ORDER BY id
+            LIMIT %s
+        """, (poll_id, last_id, batch_size))
+        batch = votes_cursor.fetchall()
+        if not batch:
+            break
+        rows.extend(batch)
+        last_id = batch[-1][0]
+
+    path = archive_path(directory, poll_id)
+    write_archive(path, rows)
+    if len(read_archive(path)['id']) != len(rows):
+        raise IOError(f"Archive {path} is incomplete")
+    return [row[0] for row in rows]
+
+
+def delete_votes(votes_cursor, ids, batch_size=5000):
+    """Delete votes by id in batches, so no single statement holds locks for long."""
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start:start + batch_size]
+        placeholders = ', '.join(['%s'] * len(chunk))
+        votes_cursor.execute(f"DELETE FROM votes WHERE id IN ({placeholders})", chunk)
+
+
+def archive_closed_polls(main_connection, votes_connection_for, directory, retention_days=90,
+                         limit=100, batch_size=5000, now=None):
+    """Archive the raw votes of polls that closed more than ``retention_days`` ago.
+
+    For each poll the archive file is written and recorded in vote_archives
+    before any vote is deleted, so an interrupted run never loses votes.
+    The per-option tallies stay online in the options table.
+    ``votes_connection_for(poll_id)`` opens a connection to the database
+    holding the poll's votes, or returns None to skip the poll this run.
+    Returns {poll_id: archived vote count}.
+    """
+    # End dates are compared in UTC, like the poll lifecycle does
+    cutoff = (now or datetime.datetime.utcnow()) - datetime.timedelta(days=retention_days)
+    cursor = main_connection.cursor()
+    archived = {}
+    try:
+        cursor.execute("""
+            SELECT p.id
+            FROM polls p
+            LEFT JOIN vote_archives a ON a.poll_id = p.id
+            WHERE p.end_date < %s AND a.poll_id IS NULL
+            ORDER BY p.id
+            LIMIT %s
+        """, (cutoff, limit))
+        poll_ids = [row[0] for row in cursor.fetchall()]
+
+        for poll_id in poll_ids:
+            votes_connection = votes_connection_for(poll_id)
+            if votes_connection is None:
+                continue
+            votes_cursor = votes_connection.cursor()
+            try:
+                ids = archive_poll_votes(poll_id, votes_cursor, directory, batch_size)
+                cursor.execute("""
+                    INSERT INTO vote_archives (poll_id, path, vote_count)
+                    VALUES (%s, %s, %s)
+                """, (poll_id, os.path.basename(archive_path(directory, poll_id)), len(ids)))
+                main_connection.commit()
+                delete_votes(votes_cursor, ids, batch_size)
+                votes_connection.commit()
+            finally:
+                votes_cursor.close()
+                votes_connection.close()
+            archived[poll_id] = len(ids)
+    finally:
+        cursor.close()
+    return archived
+
+
+def _new_partitions(highest_bound, max_poll_id, partition_size, headroom):
+    # Add ranges until the highest bound is more than ``headroom`` poll ids past the newest poll
+    partitions = []
+    while highest_bound <= max_poll_id + headroom:
+        highest_bound += partition_size
+        partitions.append(f"PARTITION p{highest_bound // partition_size - 1} VALUES LESS THAN ({highest_bound})")
+    return partitions
+
+
+def reorganize_partition_ddl(highest_bound, max_poll_id, partition_size=100000, headroom=10000):
+    """Return the ALTER TABLE that splits new poll_id ranges off p_max, or None if none are needed."""
+    partitions = _new_partitions(highest_bound, max_poll_id, partition_size, headroom)
+    if not partitions:
+        return None
+    partitions.append("PARTITION p_max VALUES LESS THAN MAXVALUE")
+    return "ALTER TABLE votes REORGANIZE PARTITION p_max INTO (\n  " + ",\n  ".join(partitions) + "\n)"
@@ -0,0 +1,150 @@
+import datetime
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+# Columns written per exported vote; voted_at is stored as seconds since the epoch
+COLUMNS = {
+    'id': np.int64,
+    'option_id': np.int32,
+    'voter_key': np.int64,
+    'voted_at': np.int64
+}
+
+WATERMARKS_FILE = 'watermarks.json'
+
+
+def voter_key(email):
+    """Stable 64-bit key for a voter email, so duplicates can be dropped without exporting the address."""
+    digest = hashlib.blake2b(email.strip().lower().encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little', signed=True)
+
+
+def read_watermarks(directory):
+    try:
+        with open(os.path.join(directory, WATERMARKS_FILE)) as watermarks_file:
+            return json.load(watermarks_file)
+    except FileNotFoundError:
+        return {}
+
+
+def write_watermarks(directory, watermarks):
+    path = os.path.join(directory, WATERMARKS_FILE)
+    with open(path + '.tmp', 'w') as watermarks_file:
+        json.dump(watermarks, watermarks_file)
+    os.replace(path + '.tmp', path)
+
+
+def partition_dir(directory, poll_id, day):
+    return os.path.join(directory, f'poll_id={poll_id}', f'date={day}')
+
+
+def write_part(path, columns):
+    """Write one part (a directory of .npy column files), replacing any earlier copy of it."""
+    temp_path = path + '.tmp'
+    shutil.rmtree(temp_path, ignore_errors=True)
+    os.makedirs(temp_path)
+    for name, values in columns.items():
+        np.save(os.path.join(temp_path, f'{name}.npy'), values)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(temp_path, path)
+
+
+def write_batch(directory, source, rows):
+    """Split (id, poll_id, option_id, voter_email, voted_at) rows into poll/date partitions."""
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    poll_ids = np.array([row[1] for row in rows], dtype=np.int64)
+    columns = {
+        'id': ids,
+        'option_id': np.array([row[2] for row in rows], dtype=np.int32),
+        'voter_key': np.array([voter_key(row[3]) for row in rows], dtype=np.int64),
+        'voted_at': np.array([row[4] for row in rows], dtype='datetime64[s]').astype(np.int64)
+    }
+    days = columns['voted_at'] // 86400
+
+    # The part name comes from the batch's first id, so re-running a batch overwrites it
+    part_name = f'part-{source}-{ids[0]}'
+    keys = np.stack([poll_ids, days], axis=1)
+    for poll_id, day in np.unique(keys, axis=0):
+        mask = (poll_ids == poll_id) & (days == day)
+        date = datetime.date(1970, 1, 1) + datetime.timedelta(days=int(day))
+        path = os.path.join(partition_dir(directory, int(poll_id), date.isoformat()), part_name)
+        write_part(path, {name: values[mask] for name, values in columns.items()})
+
+
+def extract_votes(cursor, directory, source='main', batch_size=10000, max_batches=None):
+    """Export votes added since the last run into columnar files under ``directory``.
+
+    Rows are read in id order from the watermark kept per ``source`` (the
+    main database or one vote shard, since each has its own id sequence) and
+    written to ``poll_id=<id>/date=<YYYY-MM-DD>/part-<source>-<first id>``.
+    The watermark is saved after each batch, so an interrupted run resumes
+    where it stopped. Returns the number of votes exported.
+    """
+    os.makedirs(directory, exist_ok=True)
+    watermarks = read_watermarks(directory)
+    last_id = watermarks.get(source, 0)
+    exported = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        cursor.execute("""
+            SELECT id, poll_id, option_id, voter_email, voted_at
+            FROM votes
+            WHERE id > %s
+            ORDER BY id
+            LIMIT %s
+        """, (last_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        write_batch(directory, source, rows)
+        last_id = rows[-1][0]
+        watermarks[source] = last_id
+        write_watermarks(directory, watermarks)
+        exported += len(rows)
+        batches += 1
+    return exported
+
+
+def load_poll_columns(directory, poll_id, start=None, end=None):
+    """Memory-map the exported columns of one poll, optionally limited to dates in [start, end]."""
+    poll_dir = os.path.join(directory, f'poll_id={poll_id}')
+    parts = {name: [] for name in COLUMNS}
+    if os.path.isdir(poll_dir):
+        for date_dir in sorted(os.listdir(poll_dir)):
+            day = datetime.date.fromisoformat(date_dir.partition('=')[2])
+            if (start and day < start) or (end and day > end):
+                continue
+            for part in sorted(os.listdir(os.path.join(poll_dir, date_dir))):
+                if part.endswith('.tmp'):
+                    continue
+                for name in COLUMNS:
+                    parts[name].append(np.load(os.path.join(poll_dir, date_dir, part, f'{name}.npy'), mmap_mode='r'))
+    return {name: np.concatenate(arrays) if arrays else np.array([], dtype=COLUMNS[name])
+            for name, arrays in parts.items()}
+
+
+def tally_by_bucket(directory, poll_id, bucket_seconds=3600, start=None, end=None):
+    """Count one poll's votes per option and time bucket.
+
+    Returns {'buckets': datetime64 bucket starts, 'option_ids': option ids,
+    'counts': array of shape (buckets, options)}. A voter counted twice (a
+    vote copied between shards during a move) is counted once.
+    """
+    columns = load_poll_columns(directory, poll_id, start, end)
+    _, first = np.unique(columns['voter_key'], return_index=True)
+    option_ids = np.asarray(columns['option_id'])[first]
+    buckets = np.asarray(columns['voted_at'])[first] // bucket_seconds * bucket_seconds
+
+    bucket_values, bucket_index = np.unique(buckets, return_inverse=True)
+    option_values, option_index = np.unique(option_ids, return_inverse=True)
+    counts = np.bincount(bucket_index * len(option_values) + option_index,
+                         minlength=len(bucket_values) * len(option_values))
+    return {
+        'buckets': bucket_values.astype('datetime64[s]'),
+        'option_ids': option_values,
+        'counts': counts.reshape(len(bucket_values), len(option_values))
+    }
@@ -0,0 +1,12 @@
+-- Schema of each vote shard database listed in VOTE_SHARDS.
+-- Polls and options stay in the main database, so there are no foreign keys here.
+CREATE TABLE votes (
+  id INT AUTO_INCREMENT PRIMARY KEY,
+  poll_id INT NOT NULL,
+  option_id INT NOT NULL,
+  voter_name VARCHAR(100) NOT NULL,
+  voter_email VARCHAR(100) NOT NULL,
+  ip_address VARCHAR(45),
+  voted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  UNIQUE KEY unique_vote (poll_id, voter_email)
+);
@@ -0,0 +1,245 @@
+import threading
+import time
+
+
+def parse_shard_dsns(value, base_config):
+    """Build shard configs from "host[:port][/database],..." on top of the main config."""
+    shards = []
+    for entry in (value or '').split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        config = dict(base_config)
+        address, _, database = entry.partition('/')
+        host, _, port = address.partition(':')
+        config['host'] = host
+        if port:
+            config['port'] = int(port)
+        if database:
+            config['database'] = database
+        shards.append(config)
+    return shards
+
+
+class ShardRoutingUnavailable(Exception):
+    """The vote_shards routing table could not be loaded and no earlier copy is cached."""
+
+
+class VoteShardMap:
+    """Maps poll ids to the vote shard that stores their votes.
+
+    Every poll gets a vote_shards row when it is created (``default_shard``,
+    ``poll_id % number of shards``), so its placement does not change when
+    VOTE_SHARDS grows; polls created before sharding fall back to the
+    default until ``pin_default_placements`` writes their rows. The table
+    is loaded whole by ``load()`` and cached for ``ttl`` seconds; if a
+    reload fails the previous copy is kept. While a poll is being moved
+    (``moving_to`` is set) votes are written to both shards and read from
+    the source shard.
+    """
+
+    def __init__(self, load=None, shards=(), ttl=5.0, clock=time.monotonic):
+        self.load = load
+        self.shards = list(shards)
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._routes = None
+        self._loaded_at = None
+
+    @property
+    def enabled(self):
+        return bool(self.shards)
+
+    def configure(self, shards):
+        with self._lock:
+            self.shards = list(shards)
+            self.invalidate()
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def _current_routes(self):
+        now = self._clock()
+        if self._loaded_at is None or now - self._loaded_at >= self.ttl:
+            try:
+                routes = self.load() if self.load else {}
+            except Exception as e:
+                if self._routes is None:
+                    raise ShardRoutingUnavailable(f"Could not load the vote_shards table: {e}") from e
+                # Routes only change when a poll is created or moved; keep serving the last copy
+                print(f"Error loading vote shard routes, using the previous copy: {e}")
+                routes = self._routes
+            with self._lock:
+                self._routes = routes
+                self._loaded_at = now
+        return self._routes
+
+    def default_shard(self, poll_id):
+        return poll_id % len(self.shards)
+
+    def pin(self, poll_id, shard):
+        """Record a new poll's route locally (after writing its vote_shards row)."""
+        with self._lock:
+            if self._routes is not None:
+                self._routes = {**self._routes, poll_id: (shard, None)}
+
+    def placement(self, poll_id):
+        """Return (shard, moving_to) for a poll; moving_to is None unless a move is in progress."""
+        route = self._current_routes().get(poll_id)
+        if route is not None:
+            return route
+        return self.default_shard(poll_id), None
+
+    def write_shards(self, poll_id):
+        shard, moving_to = self.placement(poll_id)
+        return [shard] if moving_to is None else [shard, moving_to]
+
+
+def pin_default_placements(connection, shard_count):
+    """Give every poll without a vote_shards row one for its current default shard; returns rows added.
+
+    Run before changing the number of shards, so existing polls stay where their votes are.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            SELECT p.id FROM polls p
+            LEFT JOIN vote_shards s ON s.poll_id = p.id
+            WHERE s.poll_id IS NULL
+        """)
+        rows = [(poll_id, poll_id % shard_count) for (poll_id,) in cursor.fetchall()]
+        if rows:
+            cursor.executemany("INSERT IGNORE INTO vote_shards (poll_id, shard) VALUES (%s, %s)", rows)
+        connection.commit()
+        return len(rows)
+    finally:
+        cursor.close()
+
+
+class PollVotes:
+    """Cursors on the database(s) holding one poll's votes.
+
+    ``read`` is the cursor for duplicate checks; ``writes`` holds one cursor
+    per shard a new vote must be written to. Connections opened for the
+    shards are closed by ``close()``; a borrowed main cursor is left open.
+    ``read_connection`` is the connection behind ``read``.
+    """
+
+    def __init__(self, connections=(), cursor=None, connection=None):
+        self._connections = list(connections)
+        if cursor is not None:
+            self.read = cursor
+            self.read_connection = connection
+            self.writes = [cursor]
+            self._cursors = []
+        else:
+            self._cursors = [connection.cursor() for connection in self._connections]
+            self.read = self._cursors[0]
+            self.read_connection = self._connections[0]
+            self.writes = list(self._cursors)
+
+    def commit(self):
+        for connection in self._connections:
+            connection.commit()
+
+    def delete_vote(self, poll_id, voter_email):
+        """Remove a vote committed on the shards again, when the main database failed to count it.
+
+        Nothing to do when the votes live in the main database: rolling it back drops the vote too.
+        """
+        self.delete_votes(poll_id, [voter_email])
+
+    def delete_votes(self, poll_id, voter_emails):
+        """Remove several votes committed on the shards again (see ``delete_vote``)."""
+        placeholders = ', '.join(['%s'] * len(voter_emails))
+        for cursor, connection in zip(self._cursors, self._connections):
+            cursor.execute(f"DELETE FROM votes WHERE poll_id = %s AND voter_email IN ({placeholders})",
+                           (poll_id, *voter_emails))
+            connection.commit()
+
+    def close(self):
+        for cursor in self._cursors:
+            cursor.close()
+        for connection in self._connections:
+            connection.close()
+
+
+def move_poll_votes(poll_id, target, main_connection, connect_shard, shard_map,
+                    batch_size=1000, settle_seconds=None, sleep=time.sleep):
+    """Move one poll's votes to another shard while the app keeps taking votes.
+
+    1. Mark the poll as moving, so every worker writes new votes to both shards.
+    2. Copy existing votes to the target in batches (duplicates are ignored).
+    3. Point the poll at the target shard.
+    4. Delete the votes from the source shard in batches.
+
+    Between steps the tool waits ``settle_seconds`` (the map cache TTL by
+    default) so every worker has picked up the new routing. Returns the
+    number of votes copied.
+    """
+    settle_seconds = shard_map.ttl if settle_seconds is None else settle_seconds
+    shard_map.invalidate()
+    source, moving_to = shard_map.placement(poll_id)
+    if source == target:
+        return 0
+    if moving_to is not None and moving_to != target:
+        raise ValueError(f"Poll {poll_id} is already being moved to shard {moving_to}")
+
+    def set_route(shard, moving_to):
+        cursor = main_connection.cursor()
+        try:
+            cursor.execute("REPLACE INTO vote_shards (poll_id, shard, moving_to) VALUES (%s, %s, %s)",
+                           (poll_id, shard, moving_to))
+            main_connection.commit()
+        finally:
+            cursor.close()
+
+    set_route(source, target)
+    sleep(settle_seconds)
+
+    source_connection = connect_shard(source)
+    target_connection = connect_shard(target)
+    source_cursor = source_connection.cursor()
+    target_cursor = target_connection.cursor()
+    copied = 0
+    try:
+        last_id = 0
+        while True:
+            source_cursor.execute("""
+                SELECT id, option_id, voter_name, voter_email, ip_address, voted_at
+                FROM votes
+                WHERE poll_id = %s AND id > %s
+                ORDER BY id
+                LIMIT %s
+            """, (poll_id, last_id, batch_size))
+            rows = source_cursor.fetchall()
+            if not rows:
+                break
+            target_cursor.executemany("""
+                INSERT IGNORE INTO votes (poll_id, option_id, voter_name, voter_email, ip_address, voted_at)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, [(poll_id,) + tuple(row[1:]) for row in rows])
+            target_connection.commit()
+            copied += len(rows)
+            last_id = rows[-1][0]
+
+        set_route(target, None)
+        sleep(settle_seconds)
+
+        while True:
+            source_cursor.execute("SELECT id FROM votes WHERE poll_id = %s LIMIT %s", (poll_id, batch_size))
+            ids = [row[0] for row in source_cursor.fetchall()]
+            if not ids:
+                break
+            placeholders = ', '.join(['%s'] * len(ids))
+            source_cursor.execute(f"DELETE FROM votes WHERE id IN ({placeholders})", ids)
+            source_connection.commit()
+    finally:
+        source_cursor.close()
+        target_cursor.close()
+        source_connection.close()
+        target_connection.close()
+        shard_map.invalidate()
+
+    return copied